@@ -0,0 +1,44 @@
+from fastapi import APIRouter, Depends
+from mysql.connector import MySQLConnection
+from ...db import get_db
+from ...services.price_history import PriceAlertJob
+from ...services.profile_metrics import ProfileMetrics
+from ...services.merchant_normalizer import MerchantNormalizer
+import logging
+
+router = APIRouter()
+logger = logging.getLogger(__name__)
+
+
+@router.post("/price-alerts")
+def price_alerts(db: MySQLConnection = Depends(get_db)):
+    """
+    Indexa los items de boleta pendientes en historial_precios y genera sugerencias
+    Alerta_Precio para los productos con precios nuevos.
+    """
+    return {"status": "success", **PriceAlertJob(db).run()}
+
+
+@router.post("/profile")
+def refresh_profile(db: MySQLConnection = Depends(get_db)):
+    """Recalcula las métricas de perfil desde los agregados mensuales y guarda el snapshot."""
+    return {"status": "success", "metrics": ProfileMetrics(db).snapshot()}
+
+
+@router.post("/profile/recompute")
+def recompute_profile(db: MySQLConnection = Depends(get_db)):
+    """
+    Compara los agregados incrementales con un cálculo completo sobre las transacciones
+    y luego los reconstruye desde cero.
+    """
+    service = ProfileMetrics(db)
+    validacion = service.validate()
+    if not validacion["consistente"]:
+        logger.warning(f"Agregados de perfil inconsistentes: {validacion['diferencias']}")
+    return {"status": "success", "validacion": validacion, "metrics": service.recompute()}
+
+
+@router.post("/merchants/backfill")
+def backfill_merchants(db: MySQLConnection = Depends(get_db)):
+    """Completa comercio_clave en las transacciones consolidadas antes de la normalización de comercios."""
+    return {"status": "success", "actualizadas": MerchantNormalizer(db).backfill()}
@@ -0,0 +1,32 @@
+from fastapi import APIRouter, Depends, HTTPException
+from pydantic import BaseModel
+from typing import List, Optional
+from mysql.connector import MySQLConnection
+from ...db import get_db
+from ...services.export import ExportService, ExportInProgressError
+import logging
+
+router = APIRouter()
+logger = logging.getLogger(__name__)
+
+
+class ExportRequest(BaseModel):
+    tablas: Optional[List[str]] = None  # transacciones, metadatos, items (todas por defecto)
+    formato: str = "parquet"  # parquet o arrow
+    completo: bool = False  # Ignora la marca de agua y reemplaza la exportación anterior
+
+
+@router.post("/export")
+def export(request: ExportRequest, db: MySQLConnection = Depends(get_db)):
+    """
+    Exporta las tablas consolidadas a archivos columnares particionados por anio/mes
+    (storage/exports). Cada corrida agrega solo las filas nuevas desde la anterior y
+    reescribe completas las particiones invalidadas por reprocesos.
+    """
+    try:
+        resultado = ExportService(db).export(tablas=request.tablas, formato=request.formato, completo=request.completo)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except ExportInProgressError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return {"status": "success", **resultado}
@@ -0,0 +1,58 @@
+from fastapi import APIRouter, Header, HTTPException
+from fastapi.responses import StreamingResponse
+from ...core.progress import EVENTOS_FINALES, is_valid_id, read_events
+import os
+import json
+import time
+import asyncio
+import logging
+from typing import Optional
+
+router = APIRouter()
+logger = logging.getLogger(__name__)
+
+POLL_INTERVAL = 0.5
+KEEPALIVE_S = 15
+# Tiempo máximo de una suscripción (el cliente reconecta con Last-Event-ID o ?offset=<último id>)
+SSE_TIMEOUT_S = float(os.getenv("PROGRESS_SSE_TIMEOUT", "3600"))
+
+
+@router.get("/progress/{seguimiento_id}")
+async def progress_stream(seguimiento_id: str, offset: int = 0, last_event_id: Optional[str] = Header(None)):
+    """
+    Server-Sent Events con el avance por etapa de un archivo en proceso.
+    El cliente envía `seguimiento_id` en /upload y se suscribe aquí en paralelo;
+    el stream termina con el evento final (completado, duplicado o error).
+    Al reconectar, EventSource envía el último id en el header Last-Event-ID, que
+    tiene prioridad sobre ?offset=.
+    """
+    if not is_valid_id(seguimiento_id):
+        raise HTTPException(status_code=400, detail="seguimiento_id inválido (A-Z, a-z, 0-9, '_' o '-', máx. 64).")
+    if last_event_id:
+        try:
+            offset = int(last_event_id)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Last-Event-ID inválido: debe ser el id de un evento anterior.")
+    offset = max(0, offset)
+
+    async def events():
+        posicion = offset
+        inicio = ultimo_envio = time.monotonic()
+        while time.monotonic() - inicio < SSE_TIMEOUT_S:
+            eventos, posicion = read_events(seguimiento_id, posicion)
+            for fin, evento in eventos:
+                # id = offset en bytes tras el evento: permite reanudar la suscripción sin repetir eventos
+                yield f"id: {fin}\nevent: {evento['evento']}\ndata: {json.dumps(evento, ensure_ascii=False)}\n\n"
+                ultimo_envio = time.monotonic()
+                if evento["evento"] in EVENTOS_FINALES:
+                    return
+            if time.monotonic() - ultimo_envio > KEEPALIVE_S:
+                yield ": keep-alive\n\n"
+                ultimo_envio = time.monotonic()
+            await asyncio.sleep(POLL_INTERVAL)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
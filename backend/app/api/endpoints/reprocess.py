@@ -0,0 +1,54 @@
+from fastapi import APIRouter, Depends, HTTPException
+from pydantic import BaseModel
+from typing import List, Optional
+from mysql.connector import MySQLConnection
+from ...db import get_db
+from ...services.reprocess import select_files, reprocess_files, DEFAULT_WORKERS
+import logging
+
+router = APIRouter()
+logger = logging.getLogger(__name__)
+
+
+class ReprocessRequest(BaseModel):
+    archivo_ids: Optional[List[int]] = None
+    origen: Optional[str] = None
+    tipo_doc: Optional[str] = None
+    desde: Optional[str] = None  # Fecha de carga (AAAA-MM-DD)
+    hasta: Optional[str] = None
+    estado: Optional[str] = None  # Etapa de core/pipeline.ETAPAS o Error
+    workers: int = DEFAULT_WORKERS  # Acotado a MAX_WORKERS
+    force: bool = False  # Ignora respuestas IA cacheadas
+    dry_run: bool = False
+
+
+@router.post("/reprocess")
+def reprocess(request: ReprocessRequest, db: MySQLConnection = Depends(get_db)):
+    """
+    Re-ejecuta la extracción de archivos ya registrados desde sus originales (ruta_backup),
+    reemplazando staging y consolidados de forma transaccional.
+    """
+    if not any([request.archivo_ids, request.origen, request.tipo_doc, request.desde, request.hasta, request.estado]):
+        raise HTTPException(status_code=400, detail="Debe indicar al menos un filtro (archivo_ids, origen, tipo_doc, desde, hasta o estado).")
+
+    try:
+        archivos = select_files(
+            db,
+            archivo_ids=request.archivo_ids,
+            origen=request.origen,
+            tipo_doc=request.tipo_doc,
+            desde=request.desde,
+            hasta=request.hasta,
+            estado=request.estado
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if request.dry_run:
+        return {"status": "dry_run", "total": len(archivos), "archivos": archivos}
+
+    results = reprocess_files(archivos, workers=request.workers, force=request.force)
+    resumen = {}
+    for r in results:
+        resumen[r["status"]] = resumen.get(r["status"], 0) + 1
+
+    return {"status": "success", "total": len(results), "resumen": resumen, "resultados": results}
@@ -1,48 +1,85 @@
 from fastapi import APIRouter, UploadFile, File, Depends, HTTPException, Form
-from typing import Optional
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, StreamingResponse
+from typing import List, Optional
 from mysql.connector import MySQLConnection
 from ...db import get_db
-from ...parsers.banco_chile import BancoChileParser
-from ...parsers.falabella import FalabellaParser
+from ...parsers.registry import get_parser
+from ...core.progress import is_valid_id
+from ...core.llm_limiter import llm_context, PRIORIDADES
+from ...core.exceptions import BatchTooLargeError
+from ...services.bulk_upload import BatchSpool, process_batch, DEFAULT_WORKERS, MAX_BATCH_MB
+import json
+import zipfile
 import logging
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
+# Margen para encabezados multipart y campos de formulario sobre el tamaño máximo del lote
+MARGEN_MULTIPART = 1024 * 1024
+
+
+class BatchBodyLimitMiddleware:
+    """
+    Rechaza con 413 un POST /upload/batch cuyo Content-Length ya excede el tamaño máximo del
+    lote, antes de que Starlette lea el cuerpo multipart a disco. Sin Content-Length (chunked)
+    el límite lo aplica BatchSpool al copiar.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"].endswith("/upload/batch"):
+            largo = dict(scope["headers"]).get(b"content-length", b"")
+            if largo.isdigit() and int(largo) > MAX_BATCH_MB * 1024 * 1024 + MARGEN_MULTIPART:
+                response = JSONResponse({"detail": f"El lote supera {MAX_BATCH_MB} MB."}, status_code=413)
+                await response(scope, receive, send)
+                return
+        await self.app(scope, receive, send)
+
+
 @router.post("/upload")
 async def upload_file(
     file: UploadFile = File(...),
     origen: str = Form(...), # Banco_Chile, Falabella, Jumbo
     tipo_doc: str = Form(...), # Cartola_CC, Cartola_TC, Boleta_Supermercado
     password: Optional[str] = Form(None), # Nuevo: Soporte para password manual
+    seguimiento_id: Optional[str] = Form(None), # ID elegido por el cliente para GET /progress/{id}
+    prioridad: Optional[str] = Form(None), # interactiva (por defecto) o masiva para scripts de backfill
     db: MySQLConnection = Depends(get_db)
 ):
     """
     Endpoint para subir y procesar archivos de finanzas.
     Soporta resolución automática de contraseñas guardadas.
     """
+    if seguimiento_id and not is_valid_id(seguimiento_id):
+        raise HTTPException(status_code=400, detail="seguimiento_id inválido (A-Z, a-z, 0-9, '_' o '-', máx. 64).")
+    if prioridad and prioridad not in PRIORIDADES:
+        raise HTTPException(status_code=400, detail=f"prioridad inválida. Opciones: {', '.join(PRIORIDADES)}.")
+
     try:
         content = await file.read()
         
         # Fábrica de Parsers
-        parser = None
-        storage_path = "/app/storage" 
-
-        if origen == "Banco_Chile":
-            parser = BancoChileParser(db, storage_path)
-        elif origen == "Falabella":
-            parser = FalabellaParser(db, storage_path)
-        else:
-            raise HTTPException(status_code=400, detail=f"Origen '{origen}' no soportado aún.")
-
-        # Ejecutar procesamiento con soporte de password
-        result = parser.run(
-            filename=file.filename, 
-            file_content=content, 
-            tipo_doc=tipo_doc, 
-            origen=origen, 
-            password=password
-        )
+        try:
+            parser = get_parser(origen, tipo_doc, db)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+        # Ejecutar procesamiento con soporte de password (bloqueante: fuera del event loop).
+        # run_in_threadpool copia el contexto, así que la prioridad llega a las llamadas al LLM
+        with llm_context(prioridad=prioridad):
+            result = await run_in_threadpool(
+                parser.run,
+                filename=file.filename, 
+                file_content=content, 
+                tipo_doc=tipo_doc, 
+                origen=origen, 
+                password=password,
+                seguimiento_id=seguimiento_id
+            )
 
         # Manejo de Errores Estructurados (Seguridad)
         if result["status"] == "security_error":
@@ -66,9 +103,52 @@ async def upload_file(
             "status": "success",
             "message": "Archivo procesado exitosamente",
             "archivo_id": result["archivo_id"],
-            "filename": file.filename
+            "filename": file.filename,
+            "seguimiento_id": seguimiento_id
         }
 
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error crítico en upload endpoint: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
+
+
+def _spool_batch(archivo_zip: Optional[UploadFile], files: List[UploadFile]) -> BatchSpool:
+    spool = BatchSpool()
+    try:
+        if archivo_zip is not None:
+            spool.add_zip(archivo_zip.file)
+        spool.add_files([(f.filename, f.file) for f in files])
+    except Exception:
+        spool.cleanup()
+        raise
+    return spool
+
+
+@router.post("/upload/batch")
+async def upload_batch(
+    archivo_zip: Optional[UploadFile] = File(None), # ZIP con <origen>/<tipo_doc>/<archivo>
+    files: List[UploadFile] = File([]), # Alternativa multipart: filename = <origen>/<tipo_doc>/<archivo>
+    password: Optional[str] = Form(None), # Se prueba en todos los archivos (además del llavero)
+    workers: int = Form(DEFAULT_WORKERS)
+):
+    """
+    Carga masiva: procesa un ZIP o un lote multipart con paralelismo acotado y
+    transmite una línea NDJSON por archivo a medida que termina, más un resumen final.
+    """
+    if archivo_zip is None and not files:
+        raise HTTPException(status_code=400, detail="Debe enviar un archivo ZIP o al menos un archivo en 'files'.")
+
+    try:
+        spool = await run_in_threadpool(_spool_batch, archivo_zip, files)
+    except zipfile.BadZipFile:
+        raise HTTPException(status_code=400, detail="El archivo enviado no es un ZIP válido.")
+    except BatchTooLargeError as e:
+        raise HTTPException(status_code=413, detail=e.message)
+
+    def ndjson():
+        for result in process_batch(spool, workers=workers, password=password):
+            yield json.dumps(result, ensure_ascii=False, default=str) + "\n"
+
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson")
@@ -0,0 +1,148 @@
+import os
+import hashlib
+import logging
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ROOT = "storage/artifacts"
+DEFAULT_MAX_MB = 2048
+
+# Documento protegido con contraseña en el contexto actual: sus páginas, OCR y respuestas IA
+# no se escriben en claro en el almacén (sobrevivirían a la protección del original)
+_privado: ContextVar[bool] = ContextVar("artefactos_privados", default=False)
+
+
+@contextmanager
+def private_artifacts(enabled: bool = True):
+    """Dentro del bloque el almacén no lee ni escribe artefactos (documentos cifrados)."""
+    token = _privado.set(enabled)
+    try:
+        yield
+    finally:
+        _privado.reset(token)
+
+
+class ArtifactStore:
+    """
+    Almacén direccionado por contenido para artefactos costosos de recalcular
+    (páginas rasterizadas, texto OCR). Vive junto a storage/originals y se
+    acota por tamaño expulsando primero los artefactos usados hace más tiempo.
+    Los artefactos de PDFs protegidos con contraseña no se guardan (ver private_artifacts).
+    """
+
+    def __init__(self, root: str = None, max_bytes: int = None):
+        self.root = root or os.getenv("ARTIFACT_STORE_PATH", DEFAULT_ROOT)
+        self.max_bytes = max_bytes or int(os.getenv("ARTIFACT_STORE_MAX_MB", DEFAULT_MAX_MB)) * 1024 * 1024
+        self.enabled = os.getenv("ARTIFACT_STORE_ENABLED", "true").lower() in ("1", "true", "yes")
+        self._lock = threading.Lock()
+        self._size = None  # Se calcula de forma perezosa al primer put
+
+    @staticmethod
+    def make_key(*parts) -> str:
+        """Construye una llave estable a partir de los parámetros que determinan el artefacto."""
+        raw = "|".join(str(p) for p in parts)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _path(self, kind: str, key: str) -> str:
+        return os.path.join(self.root, kind, key[:2], key)
+
+    def get(self, kind: str, key: str) -> Optional[bytes]:
+        if not self.enabled or _privado.get():
+            return None
+        path = self._path(kind, key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            # Marca de acceso para la expulsión LRU
+            os.utime(path, None)
+            return data
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            logger.warning(f"No se pudo leer artefacto {kind}/{key[:12]}: {e}")
+            return None
+
+    def put(self, kind: str, key: str, data: bytes):
+        if not self.enabled or _privado.get():
+            return
+        path = self._path(kind, key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            try:
+                # Al reemplazar una llave existente solo cambia la diferencia de tamaño
+                previo = os.stat(path).st_size
+            except FileNotFoundError:
+                previo = 0
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"No se pudo guardar artefacto {kind}/{key[:12]}: {e}")
+            return
+
+        with self._lock:
+            if self._size is None:
+                self._size = self._scan_size()
+            else:
+                self._size += len(data) - previo
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def get_text(self, kind: str, key: str) -> Optional[str]:
+        data = self.get(kind, key)
+        return data.decode("utf-8") if data is not None else None
+
+    def put_text(self, kind: str, key: str, text: str):
+        self.put(kind, key, text.encode("utf-8"))
+
+    def _iter_files(self):
+        for dirpath, _, filenames in os.walk(self.root):
+            for name in filenames:
+                if name.endswith(".tmp"):
+                    continue
+                path = os.path.join(dirpath, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                yield path, st.st_size, st.st_mtime
+
+    def _scan_size(self) -> int:
+        return sum(size for _, size, _ in self._iter_files())
+
+    def _evict(self):
+        """Expulsa los artefactos menos usados hasta quedar bajo el 90% del límite."""
+        files = sorted(self._iter_files(), key=lambda f: f[2])
+        total = sum(size for _, size, _ in files)
+        target = int(self.max_bytes * 0.9)
+        removed = 0
+        for path, size, _ in files:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                total -= size
+                removed += 1
+            except OSError:
+                continue
+        self._size = total
+        logger.info(f"Artifact store: {removed} artefactos expulsados ({total / 1024 / 1024:.1f} MB en uso).")
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_artifact_store() -> ArtifactStore:
+    """Instancia compartida del almacén de artefactos para el proceso."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = ArtifactStore()
+    return _store
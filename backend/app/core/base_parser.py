@@ -2,35 +2,76 @@ import os
 import hashlib
 import logging
 from abc import ABC, abstractmethod
-from typing import Dict, Any, List
-import shutil
+from dataclasses import dataclass, field
+from typing import Dict, Any, List, Optional, Callable
 from datetime import datetime
-from .image_utils import pdf_to_base64_images
 from ..services.ai_service import AIService
+from ..services.export import invalidate_partitions
 from .exceptions import PasswordRequiredError, InvalidPasswordError
+from .pdf_security import is_encrypted, resolve_password
+from .page_classifier import PageClassification, classify_pages
+from . import layout_templates
+from .progress import ProgressTracker
+from .llm_limiter import llm_context
+from .artifact_store import private_artifacts
+from .pipeline import (
+    CheckpointStore, ETAPA_REGISTRADO, ETAPA_ALMACENADO, ETAPA_RASTERIZADO,
+    ETAPA_TRANSACCIONES, ETAPA_STAGING, ETAPA_COMPLETADO, ESTADO_ERROR
+)
 
 logger = logging.getLogger(__name__)
 
+
+@dataclass
+class ParseContext:
+    """Estado de una invocación (un archivo). Vive solo mientras dura run/reprocess."""
+    file_hash: str
+    archivo_id: Optional[int] = None
+    origen: Optional[str] = None
+    tipo_doc: Optional[str] = None
+    password: Optional[str] = None
+    checkpoints: Optional[CheckpointStore] = None
+    defer_commits: bool = False
+    progress: ProgressTracker = field(default_factory=ProgressTracker)
+
+
 class BaseParser(ABC):
+    """
+    Parser reentrante: la instancia solo guarda dependencias (conexión, AIService);
+    el estado por archivo viaja en un ParseContext creado en cada run/reprocess.
+    """
+    # Tabla de staging (Capa 1) propia de cada parser; se usa al reprocesar
+    staging_table = None
+
     def __init__(self, db_connection, storage_path: str):
         self.db = db_connection
         self.storage_path = storage_path
-        self.archivo_id = None
-        self.file_hash = None
         self.ai_service = AIService()
-        self.current_password = None
+
+    def _commit(self, ctx: ParseContext):
+        """Confirma la transacción salvo que el orquestador la agrupe (ej: reprocesamiento atómico)."""
+        if not ctx.defer_commits:
+            self.db.commit()
 
     def _calculate_hash(self, file_content: bytes) -> str:
         """Calcula el hash SHA256 del contenido del archivo."""
         return hashlib.sha256(file_content).hexdigest()
 
-    def _is_duplicate(self, file_hash: str) -> bool:
-        """Verifica si el archivo ya existe en la base de datos."""
-        cursor = self.db.cursor()
-        cursor.execute("SELECT archivo_id FROM archivos_fuente WHERE hash_archivo = %s", (file_hash,))
+    def _find_file(self, file_hash: str) -> Optional[Dict[str, Any]]:
+        """Busca un archivo ya registrado por hash (completo o con procesamiento pendiente)."""
+        cursor = self.db.cursor(dictionary=True)
+        cursor.execute(
+            "SELECT archivo_id, estado_procesamiento, ruta_backup FROM archivos_fuente WHERE hash_archivo = %s",
+            (file_hash,)
+        )
         result = cursor.fetchone()
         cursor.close()
-        return result is not None
+        return result
+
+    def _is_duplicate(self, file_hash: str) -> bool:
+        """Verifica si el archivo ya fue procesado por completo. Los pendientes se reanudan."""
+        result = self._find_file(file_hash)
+        return result is not None and result["estado_procesamiento"] == ETAPA_COMPLETADO
 
     def _register_file(self, filename: str, file_hash: str, tipo_doc: str, origen: str) -> int:
         """Registra el archivo en la tabla archivos_fuente para trazabilidad."""
@@ -59,6 +100,24 @@ class BaseParser(ABC):
         cursor.close()
         return result[0] if result else None
 
+    def _get_keychain(self) -> List[tuple]:
+        """Retorna todas las entradas del llavero como (origen, tipo_documento, password)."""
+        cursor = self.db.cursor()
+        cursor.execute("SELECT origen, tipo_documento, password_pdf FROM credenciales_archivadores")
+        rows = cursor.fetchall()
+        cursor.close()
+        return rows
+
+    def _resolve_password(self, ctx: ParseContext, file_content: bytes, origen: str, tipo_doc: str, password: str = None) -> str:
+        """Sonda de cifrado: prueba la contraseña manual y el llavero sin rasterizar el PDF."""
+        if not is_encrypted(file_content):
+            return None
+        return resolve_password(
+            file_content, ctx.file_hash, origen, tipo_doc,
+            supplied=[password] if password else [],
+            keychain=self._get_keychain()
+        )
+
     def _update_stored_password(self, origen: str, tipo_doc: str, password: str):
         """Guarda o actualiza la contraseña exitosa en el llavero de la DB."""
         if not password: return
@@ -74,76 +133,312 @@ class BaseParser(ABC):
         logger.info(f"Contraseña guardada/actualizada para {origen} - {tipo_doc}")
 
     @abstractmethod
-    def parse(self, file_content: bytes, password: str = None) -> Dict[str, Any]:
+    def parse(self, ctx: ParseContext, file_content: bytes) -> Dict[str, Any]:
         """Método abstracto para extraer datos específicos del archivo."""
         pass
 
     @abstractmethod
-    def save_to_staging(self, data: Dict[str, Any]):
+    def save_to_staging(self, ctx: ParseContext, data: Dict[str, Any]):
         """Método abstracto para guardar datos crudos en la Capa 1."""
         pass
 
     @abstractmethod
-    def consolidate(self):
+    def consolidate(self, ctx: ParseContext):
         """Método abstracto para limpiar y mover datos a la Capa 2 (Consolidada)."""
         pass
 
-    def run(self, filename: str, file_content: bytes, tipo_doc: str, origen: str, password: str = None):
-        """Orquestador principal del flujo del parser con soporte de contraseñas."""
-        self.file_hash = self._calculate_hash(file_content)
+    def _checkpointed(self, ctx: ParseContext, etapa: str, clave: str, compute: Callable[[], Any]) -> Any:
+        """Retorna la salida persistida de un paso o la calcula y la persiste."""
+        if ctx.checkpoints is None:
+            return compute()
+        cached = ctx.checkpoints.get(etapa, clave)
+        if cached is not None:
+            logger.info(f"Checkpoint reutilizado: {etapa}/{clave}")
+            return cached
+        value = compute()
+        ctx.checkpoints.put(etapa, clave, value)
+        return value
+
+    def _mark_stage(self, ctx: ParseContext, etapa: str, commit: bool = True):
+        if ctx.checkpoints is not None and not ctx.checkpoints.is_done(etapa):
+            ctx.checkpoints.mark(etapa, commit=commit)
+
+    def _classify(self, ctx: ParseContext, file_content: bytes) -> Optional[PageClassification]:
+        """Clasificación de páginas persistida como parte de la etapa de rasterizado."""
+        def compute():
+            classification = classify_pages(file_content, password=ctx.password)
+            return classification.to_dict() if classification else {}
+
+        data = self._checkpointed(ctx, ETAPA_RASTERIZADO, "clasificacion", compute)
+        return PageClassification.from_dict(data) if data else None
+
+    def _extract_metadata(self, ctx: ParseContext, file_content: bytes, image, origin: str, page: int,
+                          classification: Optional[PageClassification] = None) -> Dict[str, Any]:
+        """
+        Pass 1: si la cabecera calza con una plantilla de layout aprendida y su lectura valida,
+        los metadatos se obtienen sin LLM. Si no, se consulta al LLM y se aprende del resultado.
+        """
+        if not layout_templates.is_enabled() or not ctx.tipo_doc:
+            return self.ai_service.extract_metadata(image, origin)
+
+        origen = ctx.origen or origin
+        native = classification.native[page] if classification and page < len(classification.native) else None
+        words, fuente = layout_templates.page_words(file_content, ctx.password, page, image=image, native=native)
+        if not words:
+            return self.ai_service.extract_metadata(image, origin)
+
+        store = layout_templates.LayoutTemplateStore(self.db)
+        plantilla_id = None
+        try:
+            match = store.match(origen, ctx.tipo_doc, fuente, words)
+            if match:
+                plantilla, score, dx, dy = match
+                plantilla_id = plantilla["plantilla_id"]
+                metadata = layout_templates.apply(plantilla, words, dx, dy)
+                fechas = classification.transaction_dates if classification else None
+                valid = layout_templates.validate(plantilla, metadata, fechas)
+                store.record(plantilla_id, acierto=valid)
+                if valid:
+                    logger.info(f"Pass 1 resuelto con plantilla de layout {plantilla_id} (similitud {score:.2f}).")
+                    ctx.progress.emit("pass1_plantilla", plantilla_id=plantilla_id, similitud=round(score, 3))
+                    return metadata
+                logger.info(f"Plantilla de layout {plantilla_id} no validó; se usa el LLM y se reaprende.")
+        except Exception as e:
+            logger.warning(f"Plantillas de layout no disponibles: {e}")
+            return self.ai_service.extract_metadata(image, origin)
+
+        metadata = self.ai_service.extract_metadata(image, origin)
+        template = layout_templates.learn(words, metadata) if metadata else None
+        if template:
+            try:
+                store.save(origen, ctx.tipo_doc, fuente, template, plantilla_id=plantilla_id)
+                logger.info(f"Plantilla de layout aprendida para {origen}/{ctx.tipo_doc} ({len(template['campos'])} campos).")
+            except Exception as e:
+                logger.warning(f"No se pudo guardar la plantilla de layout: {e}")
+        return metadata
+
+    def _store_original(self, ctx: ParseContext, file_content: bytes):
+        """Guarda físicamente el original en ruta_backup (etapa Almacenado)."""
+        cursor = self.db.cursor(dictionary=True)
+        cursor.execute("SELECT ruta_backup FROM archivos_fuente WHERE archivo_id = %s", (ctx.archivo_id,))
+        ruta = cursor.fetchone()['ruta_backup']
+        cursor.close()
+
+        os.makedirs(os.path.dirname(ruta), exist_ok=True)
+        with open(ruta, "wb") as f:
+            f.write(file_content)
+
+    def _clear_staging(self, ctx: ParseContext):
+        """Elimina metadatos y staging del archivo actual (restos de un intento previo)."""
+        cursor = self.db.cursor()
+        if self.staging_table:
+            cursor.execute(f"DELETE FROM {self.staging_table} WHERE archivo_id = %s", (ctx.archivo_id,))
+        invalidate_partitions(self.db, "metadatos", ctx.archivo_id)
+        cursor.execute("DELETE FROM metadatos_documento WHERE archivo_id = %s", (ctx.archivo_id,))
+        cursor.close()
+
+    def _clear_consolidated(self, ctx: ParseContext):
+        """Elimina consolidados del archivo actual antes de volver a consolidar."""
+        invalidate_partitions(self.db, "transacciones", ctx.archivo_id)
+        cursor = self.db.cursor()
+        # Las transacciones con items vinculados se conservan: su ID es determinista y el INSERT IGNORE las respeta
+        cursor.execute("""
+            DELETE FROM transacciones_consolidadas
+            WHERE archivo_id = %s
+              AND transaccion_id NOT IN (SELECT transaccion_id FROM items_compra)
+        """, (ctx.archivo_id,))
+        cursor.close()
+
+    def _set_status(self, ctx: ParseContext, estado: str):
+        cursor = self.db.cursor()
+        cursor.execute("UPDATE archivos_fuente SET estado_procesamiento = %s WHERE archivo_id = %s", (estado, ctx.archivo_id))
+        cursor.close()
+        self.db.commit()
+
+    def _post_consolidation(self, ctx: ParseContext):
+        """Análisis derivados de los consolidados nuevos; un fallo no invalida la ingesta."""
+        from ..services import recurring_charges, profile_metrics, category_index
+        pasos = []
+        if category_index.is_enabled():
+            pasos.append(("vecinos_categoria", lambda: category_index.get_category_index(self.db).update_for_file(self.db, ctx.archivo_id)))
+        if recurring_charges.is_enabled():
+            pasos.append(("suscripciones", lambda: recurring_charges.RecurringChargeDetector(self.db).update_for_files([ctx.archivo_id])))
+        if profile_metrics.is_enabled():
+            pasos.append(("perfil", lambda: profile_metrics.ProfileMetrics(self.db).update_for_file(ctx.archivo_id)))
+        for nombre, paso in pasos:
+            try:
+                paso()
+            except Exception as e:
+                logger.warning(f"Análisis '{nombre}' falló para archivo_id {ctx.archivo_id}: {e}")
+                self.db.rollback()
+
+    def _execute_pipeline(self, ctx: ParseContext, file_content: bytes) -> Dict[str, Any]:
+        """
+        Máquina de estados de ingesta. Cada etapa persiste su salida y avanza
+        estado_procesamiento; las etapas ya completadas se omiten al reanudar.
+        """
+        if not ctx.checkpoints.is_done(ETAPA_ALMACENADO):
+            self._store_original(ctx, file_content)
+            self._mark_stage(ctx, ETAPA_ALMACENADO)
+            ctx.progress.emit("almacenado", bytes=len(file_content))
+
+        transacciones = None
+        if not ctx.checkpoints.is_done(ETAPA_STAGING):
+            # Rasterizado, OCR, Pass 1 y Pass 2 (cada parser marca sus etapas y checkpoints por página)
+            extracted_data = self.parse(ctx, file_content)
+            self._mark_stage(ctx, ETAPA_TRANSACCIONES)
+            transacciones = len(extracted_data.get("transactions") or [])
+
+            # Staging y consolidados se reemplazan en una sola transacción (se confirma tras consolidar):
+            # un corte entre ambos no deja staging nuevo junto a consolidados viejos. Al reanudar se
+            # repite el parseo, servido desde los checkpoints de Pass 1/Pass 2 y el artifact store.
+            ctx.defer_commits = True
+            self._clear_staging(ctx)
+            self.save_to_staging(ctx, extracted_data)
+            self._mark_stage(ctx, ETAPA_STAGING, commit=False)
+            ctx.progress.emit("staging_completado", filas=transacciones)
+
+        if not ctx.checkpoints.is_done(ETAPA_COMPLETADO):
+            ctx.defer_commits = True
+            self._clear_consolidated(ctx)
+            self.consolidate(ctx)
+            self._mark_stage(ctx, ETAPA_COMPLETADO, commit=False)
+            ctx.defer_commits = False
+            self.db.commit()
+            ctx.progress.emit("consolidacion_completada")
+            self._post_consolidation(ctx)
+        ctx.defer_commits = False
+
+        return {"transacciones": transacciones}
+
+    def run(self, filename: str, file_content: bytes, tipo_doc: str, origen: str, password: str = None,
+            seguimiento_id: str = None):
+        """
+        Orquestador principal del flujo del parser con soporte de contraseñas y reanudación.
+        Con seguimiento_id el avance por etapa se publica para GET /progress/{seguimiento_id}.
+        """
+        ctx = ParseContext(
+            file_hash=self._calculate_hash(file_content), origen=origen, tipo_doc=tipo_doc,
+            progress=ProgressTracker(seguimiento_id)
+        )
+        ctx.progress.emit("inicio", archivo=filename, origen=origen, tipo_doc=tipo_doc, bytes=len(file_content))
 
         if not file_content:
             logger.warning(f"Archivo vacio omitido: {filename}")
+            ctx.progress.emit("error", mensaje="El archivo esta vacio (0 bytes).")
             return {"status": "error", "message": "El archivo esta vacio (0 bytes)."}
 
-        if self._is_duplicate(self.file_hash):
+        existing = self._find_file(ctx.file_hash)
+        if existing and existing["estado_procesamiento"] == ETAPA_COMPLETADO:
             logger.warning(f"Archivo duplicado omitido: {filename}")
+            ctx.progress.emit("duplicado", archivo_id=existing["archivo_id"])
             return {"status": "duplicate", "message": "El archivo ya ha sido procesado anteriormente."}
 
-        # 1. Resolver Contraseña (Manual > Llavero)
-        self.current_password = password if password else self._get_stored_password(origen, tipo_doc)
-        
         try:
-            # 2. Registrar (Capa 0)
-            self.archivo_id = self._register_file(filename, self.file_hash, tipo_doc, origen)
-            
-            # Guardar físicamente
-            cursor = self.db.cursor(dictionary=True)
-            cursor.execute("SELECT ruta_backup FROM archivos_fuente WHERE archivo_id = %s", (self.archivo_id,))
-            ruta = cursor.fetchone()['ruta_backup']
-            cursor.close()
-
-            os.makedirs(os.path.dirname(ruta), exist_ok=True)
-            with open(ruta, "wb") as f:
-                f.write(file_content)
-
-            # 3. Parsear (Extracción)
-            logger.info(f"Procesando archivo {filename} con origen {origen}")
-            extracted_data = self.parse(file_content, password=self.current_password)
+            # 1. Resolver Contraseña (Manual > Caché > Llavero) antes de registrar o rasterizar
+            ctx.password = self._resolve_password(ctx, file_content, origen, tipo_doc, password)
 
-            # 4. Guardar en Staging (Capa 1)
-            self.save_to_staging(extracted_data)
+            # 2. Registrar (Capa 0) o reanudar un procesamiento interrumpido
+            if existing:
+                ctx.archivo_id = existing["archivo_id"]
+                ctx.checkpoints = CheckpointStore(self.db, ctx.archivo_id)
+                logger.info(f"Reanudando archivo_id {ctx.archivo_id} desde la etapa '{ctx.checkpoints.last_stage()}'")
+            else:
+                ctx.archivo_id = self._register_file(filename, ctx.file_hash, tipo_doc, origen)
+                ctx.checkpoints = CheckpointStore(self.db, ctx.archivo_id)
+                self._mark_stage(ctx, ETAPA_REGISTRADO)
+            ctx.progress.emit("registrado", archivo_id=ctx.archivo_id, reanudado=bool(existing))
 
-            # 5. Consolidar (Capa 2)
-            self.consolidate()
+            # 3-8. Almacenar, extraer, staging y consolidar
+            logger.info(f"Procesando archivo {filename} con origen {origen}")
+            # Las llamadas al LLM de este archivo comparten turno en la cola (reparto justo entre archivos);
+            # un PDF cifrado no deja páginas ni textos descifrados en el artifact store
+            with llm_context(archivo=ctx.file_hash[:16]), private_artifacts(bool(ctx.password)):
+                result = self._execute_pipeline(ctx, file_content)
 
-            # 6. ÉXITO: Guardar la contraseña que funcionó para el futuro
-            if self.current_password:
-                self._update_stored_password(origen, tipo_doc, self.current_password)
+            # 9. ÉXITO: Guardar la contraseña que funcionó para el futuro
+            if ctx.password:
+                self._update_stored_password(origen, tipo_doc, ctx.password)
+            ctx.progress.emit("completado", archivo_id=ctx.archivo_id, transacciones=result["transacciones"])
 
             return {
                 "status": "success",
-                "archivo_id": self.archivo_id,
+                "archivo_id": ctx.archivo_id,
                 "message": f"Archivo {filename} procesado y consolidado exitosamente."
             }
 
         except (PasswordRequiredError, InvalidPasswordError) as e:
             # Errores de contraseña: No hacemos rollback, devolvemos error específico
             logger.warning(f"Error de seguridad en {filename}: {str(e)}")
+            ctx.progress.emit("error_seguridad", error_code=type(e).__name__, mensaje=str(e))
             return {"status": "security_error", "error_code": type(e).__name__, "message": str(e)}
         except Exception as e:
             import traceback
             logger.error(f"Error procesando {filename}: {repr(e)}\n{traceback.format_exc()}")
             if self.db:
                 self.db.rollback()
-            return {"status": "error", "message": repr(e)}
+                if ctx.archivo_id:
+                    # Los checkpoints ya confirmados se conservan para reanudar en el próximo intento
+                    self._set_status(ctx, ESTADO_ERROR)
+            ctx.progress.emit("error", archivo_id=ctx.archivo_id, mensaje=repr(e))
+            return {"status": "error", "archivo_id": ctx.archivo_id, "message": repr(e)}
+
+    def reprocess(self, archivo_id: int, resume: bool = False, seguimiento_id: str = None):
+        """
+        Re-ejecuta un archivo ya registrado desde su original en ruta_backup.
+        Con resume=True continúa desde la última etapa completada; si no, descarta los
+        checkpoints de extracción y reemplaza metadatos, staging y consolidados. Las etapas
+        cuyos insumos no cambiaron (rasterizado, OCR y respuestas IA) se sirven desde el artifact store.
+        """
+        cursor = self.db.cursor(dictionary=True)
+        cursor.execute(
+            "SELECT nombre_original, hash_archivo, tipo_documento, origen, ruta_backup FROM archivos_fuente WHERE archivo_id = %s",
+            (archivo_id,)
+        )
+        archivo = cursor.fetchone()
+        cursor.close()
+        if not archivo:
+            return {"status": "error", "archivo_id": archivo_id, "message": "Archivo no registrado."}
+
+        ctx = ParseContext(
+            file_hash=archivo["hash_archivo"], archivo_id=archivo_id, origen=archivo["origen"],
+            tipo_doc=archivo["tipo_documento"], progress=ProgressTracker(seguimiento_id)
+        )
+        filename = archivo["nombre_original"]
+        ctx.progress.emit("inicio", archivo=filename, archivo_id=archivo_id, reanudado=resume)
+
+        try:
+            with open(archivo["ruta_backup"], "rb") as f:
+                file_content = f.read()
+        except OSError as e:
+            logger.error(f"Original no disponible para archivo_id {archivo_id}: {e}")
+            return {"status": "error", "archivo_id": archivo_id, "message": f"Original no disponible: {e}"}
+
+        try:
+            ctx.password = self._resolve_password(ctx, file_content, archivo["origen"], archivo["tipo_documento"])
+            ctx.checkpoints = CheckpointStore(self.db, archivo_id)
+            if not resume:
+                ctx.checkpoints.reset(ETAPA_RASTERIZADO)
+
+            logger.info(f"Reprocesando archivo_id {archivo_id} ({filename}) desde {archivo['ruta_backup']}")
+            with llm_context(archivo=ctx.file_hash[:16]), private_artifacts(bool(ctx.password)):
+                result = self._execute_pipeline(ctx, file_content)
+            ctx.progress.emit("completado", archivo_id=archivo_id, transacciones=result["transacciones"])
+
+            return {
+                "status": "success",
+                "archivo_id": archivo_id,
+                "transacciones": result["transacciones"],
+                "message": f"Archivo {filename} reprocesado exitosamente."
+            }
+        except (PasswordRequiredError, InvalidPasswordError) as e:
+            logger.warning(f"Error de seguridad reprocesando {filename}: {str(e)}")
+            ctx.progress.emit("error_seguridad", error_code=type(e).__name__, mensaje=str(e))
+            return {"status": "security_error", "archivo_id": archivo_id, "error_code": type(e).__name__, "message": str(e)}
+        except Exception as e:
+            import traceback
+            logger.error(f"Error reprocesando {filename}: {repr(e)}\n{traceback.format_exc()}")
+            self.db.rollback()
+            self._set_status(ctx, ESTADO_ERROR)
+            ctx.progress.emit("error", archivo_id=archivo_id, mensaje=repr(e))
+            return {"status": "error", "archivo_id": archivo_id, "message": repr(e)}
@@ -13,3 +13,16 @@ class InvalidPasswordError(Exception):
         self.origen = origen
         self.tipo_doc = tipo_doc
         super().__init__(self.message)
+
+class LLMUnavailableError(Exception):
+    """Lanzada cuando el servidor del modelo no responde (timeout, conexión o error HTTP)."""
+    def __init__(self, message="El servicio de IA no está disponible.", etapa=None):
+        self.message = message
+        self.etapa = etapa
+        super().__init__(self.message)
+
+class BatchTooLargeError(Exception):
+    """Lanzada cuando un lote de carga masiva excede los límites de entradas, tamaño o compresión."""
+    def __init__(self, message="El lote excede los límites de carga masiva."):
+        self.message = message
+        super().__init__(self.message)
@@ -1,35 +1,230 @@
 from pdf2image import convert_from_bytes
 from pdf2image.exceptions import PDFPageCountError
-import io
-import base64
+import os
+import json
+import hashlib
 import logging
+import tempfile
+from typing import Callable, Dict, List, Optional, Union
 from .exceptions import PasswordRequiredError, InvalidPasswordError
+from .artifact_store import get_artifact_store
+from .page_image import PageImage
 
 logger = logging.getLogger(__name__)
 
-def pdf_to_base64_images(pdf_content: bytes, password: str = None):
+def _page_ranges(pages):
+    """Agrupa índices de página (0-based) en rangos contiguos para minimizar invocaciones a poppler."""
+    ranges = []
+    for p in sorted(set(pages)):
+        if ranges and p == ranges[-1][1] + 1:
+            ranges[-1][1] = p
+        else:
+            ranges.append([p, p])
+    return ranges
+
+RENDER_DPI = 200
+JPEG_QUALITY = 85
+# Copias de depuración de las páginas enviadas a la IA (desactivado si no se define)
+DEBUG_IMAGES_DIR = os.getenv("DEBUG_IMAGES_DIR")
+
+def _write_debug_image(file_hash: str, page: int, data: bytes):
+    """Guarda una copia de la página con nombre único por archivo (seguro con varios workers)."""
+    path = os.path.join(DEBUG_IMAGES_DIR, f"{file_hash[:12]}_page_{page + 1}.jpg")
+    try:
+        os.makedirs(DEBUG_IMAGES_DIR, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        logger.warning(f"No se pudo guardar imagen de depuración {path}: {e}")
+
+def _rasterize(pdf_content: bytes, dpi: int, password: str = None, grayscale: bool = False,
+               first_page: int = None, last_page: int = None) -> List[bytes]:
+    """
+    Rasteriza con pdftoppm escribiendo JPEG directamente a disco: las páginas no pasan
+    por PIL ni se recodifican en Python.
+    """
+    with tempfile.TemporaryDirectory(prefix="raster_") as tmp_dir:
+        paths = convert_from_bytes(
+            pdf_content, dpi=dpi, userpw=password, grayscale=grayscale,
+            first_page=first_page, last_page=last_page,
+            output_folder=tmp_dir, fmt="jpeg", jpegopt={"quality": JPEG_QUALITY},
+            paths_only=True
+        )
+        pages = []
+        for path in paths:
+            with open(path, "rb") as f:
+                pages.append(f.read())
+        return pages
+
+def render_pages(pdf_content: bytes, password: str = None, pages: List[int] = None,
+                 dpi: int = RENDER_DPI, grayscale: bool = False,
+                 on_page: Optional[Callable[[int, int], None]] = None) -> Dict[int, bytes]:
+    """
+    Rasteriza páginas del PDF a JPEG (bytes) consultando primero el artifact store.
+    Las llaves dependen del hash del archivo, la página, el dpi y el preprocesamiento,
+    por lo que reprocesar un archivo ya conocido no vuelve a invocar poppler.
+    `on_page(n, total)` se invoca a medida que cada página queda disponible.
+    """
+    store = get_artifact_store()
+    file_hash = hashlib.sha256(pdf_content).hexdigest()
+    prep = f"jpeg-q{JPEG_QUALITY}-{'gray' if grayscale else 'rgb'}"
+
+    manifest_key = store.make_key(file_hash, dpi, prep)
+    if pages is None:
+        page_count = store.get_text("page_manifest", manifest_key)
+        if page_count is not None:
+            pages = list(range(int(page_count)))
+
+    result = {}
+    missing = []
+    for p in (pages or []):
+        data = store.get("pages", store.make_key(file_hash, p, dpi, prep))
+        if data is not None:
+            result[p] = data
+            if on_page:
+                on_page(len(result), len(pages))
+        else:
+            missing.append(p)
+
+    def _collect(batch):
+        for p, data in batch:
+            store.put("pages", store.make_key(file_hash, p, dpi, prep), data)
+            result[p] = data
+            if on_page:
+                on_page(len(result), len(pages) if pages is not None else len(batch))
+
+    rendered = []
+    if pages is None:
+        # Sin manifiesto: rasterizar el documento completo una vez
+        images = _rasterize(pdf_content, dpi, password=password, grayscale=grayscale)
+        rendered = list(enumerate(images))
+        store.put_text("page_manifest", manifest_key, str(len(images)))
+        _collect(rendered)
+    else:
+        for first, last in _page_ranges(missing):
+            images = _rasterize(pdf_content, dpi, password=password, grayscale=grayscale,
+                                first_page=first + 1, last_page=last + 1)
+            batch = list(zip(range(first, last + 1), images))
+            _collect(batch)
+            rendered.extend(batch)
+
+    if rendered:
+        logger.info(f"Rasterizadas {len(rendered)} páginas ({len(result) - len(rendered)} desde artifact store).")
+    elif result:
+        logger.info(f"{len(result)} páginas recuperadas desde artifact store (sin poppler).")
+    return result
+
+def ocr_image(image: Union[bytes, PageImage], lang: str = "spa", config: str = "") -> str:
+    """
+    Ejecuta Tesseract sobre una imagen (bytes o PageImage) consultando primero el artifact store.
+    La llave combina el hash de la imagen con el idioma y la configuración de Tesseract.
+    """
+    import pytesseract
+
+    if isinstance(image, PageImage):
+        image_data, image_hash = image.data, image.sha256
+    else:
+        image_data, image_hash = image, hashlib.sha256(image).hexdigest()
+
+    store = get_artifact_store()
+    key = store.make_key(image_hash, lang, config)
+    cached = store.get_text("ocr", key)
+    if cached is not None:
+        return cached
+
+    # Tesseract lee el JPEG desde disco: sin decodificar con PIL ni recodificar a PNG
+    with tempfile.NamedTemporaryFile(suffix=".jpg") as tmp:
+        tmp.write(image_data)
+        tmp.flush()
+        text = pytesseract.image_to_string(tmp.name, lang=lang, config=config)
+    store.put_text("ocr", key, text)
+    return text
+
+def ocr_region(image: PageImage, box, dpi: int = RENDER_DPI, lang: str = "spa", config: str = "") -> str:
+    """
+    Tesseract sobre un recorte de la página. `box` va en fracciones de página (x0, y0, x1, y1);
+    el recorte se reescala de RENDER_DPI a `dpi` antes del OCR. Se cachea igual que ocr_image.
+    """
+    import pytesseract
+    from PIL import Image
+
+    box = tuple(round(v, 4) for v in box)
+    store = get_artifact_store()
+    key = store.make_key(image.sha256, box, dpi, lang, config)
+    cached = store.get_text("ocr_regiones", key)
+    if cached is not None:
+        return cached
+
+    page = image.pil()
+    width, height = page.size
+    crop = page.crop((int(box[0] * width), int(box[1] * height), int(box[2] * width), int(box[3] * height))).convert("L")
+    if dpi != RENDER_DPI:
+        crop = crop.resize((max(1, round(crop.width * dpi / RENDER_DPI)), max(1, round(crop.height * dpi / RENDER_DPI))), Image.LANCZOS)
+    # PNG en escala de grises: sin una segunda pérdida JPEG sobre el recorte
+    with tempfile.NamedTemporaryFile(suffix=".png") as tmp:
+        crop.save(tmp, format="PNG", dpi=(dpi, dpi))
+        tmp.flush()
+        text = pytesseract.image_to_string(tmp.name, lang=lang, config=config)
+    store.put_text("ocr_regiones", key, text)
+    return text
+
+def ocr_words(image: PageImage, lang: str = "spa") -> List[Dict]:
     """
-    Convierte un PDF en una lista de imágenes en formato base64.
+    Palabras reconocidas por Tesseract con su caja, en coordenadas relativas (0-1) a la página.
+    Se cachea en el artifact store igual que ocr_image.
+    """
+    import pytesseract
+
+    store = get_artifact_store()
+    key = store.make_key(image.sha256, lang, "image_to_data")
+    cached = store.get_text("ocr_palabras", key)
+    if cached is not None:
+        return json.loads(cached)
+
+    # PIL solo lee la cabecera para conocer el tamaño
+    width, height = image.pil().size
+    with tempfile.NamedTemporaryFile(suffix=".jpg") as tmp:
+        tmp.write(image.data)
+        tmp.flush()
+        data = pytesseract.image_to_data(tmp.name, lang=lang, output_type=pytesseract.Output.DICT)
+
+    words = []
+    for i, text in enumerate(data["text"]):
+        text = (text or "").strip()
+        if not text or float(data["conf"][i]) < 0:
+            continue
+        left, top = data["left"][i], data["top"][i]
+        words.append({
+            "text": text,
+            "x0": left / width, "y0": top / height,
+            "x1": (left + data["width"][i]) / width, "y1": (top + data["height"][i]) / height,
+        })
+    store.put_text("ocr_palabras", key, json.dumps(words))
+    return words
+
+def pdf_to_page_images(pdf_content: bytes, password: str = None, pages: List[int] = None,
+                       on_page: Optional[Callable[[int, int], None]] = None) -> List[PageImage]:
+    """
+    Convierte un PDF en una lista de PageImage (JPEG codificado una sola vez), en orden ascendente.
     Soporta PDFs protegidos mediante el parámetro password.
+    Si se indica `pages` (índices 0-based), solo se rasterizan esas páginas.
     """
     try:
-        # Convertir PDF a lista de imágenes (PIL objects)
         # userpw es el argumento de pdf2image para la contraseña
-        images = convert_from_bytes(pdf_content, dpi=200, userpw=password)
+        rendered = render_pages(pdf_content, password=password, pages=pages, on_page=on_page)
+        file_hash = hashlib.sha256(pdf_content).hexdigest() if DEBUG_IMAGES_DIR else None
         
-        base64_images = []
-        for i, img in enumerate(images):
+        page_images = []
+        for i in sorted(rendered):
             # Guardar para depuración física en el servidor (opcional)
-            debug_path = f"/app/app/debug_images/debug_page_{i+1}.jpg"
-            img.save(debug_path, format="JPEG", quality=85)
-
-            buffered = io.BytesIO()
-            img.save(buffered, format="JPEG", quality=85)
-            img_str = base64.b64encode(buffered.getvalue()).decode("utf-8")
-            base64_images.append(img_str)
+            if DEBUG_IMAGES_DIR:
+                _write_debug_image(file_hash, i, rendered[i])
+            page_images.append(PageImage(rendered[i], page=i))
             
-        logger.info(f"PDF convertido a {len(base64_images)} imágenes.")
-        return base64_images
+        logger.info(f"PDF convertido a {len(page_images)} imágenes.")
+        return page_images
         
     except PDFPageCountError as e:
         error_msg = str(e)
@@ -46,3 +241,7 @@ def pdf_to_base64_images(pdf_content: bytes, password: str = None):
     except Exception as e:
         logger.error(f"Error inesperado convirtiendo PDF a imagen: {str(e)}")
         raise e
+
+def pdf_to_base64_images(pdf_content: bytes, password: str = None, pages: List[int] = None) -> List[str]:
+    """Compatibilidad para scripts de exploración: igual que pdf_to_page_images pero en base64."""
+    return [img.base64() for img in pdf_to_page_images(pdf_content, password=password, pages=pages)]
@@ -0,0 +1,347 @@
+import io
+import os
+import re
+import json
+import logging
+import unicodedata
+from datetime import date, timedelta
+from statistics import median
+from typing import Any, Dict, List, Optional, Tuple
+from .normalization import VALORES_VACIOS, parse_amount, parse_date
+
+logger = logging.getLogger(__name__)
+
+FUENTE_NATIVA = "nativo"
+FUENTE_OCR = "ocr"
+
+# Similitud mínima (anclas coincidentes / anclas totales) para aplicar una plantilla
+MATCH_THRESHOLD = float(os.getenv("LAYOUT_MATCH_THRESHOLD", "0.7"))
+# Plantillas conservadas por (origen, tipo_documento, fuente); se descarta la de menos aciertos
+MAX_TEMPLATES = int(os.getenv("LAYOUT_MAX_TEMPLATES", "5"))
+MAX_ANCHORS = 150
+# Tolerancias en fracción de página
+ANCHOR_TOLERANCE = 0.01
+LINE_TOLERANCE = 0.006
+WORD_GAP = 0.012
+MAX_VALUE_WORDS = 6
+MIN_NATIVE_WORDS = 20
+
+# Campos sin los cuales una plantilla no sirve (Pass 2 infiere años con el periodo)
+CAMPOS_REQUERIDOS = ("periodo_desde", "periodo_hasta")
+# Contraste del periodo leído con las fechas de movimientos de la clasificación de páginas:
+# días de holgura en los bordes y fracción mínima de movimientos que deben caer dentro
+PERIOD_TOLERANCE_DAYS = int(os.getenv("LAYOUT_PERIOD_TOLERANCE_DAYS", "7"))
+MIN_PERIOD_COVERAGE = float(os.getenv("LAYOUT_MIN_PERIOD_COVERAGE", "0.5"))
+PREFIJO_ATRIBUTO = "atributos."
+
+TIPO_FECHA = "fecha"
+TIPO_NUMERO = "numero"
+TIPO_TEXTO = "texto"
+
+
+def is_enabled() -> bool:
+    return os.getenv("LAYOUT_TEMPLATES_ENABLED", "true").lower() in ("1", "true", "yes")
+
+
+def _norm(text: str) -> str:
+    """Mayúsculas sin tildes ni puntuación en los bordes."""
+    text = unicodedata.normalize("NFKD", text).encode("ascii", "ignore").decode("ascii")
+    return text.upper().strip(" .:;,()[]#*")
+
+
+def _compact(text: str) -> str:
+    return re.sub(r"[^A-Z0-9]", "", _norm(str(text)))
+
+
+def _center(word: Dict[str, Any]) -> Tuple[float, float]:
+    return (word["x0"] + word["x1"]) / 2, (word["y0"] + word["y1"]) / 2
+
+
+def page_words(file_content: bytes, password: Optional[str], page: int, image=None,
+               native: Optional[bool] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """
+    Palabras de la página de cabecera con cajas relativas (0-1): texto nativo con pdfplumber
+    o, si la página es escaneada, Tesseract image_to_data. Retorna (palabras, fuente).
+    """
+    if native is not False:
+        try:
+            import pdfplumber
+            with pdfplumber.open(io.BytesIO(file_content), password=password) as pdf:
+                pdf_page = pdf.pages[page]
+                w, h = float(pdf_page.width), float(pdf_page.height)
+                words = [
+                    {"text": wd["text"], "x0": wd["x0"] / w, "y0": wd["top"] / h, "x1": wd["x1"] / w, "y1": wd["bottom"] / h}
+                    for wd in pdf_page.extract_words()
+                ]
+            if len(words) >= MIN_NATIVE_WORDS:
+                return words, FUENTE_NATIVA
+        except Exception as e:
+            logger.warning(f"Plantillas: no se pudo leer el texto nativo de la pág {page + 1}: {e}")
+
+    if image is None:
+        return [], None
+    from .image_utils import ocr_words
+    try:
+        return ocr_words(image, lang="spa"), FUENTE_OCR
+    except Exception as e:
+        logger.warning(f"Plantillas: OCR con cajas falló en pág {page + 1}: {e}")
+        return [], None
+
+
+def _lines(words: List[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
+    """Agrupa palabras en renglones por la coordenada vertical de su centro."""
+    lines: List[List[Dict[str, Any]]] = []
+    for word in sorted(words, key=lambda w: (_center(w)[1], w["x0"])):
+        cy = _center(word)[1]
+        if lines and abs(_center(lines[-1][0])[1] - cy) <= LINE_TOLERANCE:
+            lines[-1].append(word)
+        else:
+            lines.append([word])
+    return [sorted(line, key=lambda w: w["x0"]) for line in lines]
+
+
+def fingerprint(words: List[Dict[str, Any]], exclude: set = frozenset()) -> List[List[Any]]:
+    """
+    Huella del layout: palabras fijas (etiquetas) con su posición. Se excluyen números y
+    los valores aprendidos, que cambian de un periodo a otro.
+    """
+    anchors = []
+    for i, word in sorted(enumerate(words), key=lambda iw: (iw[1]["y0"], iw[1]["x0"])):
+        text = _norm(word["text"])
+        if i in exclude or len(text) < 3 or not text.isalpha():
+            continue
+        cx, cy = _center(word)
+        anchors.append([text, round(cx, 4), round(cy, 4)])
+        if len(anchors) >= MAX_ANCHORS:
+            break
+    return anchors
+
+
+def similarity(template: List[List[Any]], current: List[List[Any]]) -> Tuple[float, float, float]:
+    """
+    Fracción de anclas presentes en ambas huellas (misma palabra a menos de ANCHOR_TOLERANCE
+    tras corregir el desplazamiento global). Retorna (similitud, dx, dy).
+    """
+    if not template or not current:
+        return 0.0, 0.0, 0.0
+    by_text: Dict[str, List[Tuple[float, float]]] = {}
+    for text, cx, cy in current:
+        by_text.setdefault(text, []).append((cx, cy))
+
+    # Desplazamiento global: mediana de las diferencias entre anclas con texto único
+    deltas = [(by_text[text][0][0] - cx, by_text[text][0][1] - cy) for text, cx, cy in template
+              if len(by_text.get(text, [])) == 1]
+    dx = median(d[0] for d in deltas) if deltas else 0.0
+    dy = median(d[1] for d in deltas) if deltas else 0.0
+
+    matched = 0
+    for text, cx, cy in template:
+        if any(abs(px - cx - dx) <= ANCHOR_TOLERANCE and abs(py - cy - dy) <= ANCHOR_TOLERANCE
+               for px, py in by_text.get(text, [])):
+            matched += 1
+    return matched / max(len(template), len(current)), dx, dy
+
+
+def _field_type(key: str, value: str) -> str:
+    if key.startswith("periodo") or "fecha" in key:
+        return TIPO_FECHA
+    if not re.search(r"[A-Za-z]", value) and parse_amount(value) is not None:
+        return TIPO_NUMERO
+    return TIPO_TEXTO
+
+
+def _learnable_fields(metadata: Dict[str, Any]) -> Dict[str, str]:
+    """Campos escalares de la respuesta del LLM (los atributos con prefijo 'atributos.')."""
+    campos = {}
+    for key, value in metadata.items():
+        if key == "atributos_adicionales":
+            for k, v in (value or {}).items():
+                if isinstance(v, (str, int, float)) and not isinstance(v, bool):
+                    campos[f"{PREFIJO_ATRIBUTO}{k}"] = str(v)
+        elif isinstance(value, str):
+            campos[key] = value
+    return {k: v for k, v in campos.items() if v.strip().upper() not in VALORES_VACIOS}
+
+
+def _locate(lines, value: str, tipo: str, used: set) -> Optional[List[int]]:
+    """Índices de las palabras consecutivas de un renglón cuyo texto equivale al valor."""
+    target = parse_date(value) if tipo == TIPO_FECHA else _compact(value)
+    if not target:
+        return None
+    for line in lines:
+        for start in range(len(line)):
+            for size in range(1, min(MAX_VALUE_WORDS, len(line) - start) + 1):
+                window = line[start:start + size]
+                if any(w["_i"] in used for w in window):
+                    break
+                joined = " ".join(w["text"] for w in window)
+                found = parse_date(joined) if tipo == TIPO_FECHA else _compact(joined)
+                if found == target:
+                    return [w["_i"] for w in window]
+    return None
+
+
+def learn(words: List[Dict[str, Any]], metadata: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    Construye una plantilla a partir de una respuesta exitosa del LLM: ubica cada valor en las
+    palabras de la página y guarda su caja. Retorna None si faltan los campos requeridos.
+    """
+    indexed = [{**w, "_i": i} for i, w in enumerate(words)]
+    lines = _lines(indexed)
+    used: set = set()
+    campos = {}
+    for key, value in _learnable_fields(metadata).items():
+        tipo = _field_type(key, value)
+        idx = _locate(lines, value, tipo, used)
+        if not idx:
+            continue
+        used.update(idx)
+        box = [words[i] for i in idx]
+        campos[key] = {
+            "tipo": tipo,
+            "caja": [round(min(w["x0"] for w in box), 4), round(min(w["y0"] for w in box), 4),
+                     round(max(w["x1"] for w in box), 4), round(max(w["y1"] for w in box), 4)],
+        }
+    if not all(c in campos for c in CAMPOS_REQUERIDOS):
+        return None
+    # Las palabras de los valores no forman parte de la huella
+    return {"huella": fingerprint(words, exclude=used), "campos": campos}
+
+
+def _read_region(lines, caja: List[float], dx: float, dy: float) -> str:
+    """Texto de la región aprendida, extendida hacia la derecha mientras las palabras sigan contiguas."""
+    x0, y0, x1, y1 = caja[0] + dx, caja[1] + dy, caja[2] + dx, caja[3] + dy
+    for line in lines:
+        cy = _center(line[0])[1]
+        if not (y0 - LINE_TOLERANCE <= cy <= y1 + LINE_TOLERANCE):
+            continue
+        picked = [w for w in line if x0 - LINE_TOLERANCE <= _center(w)[0] <= x1]
+        if not picked:
+            continue
+        for w in line[line.index(picked[-1]) + 1:]:
+            if w["x0"] - picked[-1]["x1"] > WORD_GAP:
+                break
+            picked.append(w)
+        return " ".join(w["text"] for w in picked)
+    return ""
+
+
+def apply(template: Dict[str, Any], words: List[Dict[str, Any]], dx: float = 0.0, dy: float = 0.0) -> Dict[str, Any]:
+    """Metadatos en el mismo formato que AIService.extract_metadata, leídos de las regiones."""
+    lines = _lines(words)
+    metadata: Dict[str, Any] = {
+        "titular": "N/A", "cuenta": "N/A", "periodo_desde": "N/A", "periodo_hasta": "N/A",
+        "atributos_adicionales": {},
+    }
+    for key, campo in template["campos"].items():
+        text = _read_region(lines, campo["caja"], dx, dy)
+        if campo["tipo"] == TIPO_FECHA:
+            text = parse_date(text) or ""
+        if key.startswith(PREFIJO_ATRIBUTO):
+            metadata["atributos_adicionales"][key[len(PREFIJO_ATRIBUTO):]] = text
+        else:
+            metadata[key] = text
+    return metadata
+
+
+def period_matches(metadata: Dict[str, Any], fechas_movimientos: List[str]) -> bool:
+    """
+    El periodo leído debe cubrir las fechas de los movimientos (p. ej. una plantilla que lee el
+    periodo anterior no calza). Las fechas sin año se interpretan con el año de periodo_hasta.
+    Las compras en cuotas conservan su fecha original, por eso basta con MIN_PERIOD_COVERAGE.
+    """
+    desde, hasta = parse_date(metadata["periodo_desde"]), parse_date(metadata["periodo_hasta"])
+    if not desde or not hasta:
+        return False
+    desde, hasta = date.fromisoformat(desde), date.fromisoformat(hasta)
+    fechas = [parse_date(f, year=hasta.year, reference_month=hasta.month) for f in fechas_movimientos]
+    fechas = [date.fromisoformat(f) for f in fechas if f]
+    if not fechas:
+        return True
+    holgura = timedelta(days=PERIOD_TOLERANCE_DAYS)
+    dentro = sum(1 for f in fechas if desde - holgura <= f <= hasta + holgura)
+    return dentro / len(fechas) >= MIN_PERIOD_COVERAGE
+
+
+def validate(template: Dict[str, Any], metadata: Dict[str, Any], fechas_movimientos: Optional[List[str]] = None) -> bool:
+    """
+    Cada campo aprendido debe leerse y respetar su tipo; el periodo debe ser coherente y,
+    si se conocen las fechas de los movimientos, cubrirlas.
+    """
+    for key, campo in template["campos"].items():
+        if key.startswith(PREFIJO_ATRIBUTO):
+            value = metadata["atributos_adicionales"].get(key[len(PREFIJO_ATRIBUTO):], "")
+        else:
+            value = metadata.get(key, "")
+        if not value:
+            return False
+        if campo["tipo"] == TIPO_NUMERO and parse_amount(value) is None:
+            return False
+        if campo["tipo"] == TIPO_TEXTO and len(_compact(value)) < 2:
+            return False
+    if metadata["periodo_desde"] > metadata["periodo_hasta"]:
+        return False
+    return period_matches(metadata, fechas_movimientos) if fechas_movimientos else True
+
+
+class LayoutTemplateStore:
+    """Plantillas de layout persistidas en plantillas_layout."""
+
+    def __init__(self, db_connection):
+        self.db = db_connection
+
+    def candidates(self, origen: str, tipo_doc: str, fuente: str) -> List[Dict[str, Any]]:
+        cursor = self.db.cursor(dictionary=True)
+        cursor.execute("""
+            SELECT plantilla_id, huella, campos, aciertos, fallos FROM plantillas_layout
+            WHERE origen = %s AND tipo_documento = %s AND fuente = %s
+        """, (origen, tipo_doc, fuente))
+        rows = cursor.fetchall()
+        cursor.close()
+        for row in rows:
+            for col in ("huella", "campos"):
+                if isinstance(row[col], (str, bytes)):
+                    row[col] = json.loads(row[col])
+        return rows
+
+    def match(self, origen: str, tipo_doc: str, fuente: str, words: List[Dict[str, Any]]):
+        """Plantilla más parecida sobre el umbral: (plantilla, similitud, dx, dy) o None."""
+        current = fingerprint(words)
+        best = None
+        for row in self.candidates(origen, tipo_doc, fuente):
+            score, dx, dy = similarity(row["huella"], current)
+            if score >= MATCH_THRESHOLD and (best is None or score > best[1]):
+                best = (row, score, dx, dy)
+        return best
+
+    def record(self, plantilla_id: int, acierto: bool):
+        columna = "aciertos" if acierto else "fallos"
+        cursor = self.db.cursor()
+        cursor.execute(f"UPDATE plantillas_layout SET {columna} = {columna} + 1 WHERE plantilla_id = %s", (plantilla_id,))
+        cursor.close()
+        self.db.commit()
+
+    def save(self, origen: str, tipo_doc: str, fuente: str, template: Dict[str, Any], plantilla_id: int = None):
+        """Reemplaza la plantilla que falló o agrega una nueva, respetando MAX_TEMPLATES."""
+        cursor = self.db.cursor()
+        huella, campos = json.dumps(template["huella"]), json.dumps(template["campos"])
+        if plantilla_id:
+            cursor.execute(
+                "UPDATE plantillas_layout SET huella = %s, campos = %s, fallos = 0 WHERE plantilla_id = %s",
+                (huella, campos, plantilla_id)
+            )
+        else:
+            cursor.execute("""
+                SELECT plantilla_id FROM plantillas_layout
+                WHERE origen = %s AND tipo_documento = %s AND fuente = %s
+                ORDER BY aciertos - fallos DESC, actualizado_en DESC
+            """, (origen, tipo_doc, fuente))
+            sobrantes = [r[0] for r in cursor.fetchall()][MAX_TEMPLATES - 1:]
+            for old_id in sobrantes:
+                cursor.execute("DELETE FROM plantillas_layout WHERE plantilla_id = %s", (old_id,))
+            cursor.execute("""
+                INSERT INTO plantillas_layout (origen, tipo_documento, fuente, huella, campos)
+                VALUES (%s, %s, %s, %s, %s)
+            """, (origen, tipo_doc, fuente, huella, campos))
+        cursor.close()
+        self.db.commit()
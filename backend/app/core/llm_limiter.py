@@ -0,0 +1,316 @@
+import os
+import re
+import time
+import fcntl
+import logging
+import threading
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional
+from .exceptions import LLMUnavailableError
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LOCK_DIR = "storage/locks"
+DEFAULT_MAX_INFLIGHT = 2
+DEFAULT_TIMEOUT = 600
+# Sondeo de la cola: crece exponencialmente mientras se espera (cada sondeo lista la cola)
+POLL_INTERVAL = 0.05
+MAX_POLL_INTERVAL = float(os.getenv("LLM_MAX_POLL_INTERVAL", "0.5"))
+POLL_BACKOFF = 1.5
+
+# Clases de prioridad: una carga desde el frontend pasa antes que un backfill masivo
+PRIORIDAD_INTERACTIVA = "interactiva"
+PRIORIDAD_MASIVA = "masiva"
+PRIORIDADES = {PRIORIDAD_INTERACTIVA: 0, PRIORIDAD_MASIVA: 1}
+MUESTRAS_ESPERA = 500
+SERVIDAS_TTL = 3600
+
+# Prioridad y archivo de las llamadas al LLM del contexto actual (hilo o tarea)
+_prioridad: ContextVar[Optional[str]] = ContextVar("llm_prioridad", default=None)
+_archivo: ContextVar[Optional[str]] = ContextVar("llm_archivo", default=None)
+_NO_ARCHIVO = "-"
+
+
+def _clave_archivo(archivo) -> str:
+    """El archivo viaja en el nombre del ticket: solo alfanuméricos."""
+    return re.sub(r"[^A-Za-z0-9]", "", str(archivo))[:32] or _NO_ARCHIVO
+
+
+@contextmanager
+def llm_context(prioridad: str = None, archivo: str = None):
+    """Asigna clase de prioridad y/o archivo a las llamadas al LLM hechas dentro del bloque."""
+    if prioridad is not None and prioridad not in PRIORIDADES:
+        raise ValueError(f"Prioridad desconocida: {prioridad}. Opciones: {', '.join(PRIORIDADES)}.")
+    tokens = []
+    if prioridad is not None:
+        tokens.append((_prioridad, _prioridad.set(prioridad)))
+    if archivo is not None:
+        tokens.append((_archivo, _archivo.set(_clave_archivo(archivo))))
+    try:
+        yield
+    finally:
+        for var, token in reversed(tokens):
+            var.reset(token)
+
+
+def _percentil(valores: List[float], p: float) -> Optional[float]:
+    if not valores:
+        return None
+    orden = sorted(valores)
+    return orden[min(len(orden) - 1, int(len(orden) * p / 100))]
+
+
+class LLMSlotLimiter:
+    """
+    Límite de llamadas simultáneas al LLM compartido entre procesos, con cola priorizada.
+    Cada llamada toma uno de N archivos de lock (flock); el kernel libera el lock
+    si el worker muere, por lo que no quedan cupos tomados tras un reinicio.
+
+    Quien espera deja un ticket (también con flock) en <lock_dir>/cola. Solo la cabeza de la
+    cola intenta tomar cupo; el orden es clase de prioridad, luego reparto justo entre archivos
+    (llamadas en curso y en espera del mismo archivo; a igual turno pasa el archivo atendido
+    hace más tiempo, según <lock_dir>/servidas) y luego orden de llegada.
+    """
+
+    def __init__(self, slots: int = None, lock_dir: str = None, timeout: float = None):
+        self.slots = max(1, slots or int(os.getenv("LLM_MAX_INFLIGHT", DEFAULT_MAX_INFLIGHT)))
+        self.lock_dir = lock_dir or os.getenv("LLM_LOCK_DIR", DEFAULT_LOCK_DIR)
+        self.timeout = timeout or float(os.getenv("LLM_SLOT_TIMEOUT", DEFAULT_TIMEOUT))
+        self.queue_dir = os.path.join(self.lock_dir, "cola")
+        self.served_dir = os.path.join(self.lock_dir, "servidas")
+        os.makedirs(self.queue_dir, exist_ok=True)
+        os.makedirs(self.served_dir, exist_ok=True)
+        self._metrics_lock = threading.Lock()
+        self._esperas = {clase: deque(maxlen=MUESTRAS_ESPERA) for clase in PRIORIDADES}
+        self._contadores = {clase: {"atendidas": 0, "agotadas": 0} for clase in PRIORIDADES}
+        self._seq = 0
+
+    def _slot_path(self, slot: int) -> str:
+        return os.path.join(self.lock_dir, f"llm_slot_{slot}.lock")
+
+    def _try_acquire(self, slot: int):
+        fd = os.open(self._slot_path(slot), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return fd
+        except BlockingIOError:
+            os.close(fd)
+            return None
+
+    def _in_flight(self) -> Dict[str, int]:
+        """
+        Llamadas en curso por archivo (cada cupo tomado guarda el archivo que lo usa).
+        Solo cuentan los cupos con flock tomado: un worker que murió deja el texto en el archivo.
+        """
+        en_vuelo: Dict[str, int] = {}
+        for i in range(self.slots):
+            try:
+                fd = os.open(self._slot_path(i), os.O_RDONLY)
+            except OSError:
+                continue
+            try:
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    # Cupo libre: su contenido es de una llamada que ya no está en curso
+                    fcntl.flock(fd, fcntl.LOCK_UN)
+                    continue
+                except BlockingIOError:
+                    pass
+                archivo = os.pread(fd, 64, 0).decode(errors="ignore").strip()
+            finally:
+                os.close(fd)
+            if archivo:
+                en_vuelo[archivo] = en_vuelo.get(archivo, 0) + 1
+        return en_vuelo
+
+    def _tickets(self) -> List[Dict[str, Any]]:
+        tickets = []
+        for name in os.listdir(self.queue_dir):
+            partes = name[:-len(".ticket")].split("_") if name.endswith(".ticket") else []
+            if len(partes) != 4:
+                continue
+            prioridad, llegada, archivo, _ = partes
+            tickets.append({"name": name, "prioridad": int(prioridad), "llegada": int(llegada), "archivo": archivo})
+        return tickets
+
+    def _last_served(self) -> Dict[str, float]:
+        """Última vez (mtime) que cada archivo obtuvo cupo, en cualquier proceso."""
+        servidas = {}
+        for name in os.listdir(self.served_dir):
+            try:
+                servidas[name] = os.stat(os.path.join(self.served_dir, name)).st_mtime
+            except OSError:
+                continue
+        return servidas
+
+    def _mark_served(self, archivo: str, seq: int):
+        if archivo == _NO_ARCHIVO:
+            return
+        path = os.path.join(self.served_dir, archivo)
+        try:
+            with open(path, "a"):
+                os.utime(path)
+        except OSError:
+            return
+        if seq % 200 == 0:
+            # Limpieza ocasional de archivos que ya no llaman al modelo
+            limite = time.time() - SERVIDAS_TTL
+            for nombre, mtime in self._last_served().items():
+                if mtime < limite:
+                    try:
+                        os.remove(os.path.join(self.served_dir, nombre))
+                    except OSError:
+                        pass
+
+    def _ranked(self) -> List[Dict[str, Any]]:
+        """Tickets en orden de atención."""
+        en_vuelo = self._in_flight()
+        servidas = self._last_served()
+        contados: Dict[tuple, int] = {}
+        tickets = sorted(self._tickets(), key=lambda t: t["llegada"])
+        for t in tickets:
+            if t["archivo"] == _NO_ARCHIVO:
+                t["turno"] = 0
+                continue
+            # Turno dentro del archivo: sus llamadas en curso más las que llegaron antes en la misma clase
+            clave = (t["prioridad"], t["archivo"])
+            t["turno"] = en_vuelo.get(t["archivo"], 0) + contados.get(clave, 0)
+            contados[clave] = contados.get(clave, 0) + 1
+        return sorted(tickets, key=lambda t: (t["prioridad"], t["turno"], servidas.get(t["archivo"], 0.0), t["llegada"]))
+
+    def _is_stale(self, name: str) -> bool:
+        """Un ticket sin flock pertenece a un proceso que murió mientras esperaba."""
+        path = os.path.join(self.queue_dir, name)
+        try:
+            fd = os.open(path, os.O_RDWR)
+        except OSError:
+            return False
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return False
+        finally:
+            os.close(fd)
+        return True
+
+    def _is_head(self, name: str) -> bool:
+        for t in self._ranked():
+            if t["name"] == name:
+                return True
+            if self._is_stale(t["name"]):
+                try:
+                    os.remove(os.path.join(self.queue_dir, t["name"]))
+                except OSError:
+                    pass
+                logger.warning(f"Ticket LLM huérfano descartado: {t['name']}")
+                continue
+            return False
+        return True
+
+    def _enqueue(self, prioridad: str, archivo: str):
+        with self._metrics_lock:
+            self._seq += 1
+            seq = self._seq
+        name = f"{PRIORIDADES[prioridad]}_{time.time_ns():020d}_{archivo}_{os.getpid()}x{threading.get_ident()}x{seq}.ticket"
+        # Se publica con rename ya bloqueado: otro proceso nunca ve el ticket sin flock
+        tmp_path = os.path.join(self.queue_dir, f"{name}.tmp")
+        fd = os.open(tmp_path, os.O_RDWR | os.O_CREAT, 0o644)
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        os.rename(tmp_path, os.path.join(self.queue_dir, name))
+        return name, fd, seq
+
+    def _dequeue(self, name: str, fd: int):
+        try:
+            os.remove(os.path.join(self.queue_dir, name))
+        except OSError:
+            pass
+        os.close(fd)
+
+    def _record(self, prioridad: str, espera: float = None):
+        with self._metrics_lock:
+            if espera is None:
+                self._contadores[prioridad]["agotadas"] += 1
+            else:
+                self._contadores[prioridad]["atendidas"] += 1
+                self._esperas[prioridad].append(espera)
+
+    @contextmanager
+    def slot(self, prioridad: str = None, archivo: str = None):
+        """
+        Bloquea hasta obtener un cupo libre; lanza LLMUnavailableError si se agota el tiempo.
+        Sin argumentos usa la prioridad y el archivo fijados con llm_context (por defecto interactiva).
+        """
+        prioridad = prioridad or _prioridad.get() or PRIORIDAD_INTERACTIVA
+        archivo = _clave_archivo(archivo) if archivo else (_archivo.get() or _NO_ARCHIVO)
+        start = time.monotonic()
+        name, ticket_fd, seq = self._enqueue(prioridad, archivo)
+        fd = slot_i = None
+        espera = POLL_INTERVAL
+        try:
+            while fd is None:
+                if self._is_head(name):
+                    for i in range(self.slots):
+                        fd = self._try_acquire(i)
+                        if fd is not None:
+                            slot_i = i
+                            break
+                if fd is not None:
+                    # Se anota el archivo antes de salir de la cola para que el turno lo cuente
+                    os.ftruncate(fd, 0)
+                    os.pwrite(fd, archivo.encode(), 0)
+                    break
+                if time.monotonic() - start > self.timeout:
+                    self._record(prioridad)
+                    raise LLMUnavailableError(f"Sin cupo para llamar al modelo tras {self.timeout:.0f}s ({self.slots} en curso).")
+                time.sleep(espera)
+                espera = min(espera * POLL_BACKOFF, MAX_POLL_INTERVAL)
+            self._mark_served(archivo, seq)
+        finally:
+            self._dequeue(name, ticket_fd)
+
+        waited = time.monotonic() - start
+        self._record(prioridad, waited)
+        if waited > 1:
+            logger.info(f"Cupo LLM {slot_i} obtenido tras {waited:.1f}s de espera (prioridad {prioridad}).")
+        try:
+            yield slot_i
+        finally:
+            os.ftruncate(fd, 0)
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+
+    def metrics(self) -> Dict[str, Any]:
+        """Profundidad de cola (todos los procesos) y esperas observadas por este proceso."""
+        cola = {clase: 0 for clase in PRIORIDADES}
+        nombres = {v: k for k, v in PRIORIDADES.items()}
+        for t in self._tickets():
+            clase = nombres.get(t["prioridad"])
+            if clase:
+                cola[clase] += 1
+        with self._metrics_lock:
+            esperas = {
+                clase: {
+                    **self._contadores[clase],
+                    "espera_p50_s": _percentil(list(muestras), 50),
+                    "espera_p95_s": _percentil(list(muestras), 95),
+                    "espera_max_s": max(muestras) if muestras else None,
+                }
+                for clase, muestras in self._esperas.items()
+            }
+        return {"cupos": self.slots, "en_curso": sum(self._in_flight().values()), "en_cola": cola, "por_clase": esperas}
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+def get_llm_limiter() -> LLMSlotLimiter:
+    """Instancia compartida del limitador para el proceso (los cupos se comparten vía archivos)."""
+    global _limiter
+    if _limiter is None:
+        with _limiter_lock:
+            if _limiter is None:
+                _limiter = LLMSlotLimiter()
+    return _limiter
@@ -0,0 +1,138 @@
+import os
+import json
+import logging
+import threading
+from dataclasses import dataclass, replace
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+PASS_METADATA = "metadata"
+PASS_TRANSACTIONS = "transactions"
+INPUT_IMAGE = "image"
+INPUT_TEXT = "text"
+
+DEFAULT_API_URL = "http://host.docker.internal:1234/v1"
+DEFAULT_MODEL = "local-model"
+
+# Claves de selección de una ruta; las omitidas actúan como comodín
+_MATCH_KEYS = ("pass", "origin", "input")
+_ROUTE_KEYS = ("model", "api_url", "temperature", "max_tokens", "fallback", "name")
+_CONFIG_KEYS = ("default", "routes")
+
+
+@dataclass(frozen=True)
+class ModelRoute:
+    """Modelo, endpoint y parámetros de generación para una llamada al LLM."""
+    model: str = DEFAULT_MODEL
+    api_url: str = DEFAULT_API_URL
+    temperature: float = 0.0
+    max_tokens: Optional[int] = None  # Tope propio del modelo (ej: contexto pequeño)
+    fallback: Optional["ModelRoute"] = None
+    name: str = "default"
+
+    def clamp(self, max_tokens: int) -> int:
+        return min(max_tokens, self.max_tokens) if self.max_tokens else max_tokens
+
+
+class ModelRouter:
+    """
+    Enruta cada llamada según (pasada, origen, tipo de entrada). Configuración JSON en
+    LLM_ROUTES (texto) o LLM_ROUTES_FILE (ruta), con la forma:
+
+        {"default": {"model": "local-model", "temperature": 0.1, "fallback": {"model": "modelo-respaldo"}},
+         "routes": [{"pass": "metadata", "model": "modelo-chico", "fallback": "default"},
+                    {"pass": "transactions", "origin": "Falabella", "input": "text", "model": "modelo-grande"}]}
+
+    Gana la ruta que calza con más claves; sin rutas todo va al modelo por defecto. Las rutas
+    heredan de "default" lo que no definen (modelo, endpoint, temperature, max_tokens). Sin
+    configuración, AI_FALLBACK_MODEL (y AI_FALLBACK_API_URL) definen el respaldo del default.
+    """
+
+    def __init__(self, config: Dict[str, Any] = None):
+        config = config if config is not None else self._load_config()
+        self._warn_unknown(config, _CONFIG_KEYS, "configuración")
+        base = {"model": DEFAULT_MODEL, "api_url": os.getenv("AI_API_URL", DEFAULT_API_URL)}
+        default_spec = dict(config.get("default") or {})
+        if "fallback" not in default_spec and os.getenv("AI_FALLBACK_MODEL"):
+            default_spec["fallback"] = {"model": os.getenv("AI_FALLBACK_MODEL"), "api_url": os.getenv("AI_FALLBACK_API_URL")}
+        # El respaldo del default se arma después para que herede sus parámetros
+        self.default = self._build(base, {k: v for k, v in default_spec.items() if k != "fallback"}, "default")
+        if default_spec.get("fallback") is not None:
+            self.default = self._with_fallback(base, self.default, default_spec["fallback"])
+        self.routes: List[Dict[str, Any]] = []
+        for i, spec in enumerate(config.get("routes") or []):
+            match = {k: spec[k] for k in _MATCH_KEYS if spec.get(k)}
+            name = spec.get("name") or "/".join(f"{k}={v}" for k, v in match.items()) or f"ruta_{i}"
+            self.routes.append({"match": match, "route": self._build(base, spec, name)})
+        if self.routes:
+            logger.info(f"Enrutamiento LLM: {len(self.routes)} rutas además de '{self.default.model}'.")
+
+    @staticmethod
+    def _load_config() -> Dict[str, Any]:
+        raw = os.getenv("LLM_ROUTES")
+        path = os.getenv("LLM_ROUTES_FILE")
+        try:
+            if raw:
+                return json.loads(raw)
+            if path:
+                with open(path, "r", encoding="utf-8") as f:
+                    return json.load(f)
+        except (OSError, ValueError) as e:
+            logger.error(f"Configuración de rutas LLM inválida ({path or 'LLM_ROUTES'}): {e}. Se usa el modelo por defecto.")
+        return {}
+
+    @staticmethod
+    def _warn_unknown(spec: Dict[str, Any], known, name: str):
+        unknown = sorted(set(spec) - set(known))
+        if unknown:
+            logger.warning(f"Rutas LLM: claves desconocidas en '{name}' se ignoran: {', '.join(unknown)}.")
+
+    def _build(self, base: Dict[str, Any], spec: Dict[str, Any], name: str, fallback_allowed: bool = True) -> ModelRoute:
+        self._warn_unknown(spec, _ROUTE_KEYS + (_MATCH_KEYS if name != "default" else ()), name)
+        # Lo no definido se hereda del default (o de la configuración base al construir el default)
+        defaults = getattr(self, "default", None) or ModelRoute(model=base["model"], api_url=base["api_url"])
+        route = ModelRoute(
+            model=spec.get("model") or defaults.model,
+            api_url=spec.get("api_url") or defaults.api_url,
+            temperature=float(spec["temperature"]) if spec.get("temperature") is not None else defaults.temperature,
+            max_tokens=spec["max_tokens"] if spec.get("max_tokens") is not None else defaults.max_tokens,
+            name=name,
+        )
+        if spec.get("fallback") is None:
+            return route
+        if not fallback_allowed:
+            logger.warning(f"Rutas LLM: '{name}' es un respaldo y no puede tener respaldo propio; se ignora.")
+            return route
+        return self._with_fallback(base, route, spec["fallback"])
+
+    def _with_fallback(self, base: Dict[str, Any], route: ModelRoute, fallback) -> ModelRoute:
+        if fallback == "default" and route.name != "default":
+            return replace(route, fallback=self.default)
+        if isinstance(fallback, dict):
+            return replace(route, fallback=self._build(base, fallback, f"{route.name}/fallback", fallback_allowed=False))
+        logger.warning(f"Rutas LLM: respaldo inválido en '{route.name}': {fallback!r}.")
+        return route
+
+    def resolve(self, pass_name: str, origin: str = None, input_kind: str = None) -> ModelRoute:
+        request = {"pass": pass_name, "origin": origin, "input": input_kind}
+        best, best_score = self.default, -1
+        for entry in self.routes:
+            match = entry["match"]
+            if all(request.get(k) == v for k, v in match.items()) and len(match) > best_score:
+                best, best_score = entry["route"], len(match)
+        return best
+
+
+_router = None
+_router_lock = threading.Lock()
+
+
+def get_model_router() -> ModelRouter:
+    """Instancia compartida del enrutador para el proceso."""
+    global _router
+    if _router is None:
+        with _router_lock:
+            if _router is None:
+                _router = ModelRouter()
+    return _router
@@ -0,0 +1,235 @@
+import re
+import logging
+import unicodedata
+from datetime import date, datetime
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Meses en español (abreviados y completos) -> número de mes
+MESES = {
+    "ene": 1, "feb": 2, "mar": 3, "abr": 4, "may": 5, "jun": 6,
+    "jul": 7, "ago": 8, "sep": 9, "set": 9, "oct": 10, "nov": 11, "dic": 12,
+}
+
+# Patrones precompilados (se compilan una sola vez al importar el módulo)
+_RE_ISO = re.compile(r"^(\d{4})[-/](\d{1,2})[-/](\d{1,2})")
+_RE_NUMERICA = re.compile(r"^(\d{1,2})[/\-.](\d{1,2})(?:[/\-.](\d{2,4}))?$")
+_RE_TEXTUAL = re.compile(r"^(\d{1,2})[\s\-/.]*([a-záéíóú]{3,})\.?(?:[\s\-/.]*(\d{2,4}))?$")
+_RE_MONTO_LIMPIEZA = re.compile(r"[^0-9,.\-()]")
+_RE_MILES_PUNTO = re.compile(r"^\d{1,3}(\.\d{3})+$")
+_RE_MILES_COMA = re.compile(r"^\d{1,3}(,\d{3}){2,}$")
+
+VALORES_VACIOS = {"", "N/A", "NA", "-", "NONE", "NULL", "NAN"}
+
+# Prefijos del medio de pago que no identifican al comercio
+_RE_PREFIJO_COMERCIO = re.compile(
+    r"^(?:(?:COMPRA|COMPRAS)(?:\s+(?:NAC|NACIONAL|INTERNACIONAL|INT))?|PAGO(?:\s+AUTOMATICO)?|CARGO(?:\s+AUTOMATICO)?|PAC|PAT|DEBITO)\b[\s:.\-]*"
+)
+_RE_SEPARADORES_COMERCIO = re.compile(r"[^A-Z0-9]+")
+# Razón social y plaza varían entre glosas del mismo comercio; tras un marcador de
+# sucursal solo viene el nombre del local
+_TOKENS_RUIDO_COMERCIO = {"SPA", "LTDA", "EIRL", "CIA", "CL", "CHL", "CHILE", "SANTIAGO", "STGO", "WWW", "HTTPS", "HTTP"}
+_MARCADORES_SUCURSAL = {"SUC", "SUCURSAL", "LOCAL", "TDA", "TIENDA"}
+MAX_TOKENS_COMERCIO = 3
+_RE_ESPACIOS = re.compile(r"\s+")
+
+
+def _expand_year(y: str) -> int:
+    """Convierte años de 2 dígitos (YY) a 4 dígitos asumiendo el siglo 2000."""
+    return 2000 + int(y) if len(y) == 2 else int(y)
+
+
+def infer_year(month: int, year: int, reference_month: Optional[int] = None) -> int:
+    """
+    Infiere el año de una fecha sin año a partir del mes de referencia del periodo.
+    Cubre el cruce Diciembre/Enero: un movimiento de diciembre en una cartola que
+    cierra en enero pertenece al año anterior (y viceversa).
+    """
+    if reference_month:
+        if month - reference_month > 6:
+            return year - 1
+        if reference_month - month > 6:
+            return year + 1
+    return year
+
+
+def _build_iso(y: int, m: int, d: int) -> Optional[str]:
+    try:
+        return date(y, m, d).isoformat()
+    except ValueError:
+        return None
+
+
+@lru_cache(maxsize=8192)
+def _parse_date_cached(raw: str, year: Optional[int], reference_month: Optional[int]) -> Optional[str]:
+    match = _RE_ISO.match(raw)
+    if match:
+        return _build_iso(int(match.group(1)), int(match.group(2)), int(match.group(3)))
+
+    match = _RE_NUMERICA.match(raw)
+    if match:
+        d, m = int(match.group(1)), int(match.group(2))
+        if match.group(3):
+            y = _expand_year(match.group(3))
+        elif year:
+            y = infer_year(m, year, reference_month)
+        else:
+            return None
+        return _build_iso(y, m, d)
+
+    match = _RE_TEXTUAL.match(raw.lower())
+    if match:
+        m = MESES.get(match.group(2)[:3])
+        if not m:
+            return None
+        d = int(match.group(1))
+        if match.group(3):
+            y = _expand_year(match.group(3))
+        elif year:
+            y = infer_year(m, year, reference_month)
+        else:
+            return None
+        return _build_iso(y, m, d)
+
+    return None
+
+
+def parse_date(value: Any, year: Optional[Any] = None, reference_month: Optional[int] = None) -> Optional[str]:
+    """
+    Normaliza una fecha a ISO (AAAA-MM-DD).
+    Soporta ISO, DD/MM, DD/MM/YY, DD/MM/AAAA, DD-MMM, DD-MMM-AAAA y objetos date/datetime.
+    Si la fecha no trae año se usa `year`, ajustado con `reference_month` en el cruce de año.
+    Retorna None si el valor no es interpretable.
+    """
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return value.date().isoformat()
+    if isinstance(value, date):
+        return value.isoformat()
+
+    raw = str(value).strip()
+    if raw.upper() in VALORES_VACIOS:
+        return None
+    return _parse_date_cached(raw, int(year) if year else None, reference_month)
+
+
+def parse_dates(values: Iterable[Any], year: Optional[Any] = None, reference_month: Optional[int] = None) -> List[Optional[str]]:
+    """Versión por lote de parse_date: cada valor distinto se interpreta una sola vez."""
+    memo: Dict[Any, Optional[str]] = {}
+    result = []
+    for v in values:
+        key = v if isinstance(v, (str, int, float, date)) or v is None else str(v)
+        if key not in memo:
+            memo[key] = parse_date(v, year, reference_month)
+        result.append(memo[key])
+    return result
+
+
+@lru_cache(maxsize=8192)
+def _parse_amount_cached(raw: str) -> Optional[float]:
+    negative = raw.startswith("-") or raw.endswith("-") or (raw.startswith("(") and raw.endswith(")"))
+    digits = raw.strip("-()")
+    if not digits or not any(c.isdigit() for c in digits):
+        return None
+
+    if "." in digits and "," in digits:
+        # El último separador es el decimal: 1.234,56 (CLP) o 1,234.56
+        if digits.rfind(",") > digits.rfind("."):
+            digits = digits.replace(".", "").replace(",", ".")
+        else:
+            digits = digits.replace(",", "")
+    elif "," in digits:
+        # En CLP la coma es decimal, salvo que aparezca como separador de miles repetido
+        digits = digits.replace(",", "") if _RE_MILES_COMA.match(digits) else digits.replace(",", ".")
+    elif "." in digits:
+        # Punto de miles (1.234 / 1.234.567) vs punto decimal (25000.00)
+        if _RE_MILES_PUNTO.match(digits):
+            digits = digits.replace(".", "")
+
+    try:
+        amount = float(digits)
+    except ValueError:
+        return None
+    return -amount if negative else amount
+
+
+def parse_amount(value: Any, default: Optional[float] = None) -> Optional[float]:
+    """
+    Normaliza un monto en pesos chilenos a float.
+    Soporta puntos de miles, coma decimal, signo '$', signo negativo (prefijo, sufijo o paréntesis).
+    Retorna `default` si el valor no es interpretable.
+    """
+    if value is None:
+        return default
+    if isinstance(value, bool):
+        return default
+    if isinstance(value, (int, float)):
+        return default if value != value else float(value)  # NaN -> default
+
+    raw = str(value).strip()
+    if raw.upper() in VALORES_VACIOS:
+        return default
+    raw = _RE_MONTO_LIMPIEZA.sub("", raw)
+    amount = _parse_amount_cached(raw)
+    return default if amount is None else amount
+
+
+def parse_amounts(values: Iterable[Any], default: Optional[float] = None) -> List[Optional[float]]:
+    """Versión por lote de parse_amount: cada valor distinto se interpreta una sola vez."""
+    memo: Dict[Any, Optional[float]] = {}
+    result = []
+    for v in values:
+        key = v if isinstance(v, (str, int, float)) or v is None else str(v)
+        if key not in memo:
+            memo[key] = parse_amount(v, default)
+        result.append(memo[key])
+    return result
+
+
+def period_reference(metadata: Optional[Dict[str, Any]]) -> Tuple[Optional[int], Optional[int]]:
+    """
+    Obtiene (año, mes) de referencia del periodo de una cartola para inferir años.
+    Prioriza periodo_hasta (fin del ciclo) y recurre a periodo_desde.
+    """
+    if not metadata:
+        return None, None
+    for key in ("periodo_hasta", "periodo_desde"):
+        iso = parse_date(metadata.get(key))
+        if iso:
+            return int(iso[:4]), int(iso[5:7])
+    return None, None
+
+
+@lru_cache(maxsize=16384)
+def merchant_key(descripcion: str) -> str:
+    """
+    Clave estable del comercio a partir de la glosa: sin tildes, prefijos de medio de pago,
+    tokens con dígitos (folios, cuotas, tarjetas, fechas), sucursal ni puntuación; máximo tres palabras.
+    Ej: 'COMPRA NAC NETFLIX.COM 866-579' -> 'NETFLIX COM'.
+    """
+    if not descripcion:
+        return ""
+    text = unicodedata.normalize("NFKD", descripcion).encode("ascii", "ignore").decode("ascii").upper().strip()
+    text = _RE_PREFIJO_COMERCIO.sub("", text)
+    tokens = []
+    for t in _RE_SEPARADORES_COMERCIO.split(text):
+        if t in _MARCADORES_SUCURSAL and tokens:
+            break
+        if len(t) >= 2 and t not in _TOKENS_RUIDO_COMERCIO and not any(c.isdigit() for c in t):
+            tokens.append(t)
+    return " ".join(tokens[:MAX_TOKENS_COMERCIO])
+
+
+@lru_cache(maxsize=16384)
+def product_key(producto: str, sku: Optional[str] = None) -> str:
+    """
+    Clave del historial de precios: el SKU si existe; si no, el nombre sin tildes ni puntuación.
+    Los números se conservan porque distinguen formatos (ej: 'LECHE 1L' vs 'LECHE 2L').
+    """
+    if sku and str(sku).strip():
+        return f"SKU:{str(sku).strip().upper()}"
+    text = unicodedata.normalize("NFKD", producto or "").encode("ascii", "ignore").decode("ascii").upper()
+    return _RE_ESPACIOS.sub(" ", _RE_SEPARADORES_COMERCIO.sub(" ", text)).strip()
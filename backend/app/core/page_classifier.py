@@ -0,0 +1,163 @@
+import io
+import os
+import re
+import logging
+from dataclasses import dataclass, field, asdict
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+PAGE_HEADER = "cabecera"
+PAGE_TRANSACTIONS = "transacciones"
+PAGE_IRRELEVANT = "irrelevante"
+
+# Resolución del muestreo OCR para páginas sin texto nativo (muy inferior a los 200 dpi de extracción)
+SAMPLE_DPI = 100
+MIN_NATIVE_CHARS = 50
+
+_MES = r"(?:ene|feb|mar|abr|may|jun|jul|ago|sep|set|oct|nov|dic)"
+_RE_FECHA = re.compile(
+    rf"\b(?:\d{{4}}-\d{{2}}-\d{{2}}|\d{{1,2}}/\d{{1,2}}(?:/\d{{2,4}})?|\d{{1,2}}[\s\-]{_MES}[a-z]*(?:[\s\-]\d{{2,4}})?)\b",
+    re.IGNORECASE,
+)
+_RE_MONTO = re.compile(r"(?<![\d.])-?\d{1,3}(?:\.\d{3})+(?![\d.])|(?<![\d.])\d{3,6}(?![\d.])")
+_RE_SALDOS = re.compile(r"SALDO (?:INICIAL|FINAL|TOTAL)|CUPO LINEA DE CREDITO", re.IGNORECASE)
+
+TABLE_KEYWORDS = (
+    "DETALLE DE MOVIMIENTOS", "MOVIMIENTOS", "CARGOS", "ABONOS", "DESCRIPCION", "DESCRIPCIÓN",
+    "DETALLE DE TRANSACCION", "COMPRAS NACIONALES", "TOTAL OPERACIONES", "CUOTA", "SUCURSAL", "DOCUMENTO",
+)
+HEADER_KEYWORDS = (
+    "CARTOLA", "ESTADO DE CUENTA", "TITULAR", "PERIODO", "PERÍODO", "CUENTA CORRIENTE",
+    "LINEA DE CREDITO", "LÍNEA DE CRÉDITO", "EJECUTIVO", "FECHA DESDE", "FECHA HASTA", "N° DE CUENTA",
+)
+
+
+@dataclass
+class PageClassification:
+    """Resultado de la clasificación: una etiqueta y una muestra de texto por página."""
+    labels: List[str] = field(default_factory=list)
+    texts: List[str] = field(default_factory=list)
+    native: List[bool] = field(default_factory=list)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "PageClassification":
+        return cls(labels=data.get("labels", []), texts=data.get("texts", []), native=data.get("native", []))
+
+    @property
+    def header_page(self) -> int:
+        """Índice (0-based) de la página a usar en Pass 1: la primera página relevante."""
+        for i, label in enumerate(self.labels):
+            if label != PAGE_IRRELEVANT:
+                return i
+        return 0
+
+    @property
+    def transaction_pages(self) -> List[int]:
+        return [i for i, label in enumerate(self.labels) if label == PAGE_TRANSACTIONS]
+
+    @property
+    def pages_to_render(self) -> List[int]:
+        return sorted(set([self.header_page] + self.transaction_pages))
+
+    @property
+    def transaction_dates(self) -> List[str]:
+        """Fechas de las filas de movimientos según la muestra de texto de cada página."""
+        return [f for i in self.transaction_pages if i < len(self.texts) for f in row_dates(self.texts[i])]
+
+
+def is_enabled() -> bool:
+    return os.getenv("PAGE_CLASSIFIER_ENABLED", "true").lower() in ("1", "true", "yes")
+
+
+def row_dates(text: str) -> List[str]:
+    """Fecha (texto sin interpretar) de cada línea con fecha y monto, excluyendo saldos."""
+    fechas = []
+    for line in (text or "").splitlines():
+        # Las filas de saldos (típicas de LC sin movimientos) no cuentan como movimientos
+        match = _RE_FECHA.search(line)
+        if not match or _RE_SALDOS.search(line):
+            continue
+        if _RE_MONTO.search(_RE_FECHA.sub(" ", line)):
+            fechas.append(match.group(0))
+    return fechas
+
+
+def count_rows(text: str) -> int:
+    """Cantidad de líneas con fecha y monto (candidatas a movimiento), excluyendo saldos."""
+    return len(row_dates(text))
+
+
+def classify_text(text: str) -> str:
+    """Etiqueta una página según palabras clave y cantidad de filas con fecha y monto."""
+    if not text or not text.strip():
+        # Sin señal: se asume tabla para no perder movimientos
+        return PAGE_TRANSACTIONS
+
+    upper = text.upper()
+    filas_movimiento = count_rows(text)
+
+    table_hits = sum(1 for k in TABLE_KEYWORDS if k in upper)
+    header_hits = sum(1 for k in HEADER_KEYWORDS if k in upper)
+
+    if filas_movimiento >= 3 or (filas_movimiento >= 1 and table_hits >= 1):
+        return PAGE_TRANSACTIONS
+    if header_hits >= 2:
+        return PAGE_HEADER
+    return PAGE_IRRELEVANT
+
+
+def _native_texts(file_content: bytes, password: Optional[str]) -> List[str]:
+    import pdfplumber
+    texts = []
+    with pdfplumber.open(io.BytesIO(file_content), password=password) as pdf:
+        for page in pdf.pages:
+            texts.append(page.extract_text() or "")
+    return texts
+
+
+def _ocr_samples(file_content: bytes, password: Optional[str], pages: List[int]) -> dict:
+    """OCR de baja resolución solo para las páginas indicadas (0-based)."""
+    from .image_utils import render_pages, ocr_image
+
+    samples = {}
+    try:
+        rendered = render_pages(file_content, password=password, pages=pages, dpi=SAMPLE_DPI, grayscale=True)
+    except Exception as e:
+        logger.warning(f"Muestreo OCR: no se pudieron rasterizar las páginas ({e})")
+        return {i: "" for i in pages}
+    for i in pages:
+        try:
+            samples[i] = ocr_image(rendered[i], lang="spa") if i in rendered else ""
+        except Exception as e:
+            logger.warning(f"Muestreo OCR falló en pág {i+1}: {e}")
+            samples[i] = ""
+    return samples
+
+
+def classify_pages(file_content: bytes, password: Optional[str] = None) -> Optional[PageClassification]:
+    """
+    Clasifica cada página del PDF como cabecera, tabla de transacciones o irrelevante.
+    Usa el texto nativo (pdfplumber) y, para páginas escaneadas, un muestreo OCR de baja resolución.
+    Retorna None si el clasificador está desactivado o falla (se procesan todas las páginas).
+    """
+    if not is_enabled():
+        return None
+    try:
+        texts = _native_texts(file_content, password)
+    except Exception as e:
+        logger.warning(f"Clasificador: no se pudo leer texto nativo ({e}). Se procesarán todas las páginas.")
+        return None
+
+    scanned = [i for i, t in enumerate(texts) if len(t.strip()) < MIN_NATIVE_CHARS]
+    native = [i not in scanned for i in range(len(texts))]
+    if scanned:
+        for i, sample in _ocr_samples(file_content, password, scanned).items():
+            texts[i] = sample
+
+    labels = [classify_text(t) for t in texts]
+    logger.info(f"Clasificación de páginas: {labels}")
+    return PageClassification(labels=labels, texts=texts, native=native)
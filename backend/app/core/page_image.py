@@ -0,0 +1,81 @@
+import io
+import base64
+import hashlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class PageImage:
+    """
+    Página rasterizada que viaja por el pipeline como bytes codificados (JPEG) una sola vez.
+    La decodificación PIL, el base64 y el data-URL se generan solo cuando alguien los pide,
+    y release() libera la memoria apenas la página deja de necesitarse.
+    """
+    __slots__ = ("page", "mime", "_data", "_pil", "_sha256")
+
+    def __init__(self, data: bytes, page: int, mime: str = "image/jpeg"):
+        self.page = page
+        self.mime = mime
+        self._data = data
+        self._pil = None
+        self._sha256 = None
+
+    @property
+    def data(self) -> bytes:
+        if self._data is None:
+            raise ValueError(f"La imagen de la página {self.page + 1} ya fue liberada.")
+        return self._data
+
+    @property
+    def sha256(self) -> str:
+        if self._sha256 is None:
+            self._sha256 = hashlib.sha256(self.data).hexdigest()
+        return self._sha256
+
+    def pil(self):
+        """Imagen PIL decodificada de forma perezosa (se conserva hasta release)."""
+        if self._pil is None:
+            from PIL import Image
+            self._pil = Image.open(io.BytesIO(self.data))
+        return self._pil
+
+    def base64(self) -> str:
+        # No se cachea: el base64 ocupa un 33% más que los bytes y solo se usa al armar la petición
+        return base64.b64encode(self.data).decode("utf-8")
+
+    def data_url(self) -> str:
+        return f"data:{self.mime};base64,{self.base64()}"
+
+    def release(self):
+        """Libera bytes e imagen decodificada."""
+        if self._pil is not None:
+            self._pil.close()
+        self._pil = None
+        self._data = None
+
+    @property
+    def released(self) -> bool:
+        return self._data is None
+
+    def __len__(self) -> int:
+        return len(self._data) if self._data is not None else 0
+
+    def __repr__(self) -> str:
+        estado = "liberada" if self.released else f"{len(self)} bytes"
+        return f"PageImage(page={self.page}, {estado})"
+
+
+def release_all(images) -> None:
+    """Libera una colección (lista o dict) de PageImage."""
+    values = images.values() if isinstance(images, dict) else images
+    for img in values:
+        if isinstance(img, PageImage):
+            img.release()
+
+
+def image_url(image) -> str:
+    """Data-URL para la API de visión. Acepta PageImage o un string base64 (scripts de exploración)."""
+    if isinstance(image, PageImage):
+        return image.data_url()
+    return f"data:image/jpeg;base64,{image}"
@@ -0,0 +1,97 @@
+import io
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional, Tuple
+from .exceptions import PasswordRequiredError, InvalidPasswordError
+
+logger = logging.getLogger(__name__)
+
+# Cachés en proceso: hash de archivo -> contraseña y (origen, tipo_doc) -> última contraseña exitosa
+_password_by_file: "OrderedDict[str, Optional[str]]" = OrderedDict()
+_password_by_type: Dict[Tuple[str, str], str] = {}
+_cache_lock = threading.Lock()
+
+NO_PASSWORD = None
+MAX_CACHED_FILES = 1024
+
+
+def is_encrypted(file_content: bytes) -> bool:
+    """Chequeo barato: un PDF cifrado declara /Encrypt en su trailer o xref stream."""
+    return file_content.startswith(b"%PDF") and b"/Encrypt" in file_content
+
+
+def _try_password(file_content: bytes, password: str) -> Optional[bool]:
+    """
+    Intenta abrir el diccionario de cifrado con pdfminer (solo xref y trailer, sin páginas).
+    Retorna True si la contraseña abre el documento, False si es incorrecta y None si el
+    cifrado no es soportado por pdfminer (se delega la validación a poppler).
+    """
+    from pdfminer.pdfparser import PDFParser
+    from pdfminer.pdfdocument import PDFDocument, PDFPasswordIncorrect
+
+    try:
+        PDFDocument(PDFParser(io.BytesIO(file_content)), password=password)
+        return True
+    except PDFPasswordIncorrect:
+        return False
+    except Exception as e:
+        logger.warning(f"Sonda de cifrado no concluyente: {e}")
+        return None
+
+
+def resolve_password(file_content: bytes, file_hash: str, origen: str, tipo_doc: str,
+                     supplied: Iterable[str] = (), keychain: Iterable[Tuple[str, str, str]] = ()) -> Optional[str]:
+    """
+    Resuelve la contraseña de un PDF antes de rasterizarlo.
+    Orden de candidatos: contraseñas del llamador, caché en proceso, llavero del mismo
+    origen/tipo y resto del llavero. Retorna None si el PDF no requiere contraseña.
+    Lanza PasswordRequiredError o InvalidPasswordError si ningún candidato funciona.
+    """
+    if not is_encrypted(file_content):
+        return NO_PASSWORD
+
+    with _cache_lock:
+        if file_hash in _password_by_file:
+            return _password_by_file[file_hash]
+        cached_type = _password_by_type.get((origen, tipo_doc))
+
+    supplied = [p for p in supplied if p]
+    keychain = list(keychain)
+    candidates = []
+    for pw in (
+        supplied
+        + [cached_type]
+        + [k[2] for k in keychain if (k[0], k[1]) == (origen, tipo_doc)]
+        + [k[2] for k in keychain if (k[0], k[1]) != (origen, tipo_doc)]
+    ):
+        if pw and pw not in candidates:
+            candidates.append(pw)
+
+    # Cifrado solo con contraseña de propietario: se abre con contraseña vacía
+    result = _try_password(file_content, "")
+    if result:
+        _remember(file_hash, origen, tipo_doc, NO_PASSWORD)
+        return NO_PASSWORD
+    if result is None:
+        # Cifrado no soportado por la sonda: se entrega el mejor candidato a poppler
+        return candidates[0] if candidates else NO_PASSWORD
+
+    for pw in candidates:
+        if _try_password(file_content, pw):
+            logger.info(f"Contraseña resuelta por sonda de cifrado para {origen} - {tipo_doc}.")
+            _remember(file_hash, origen, tipo_doc, pw)
+            return pw
+
+    if supplied:
+        raise InvalidPasswordError("La contraseña ingresada es incorrecta para este documento.", origen=origen, tipo_doc=tipo_doc)
+    raise PasswordRequiredError("Este archivo está protegido. Por favor, ingresa la contraseña.", origen=origen, tipo_doc=tipo_doc)
+
+
+def _remember(file_hash: str, origen: str, tipo_doc: str, password: Optional[str]):
+    with _cache_lock:
+        _password_by_file[file_hash] = password
+        while len(_password_by_file) > MAX_CACHED_FILES:
+            _password_by_file.popitem(last=False)
+        if password:
+            _password_by_type[(origen, tipo_doc)] = password
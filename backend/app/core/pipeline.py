@@ -0,0 +1,117 @@
+import json
+import logging
+from typing import Any, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+# Etapas del pipeline de ingesta, en orden. Cada una se refleja en archivos_fuente.estado_procesamiento
+ETAPA_REGISTRADO = "Registrado"
+ETAPA_ALMACENADO = "Almacenado"
+ETAPA_RASTERIZADO = "Rasterizado"
+ETAPA_OCR = "OCR_Completado"
+ETAPA_METADATOS = "Metadatos_Extraidos"
+ETAPA_TRANSACCIONES = "Transacciones_Extraidas"
+ETAPA_STAGING = "En_Staging"
+ETAPA_COMPLETADO = "Completado"
+
+ETAPAS = [
+    ETAPA_REGISTRADO,
+    ETAPA_ALMACENADO,
+    ETAPA_RASTERIZADO,
+    ETAPA_OCR,
+    ETAPA_METADATOS,
+    ETAPA_TRANSACCIONES,
+    ETAPA_STAGING,
+    ETAPA_COMPLETADO,
+]
+
+ESTADO_ERROR = "Error"
+# Valores anteriores al pipeline por etapas que el ENUM conserva para filas antiguas
+ESTADOS_LEGADOS = ["Cargado", "En_Proceso"]
+ESTADOS = ETAPAS + [ESTADO_ERROR] + ESTADOS_LEGADOS
+
+# Clave reservada que marca una etapa como completada
+_MARCA_ETAPA = "_etapa"
+
+
+class CheckpointStore:
+    """
+    Persistencia de checkpoints por archivo en checkpoints_procesamiento.
+    Guarda la salida de cada etapa (y de cada página en Pass 2) para que un reintento
+    continúe desde la última etapa completada sin repetir trabajo de IA ya terminado.
+    """
+
+    def __init__(self, db, archivo_id: int):
+        self.db = db
+        self.archivo_id = archivo_id
+        self._completed = None
+
+    def completed_stages(self) -> Set[str]:
+        if self._completed is None:
+            cursor = self.db.cursor()
+            cursor.execute(
+                "SELECT etapa FROM checkpoints_procesamiento WHERE archivo_id = %s AND clave = %s",
+                (self.archivo_id, _MARCA_ETAPA)
+            )
+            self._completed = {row[0] for row in cursor.fetchall()}
+            cursor.close()
+        return self._completed
+
+    def is_done(self, etapa: str) -> bool:
+        return etapa in self.completed_stages()
+
+    def last_stage(self) -> Optional[str]:
+        done = self.completed_stages()
+        for etapa in reversed(ETAPAS):
+            if etapa in done:
+                return etapa
+        return None
+
+    def get(self, etapa: str, clave: str) -> Any:
+        cursor = self.db.cursor()
+        cursor.execute(
+            "SELECT payload FROM checkpoints_procesamiento WHERE archivo_id = %s AND etapa = %s AND clave = %s",
+            (self.archivo_id, etapa, clave)
+        )
+        row = cursor.fetchone()
+        cursor.close()
+        if not row or row[0] is None:
+            return None
+        return json.loads(row[0]) if isinstance(row[0], (str, bytes)) else row[0]
+
+    def put(self, etapa: str, clave: str, payload: Any, commit: bool = True):
+        cursor = self.db.cursor()
+        cursor.execute("""
+            INSERT INTO checkpoints_procesamiento (archivo_id, etapa, clave, payload)
+            VALUES (%s, %s, %s, %s)
+            ON DUPLICATE KEY UPDATE payload = VALUES(payload)
+        """, (self.archivo_id, etapa, clave, json.dumps(payload, ensure_ascii=False, default=str)))
+        cursor.close()
+        if commit:
+            self.db.commit()
+
+    def mark(self, etapa: str, commit: bool = True):
+        """Marca la etapa como completada y avanza estado_procesamiento (nunca retrocede)."""
+        self.put(etapa, _MARCA_ETAPA, None, commit=False)
+        self.completed_stages().add(etapa)
+        cursor = self.db.cursor()
+        cursor.execute(
+            "UPDATE archivos_fuente SET estado_procesamiento = %s WHERE archivo_id = %s",
+            (self.last_stage(), self.archivo_id)
+        )
+        cursor.close()
+        if commit:
+            self.db.commit()
+        logger.info(f"archivo_id {self.archivo_id}: etapa '{etapa}' completada.")
+
+    def reset(self, desde_etapa: str):
+        """Descarta los checkpoints desde `desde_etapa` en adelante (ej: reprocesar la extracción)."""
+        etapas = ETAPAS[ETAPAS.index(desde_etapa):]
+        cursor = self.db.cursor()
+        cursor.execute(
+            f"DELETE FROM checkpoints_procesamiento WHERE archivo_id = %s AND etapa IN ({', '.join(['%s'] * len(etapas))})",
+            (self.archivo_id, *etapas)
+        )
+        cursor.close()
+        self.db.commit()
+        self._completed = None
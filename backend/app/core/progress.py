@@ -0,0 +1,108 @@
+import os
+import re
+import json
+import time
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+PROGRESS_DIR = os.getenv("PROGRESS_DIR", "storage/progress")
+# Los registros de progreso se borran pasado este tiempo (horas)
+PROGRESS_TTL_HOURS = float(os.getenv("PROGRESS_TTL_HOURS", "24"))
+
+EVENTO_INICIO = "inicio"
+# Eventos que cierran el seguimiento de un archivo
+EVENTOS_FINALES = {"completado", "duplicado", "error", "error_seguridad"}
+
+_ID_VALIDO = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+
+def is_valid_id(seguimiento_id: str) -> bool:
+    return bool(seguimiento_id and _ID_VALIDO.match(seguimiento_id))
+
+
+def _path(seguimiento_id: str) -> str:
+    return os.path.join(PROGRESS_DIR, f"{seguimiento_id}.ndjson")
+
+
+class ProgressTracker:
+    """
+    Publica eventos de avance de un archivo en storage/progress/<id>.ndjson.
+    Se usa un archivo (append) y no memoria para que el stream SSE funcione aunque
+    la carga y la suscripción caigan en workers uvicorn distintos. El evento de inicio
+    trunca el archivo: un id reutilizado no arrastra los eventos de la corrida anterior.
+    Sin seguimiento_id el tracker no escribe nada.
+    """
+
+    def __init__(self, seguimiento_id: Optional[str] = None):
+        self.seguimiento_id = seguimiento_id if is_valid_id(seguimiento_id) else None
+        self._inicio = time.monotonic()
+        self._ultimo = self._inicio
+        if self.seguimiento_id:
+            os.makedirs(PROGRESS_DIR, exist_ok=True)
+            _purge_expired()
+
+    @property
+    def enabled(self) -> bool:
+        return self.seguimiento_id is not None
+
+    def emit(self, evento: str, **datos):
+        if not self.enabled:
+            return
+        ahora = time.monotonic()
+        registro = {
+            "evento": evento,
+            "ts": time.time(),
+            "transcurrido_s": round(ahora - self._inicio, 3),
+            "desde_anterior_s": round(ahora - self._ultimo, 3),
+            **datos,
+        }
+        self._ultimo = ahora
+        try:
+            # Una sola escritura por línea en modo append: atómica para líneas cortas
+            modo = "w" if evento == EVENTO_INICIO else "a"
+            with open(_path(self.seguimiento_id), modo, encoding="utf-8") as f:
+                f.write(json.dumps(registro, ensure_ascii=False, default=str) + "\n")
+        except OSError as e:
+            logger.warning(f"No se pudo registrar progreso '{evento}' de {self.seguimiento_id}: {e}")
+
+
+def read_events(seguimiento_id: str, offset: int = 0) -> Tuple[List[Tuple[int, Dict[str, Any]]], int]:
+    """
+    Lee los eventos completos desde `offset` (bytes).
+    Retorna ([(offset_tras_el_evento, evento), ...], nuevo_offset).
+    Si el archivo es más corto que `offset`, una nueva corrida lo truncó y se lee desde el inicio.
+    """
+    try:
+        with open(_path(seguimiento_id), "rb") as f:
+            if offset > os.fstat(f.fileno()).st_size:
+                offset = 0
+            f.seek(offset)
+            chunk = f.read()
+    except FileNotFoundError:
+        return [], offset
+
+    # Una línea sin salto final aún se está escribiendo: se relee en la próxima consulta
+    fin = chunk.rfind(b"\n") + 1
+    eventos = []
+    posicion = offset
+    for line in chunk[:fin].splitlines(keepends=True):
+        posicion += len(line)
+        if line.strip():
+            eventos.append((posicion, json.loads(line)))
+    return eventos, offset + fin
+
+
+def _purge_expired():
+    limite = time.time() - PROGRESS_TTL_HOURS * 3600
+    try:
+        for name in os.listdir(PROGRESS_DIR):
+            path = os.path.join(PROGRESS_DIR, name)
+            try:
+                if os.path.getmtime(path) < limite:
+                    os.remove(path)
+            except OSError:
+                continue
+    except OSError:
+        pass
@@ -0,0 +1,199 @@
+import os
+import logging
+from dataclasses import dataclass
+from typing import Dict, List, Tuple
+import numpy as np
+from .page_image import PageImage
+
+logger = logging.getLogger(__name__)
+
+REGION_CABECERA = "cabecera"
+REGION_TABLA = "tabla"
+METODO_LINEAS = "lineas"
+METODO_ESPACIOS = "espacios"
+
+# Resolución y segmentación de Tesseract por tipo de región (la página se rasteriza a 200 dpi)
+TABLE_DPI = int(os.getenv("OCR_ROI_TABLE_DPI", "200"))
+HEADER_DPI = int(os.getenv("OCR_ROI_HEADER_DPI", "150"))
+TABLE_CONFIG = os.getenv("OCR_ROI_TABLE_CONFIG", "--psm 6 -c preserve_interword_spaces=1")
+HEADER_CONFIG = os.getenv("OCR_ROI_HEADER_CONFIG", "--psm 4")
+
+# El análisis corre sobre la página submuestreada: a 100 dpi sobra para ver líneas y columnas
+STEP = 2
+INK_THRESHOLD = 160
+# Fila con tinta en al menos esta fracción del ancho: línea de regla (o banda sombreada)
+RULE_MIN_FILL = 0.45
+# Hueco mínimo entre columnas, en fracción del ancho
+COL_GAP = 0.015
+MIN_COLUMNS = 3
+MIN_TABLE_LINES = 3
+# Renglones no tabulares tolerados dentro de una tabla (descripciones partidas, subtítulos)
+MAX_GAP_LINES = 2
+PADDING = 0.008
+
+
+def is_enabled() -> bool:
+    return os.getenv("OCR_ROI_ENABLED", "true").lower() in ("1", "true", "yes")
+
+
+@dataclass
+class Region:
+    """Rectángulo de la página en fracciones (0-1) y cómo se detectó."""
+    tipo: str
+    x0: float
+    y0: float
+    x1: float
+    y1: float
+    metodo: str = METODO_ESPACIOS
+
+    @property
+    def box(self) -> Tuple[float, float, float, float]:
+        return self.x0, self.y0, self.x1, self.y1
+
+    @property
+    def area(self) -> float:
+        return (self.x1 - self.x0) * (self.y1 - self.y0)
+
+
+def _runs(mask: np.ndarray) -> List[Tuple[int, int]]:
+    """Tramos [inicio, fin) de valores verdaderos."""
+    bordes = np.flatnonzero(np.diff(np.concatenate(([0], mask.astype(np.int8), [0]))))
+    return list(zip(bordes[::2].tolist(), bordes[1::2].tolist()))
+
+
+def _text_lines(ink: np.ndarray) -> List[Dict[str, int]]:
+    """Renglones de texto con su extensión horizontal y número de columnas separadas por blancos."""
+    h, w = ink.shape
+    gap = max(2, int(w * COL_GAP))
+    lines = []
+    for top, bottom in _runs(ink.sum(axis=1) >= 2):
+        columnas = _runs(ink[top:bottom].any(axis=0))
+        segmentos = 1
+        for (_, fin), (inicio, _) in zip(columnas, columnas[1:]):
+            if inicio - fin >= gap:
+                segmentos += 1
+        lines.append({"top": top, "bottom": bottom, "x0": columnas[0][0], "x1": columnas[-1][1], "columnas": segmentos})
+    return lines
+
+
+def _tabular(line: Dict[str, int]) -> bool:
+    return line["columnas"] >= MIN_COLUMNS
+
+
+def _blocks_by_whitespace(lines: List[Dict[str, int]]) -> List[Tuple[int, int]]:
+    """Tramos de renglones (índices [inicio, fin]) con columnas alineadas."""
+    blocks = []
+    start = last = None
+    tabulares = 0
+    for i, line in enumerate(lines):
+        if _tabular(line):
+            if start is None or i - last - 1 > MAX_GAP_LINES:
+                if start is not None and tabulares >= MIN_TABLE_LINES:
+                    blocks.append((start, last))
+                start, tabulares = i, 0
+            last = i
+            tabulares += 1
+    if start is not None and tabulares >= MIN_TABLE_LINES:
+        blocks.append((start, last))
+    return blocks
+
+
+def _blocks_by_rulings(lines: List[Dict[str, int]], rulings: List[int]) -> List[Tuple[int, int]]:
+    """
+    Tramos entre líneas de regla consecutivas cuyos renglones son mayoritariamente tabulares.
+    Intervalos contiguos se unen (tablas con cada fila separada por una regla).
+    """
+    grupos: List[List[int]] = []
+    for arriba, abajo in zip(rulings, rulings[1:]):
+        dentro = [i for i, line in enumerate(lines) if line["top"] >= arriba and line["bottom"] <= abajo]
+        if dentro and 2 * sum(_tabular(lines[i]) for i in dentro) >= len(dentro):
+            if grupos and grupos[-1][-1] + 1 == dentro[0]:
+                grupos[-1].extend(dentro)
+            else:
+                grupos.append(dentro)
+    blocks = []
+    for grupo in grupos:
+        if sum(_tabular(lines[i]) for i in grupo) < MIN_TABLE_LINES:
+            continue
+        start = grupo[0]
+        # Encabezado de columnas sobre la primera regla
+        if start > 0 and _tabular(lines[start - 1]):
+            start -= 1
+        blocks.append((start, grupo[-1]))
+    return blocks
+
+
+def _region(tipo: str, lines: List[Dict[str, int]], metodo: str, w: int, h: int) -> Region:
+    return Region(
+        tipo,
+        max(0.0, min(l["x0"] for l in lines) / w - PADDING),
+        max(0.0, min(l["top"] for l in lines) / h - PADDING),
+        min(1.0, max(l["x1"] for l in lines) / w + PADDING),
+        min(1.0, max(l["bottom"] for l in lines) / h + PADDING),
+        metodo,
+    )
+
+
+def detect_regions(image: PageImage) -> List[Region]:
+    """
+    Tablas de movimientos y bloque de cabecera de una página rasterizada, de arriba abajo.
+    Primero se buscan tablas delimitadas por reglas horizontales; en el resto de la página,
+    tramos de renglones con columnas separadas por blancos. Pie y publicidad quedan fuera.
+    """
+    gray = np.asarray(image.pil().convert("L"))[::STEP, ::STEP]
+    h, w = gray.shape
+    ink = gray < INK_THRESHOLD
+    regla = ink.mean(axis=1) >= RULE_MIN_FILL
+    rulings = [(a + b) // 2 for a, b in _runs(regla)]
+    ink[regla] = False
+    lines = _text_lines(ink)
+    if not lines:
+        return []
+
+    blocks = [(b, METODO_LINEAS) for b in _blocks_by_rulings(lines, rulings)] if len(rulings) >= 2 else []
+    ocupados = {i for (a, b), _ in blocks for i in range(a, b + 1)}
+    for a, b in _blocks_by_whitespace(lines):
+        libres = [i for i in range(a, b + 1) if i not in ocupados]
+        if sum(_tabular(lines[i]) for i in libres) >= MIN_TABLE_LINES:
+            blocks.append(((libres[0], libres[-1]), METODO_ESPACIOS))
+    if not blocks:
+        return []
+    blocks.sort()
+
+    regions = []
+    primera = blocks[0][0][0]
+    if primera > 0:
+        regions.append(_region(REGION_CABECERA, lines[:primera], METODO_ESPACIOS, w, h))
+    for (a, b), metodo in blocks:
+        regions.append(_region(REGION_TABLA, lines[a:b + 1], metodo, w, h))
+    return regions
+
+
+def ocr_page(image: PageImage, lang: str = "spa", cabecera: bool = True) -> str:
+    """
+    OCR de una página de movimientos: solo cabecera y tablas, cada una con su segmentación y
+    resolución. Si no se detecta una tabla se hace OCR de la página completa como antes.
+    `cabecera=False` omite el bloque superior (se repite en las páginas de continuación).
+    """
+    from .image_utils import ocr_image, ocr_region
+
+    if is_enabled():
+        try:
+            regions = detect_regions(image)
+        except Exception as e:
+            logger.warning(f"OCR por regiones: detección falló en pág {image.page + 1}: {e}")
+            regions = []
+        if any(r.tipo == REGION_TABLA for r in regions):
+            partes = []
+            for r in regions:
+                if r.tipo == REGION_TABLA:
+                    partes.append(ocr_region(image, r.box, dpi=TABLE_DPI, lang=lang, config=TABLE_CONFIG))
+                elif cabecera:
+                    partes.append(ocr_region(image, r.box, dpi=HEADER_DPI, lang=lang, config=HEADER_CONFIG))
+            logger.info(
+                f"OCR por regiones pág {image.page + 1}: {len(regions)} regiones "
+                f"({', '.join(f'{r.tipo}/{r.metodo}' for r in regions)}), {sum(r.area for r in regions):.0%} de la página."
+            )
+            return "\n".join(p.strip() for p in partes if p.strip())
+        logger.info(f"OCR por regiones: sin tabla detectada en pág {image.page + 1}; OCR de página completa.")
+    return ocr_image(image, lang=lang)
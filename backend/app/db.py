@@ -1,6 +1,7 @@
 import mysql.connector
-from mysql.connector import Error
+from mysql.connector import Error, pooling
 import os
+import threading
 from dotenv import load_dotenv
 import logging
 
@@ -10,22 +11,60 @@ load_dotenv()
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# "mysql" (servicio db de docker-compose) o "sqlite" (archivo local en modo WAL, ver db_sqlite.py)
+DB_BACKEND = os.getenv("DB_BACKEND", "mysql").lower()
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "4"))
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def _mysql_config():
+    return {
+        "host": os.getenv("DB_HOST", "db"), # 'db' es el nombre del servicio en docker-compose
+        "user": os.getenv("DB_USER"),
+        "password": os.getenv("DB_PASSWORD"),
+        "database": os.getenv("DB_NAME"),
+        "port": 3306 # Puerto interno del contenedor
+    }
+
 def get_db_connection():
-    """Crea y retorna una conexión a la base de datos MySQL."""
+    """Crea y retorna una conexión a la base de datos configurada en DB_BACKEND."""
+    if DB_BACKEND == "sqlite":
+        from .db_sqlite import connect
+        try:
+            return connect()
+        except Exception as e:
+            logger.error(f"Error al abrir SQLite: {e}")
+            return None
     try:
-        connection = mysql.connector.connect(
-            host=os.getenv("DB_HOST", "db"), # 'db' es el nombre del servicio en docker-compose
-            user=os.getenv("DB_USER"),
-            password=os.getenv("DB_PASSWORD"),
-            database=os.getenv("DB_NAME"),
-            port=3306 # Puerto interno del contenedor
-        )
+        connection = mysql.connector.connect(**_mysql_config())
         if connection.is_connected():
             return connection
     except Error as e:
         logger.error(f"Error al conectar a MySQL: {e}")
         return None
 
+def get_pooled_connection(pool_size: int = None):
+    """
+    Conexión de un pool compartido por el proceso, para servicios de larga vida (vigilante de
+    carpetas). close() la devuelve al pool. `pool_size` solo aplica al crear el pool.
+    """
+    if DB_BACKEND == "sqlite":
+        # Abrir SQLite es barato y el esquema se aplica una vez por proceso
+        return get_db_connection()
+    global _pool
+    try:
+        if _pool is None:
+            with _pool_lock:
+                if _pool is None:
+                    _pool = pooling.MySQLConnectionPool(
+                        pool_name="zenith", pool_size=pool_size or DB_POOL_SIZE, pool_reset_session=True, **_mysql_config()
+                    )
+        return _pool.get_connection()
+    except Error as e:
+        logger.error(f"Error al obtener conexión del pool MySQL: {e}")
+        return None
+
 def get_db():
     """Generador para ser usado como dependencia en FastAPI."""
     db = get_db_connection()
@@ -0,0 +1,185 @@
+import os
+import re
+import sqlite3
+import logging
+import threading
+from datetime import date, datetime
+from decimal import Decimal
+from functools import lru_cache
+
+logger = logging.getLogger(__name__)
+
+SQLITE_PATH = os.getenv("DB_SQLITE_PATH", "storage/zenith.db")
+BUSY_TIMEOUT = float(os.getenv("DB_SQLITE_BUSY_TIMEOUT", "30"))
+_APP_DIR = os.path.dirname(os.path.abspath(__file__))
+# Dentro del contenedor database/ se monta en /app/database; en el repo está junto a backend/
+_SCHEMA_CANDIDATES = (
+    os.path.join(os.path.dirname(_APP_DIR), "database", "init_schema_sqlite.sql"),
+    os.path.join(os.path.dirname(os.path.dirname(_APP_DIR)), "database", "init_schema_sqlite.sql"),
+)
+
+# Bases con el esquema ya aplicado en este proceso
+_initialized = set()
+_init_lock = threading.Lock()
+
+
+def _to_date(value: bytes):
+    try:
+        return date.fromisoformat(value.decode()[:10])
+    except ValueError:
+        return value.decode()
+
+
+def _to_datetime(value: bytes):
+    try:
+        return datetime.fromisoformat(value.decode())
+    except ValueError:
+        return value.decode()
+
+
+# Tipos equivalentes a los que entrega mysql-connector (DATE -> date, DECIMAL -> Decimal)
+sqlite3.register_adapter(date, lambda d: d.isoformat())
+sqlite3.register_adapter(datetime, lambda d: d.isoformat(" "))
+sqlite3.register_adapter(Decimal, str)
+sqlite3.register_converter("DATE", _to_date)
+sqlite3.register_converter("TIMESTAMP", _to_datetime)
+sqlite3.register_converter("DATETIME", _to_datetime)
+sqlite3.register_converter("DECIMAL", lambda v: Decimal(v.decode()))
+
+_LITERAL_O_MARCADOR = re.compile(r"'(?:[^']|'')*'|%s|%%")
+_INSERT_IGNORE = re.compile(r"\bINSERT\s+IGNORE\b", re.IGNORECASE)
+_ON_DUPLICATE = re.compile(r"\bON\s+DUPLICATE\s+KEY\s+UPDATE\b", re.IGNORECASE)
+_VALUES_COLUMNA = re.compile(r"\bVALUES\((\w+)\)", re.IGNORECASE)
+_IF = re.compile(r"\bIF\(", re.IGNORECASE)
+_DATE_ADD = re.compile(r"\bDATE_ADD\(\s*([^,]+?)\s*,\s*INTERVAL\s+(\?|\d+)\s+(SECOND|MINUTE|HOUR|DAY)\s*\)", re.IGNORECASE)
+_NOW_MENOS = re.compile(r"\bNOW\(\)\s*-\s*INTERVAL\s+(\?|\d+)\s+(SECOND|MINUTE|HOUR|DAY)\b", re.IGNORECASE)
+_NOW = re.compile(r"\bNOW\(\)", re.IGNORECASE)
+
+
+@lru_cache(maxsize=512)
+def translate(sql: str) -> str:
+    """Traduce el dialecto MySQL usado por la app al de SQLite."""
+    sql = _LITERAL_O_MARCADOR.sub(lambda m: {"%s": "?", "%%": "%"}.get(m.group(0), m.group(0)), sql)
+    sql = _INSERT_IGNORE.sub("INSERT OR IGNORE", sql)
+    partes = _ON_DUPLICATE.split(sql, maxsplit=1)
+    if len(partes) == 2:
+        sql = partes[0] + "ON CONFLICT DO UPDATE SET" + _VALUES_COLUMNA.sub(r"excluded.\1", partes[1])
+    sql = _IF.sub("IIF(", sql)
+    sql = _DATE_ADD.sub(lambda m: f"datetime({m.group(1)}, '+' || {m.group(2)} || ' {m.group(3).lower()}s')", sql)
+    # CURRENT_TIMESTAMP de SQLite es UTC: NOW() también, para comparar contra creado_en
+    sql = _NOW_MENOS.sub(lambda m: f"datetime('now', '-' || {m.group(1)} || ' {m.group(2).lower()}s')", sql)
+    return _NOW.sub("datetime('now')", sql)
+
+
+def _year(value):
+    return int(str(value)[:4]) if value else None
+
+
+def _month(value):
+    return int(str(value)[5:7]) if value else None
+
+
+class SQLiteCursor:
+    """Cursor con la interfaz de mysql-connector que usa la app (dictionary=True, %s, rowcount, lastrowid)."""
+
+    def __init__(self, cursor: sqlite3.Cursor, dictionary: bool = False):
+        self._cursor = cursor
+        self._dictionary = dictionary
+
+    def _row(self, row):
+        if row is None or not self._dictionary:
+            return row
+        return {d[0]: v for d, v in zip(self._cursor.description, row)}
+
+    def execute(self, sql: str, params=None):
+        self._cursor.execute(translate(sql), tuple(params) if params else ())
+        return self
+
+    def executemany(self, sql: str, seq_params):
+        self._cursor.executemany(translate(sql), [tuple(p) for p in seq_params])
+        return self
+
+    def fetchone(self):
+        return self._row(self._cursor.fetchone())
+
+    def fetchmany(self, size: int = 1):
+        return [self._row(r) for r in self._cursor.fetchmany(size)]
+
+    def fetchall(self):
+        return [self._row(r) for r in self._cursor.fetchall()]
+
+    def __iter__(self):
+        return (self._row(r) for r in self._cursor)
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    @property
+    def lastrowid(self):
+        return self._cursor.lastrowid
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    def close(self):
+        self._cursor.close()
+
+
+class SQLiteConnection:
+    """
+    Conexión SQLite (modo WAL) con la interfaz de MySQLConnection que usan los parsers y
+    servicios. Las sentencias se escriben en dialecto MySQL y se traducen al ejecutar.
+    """
+
+    def __init__(self, path: str = None):
+        self.path = path or SQLITE_PATH
+        if self.path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        # IMMEDIATE: la primera escritura toma el lock de escritura esperando busy_timeout
+        self._conn = sqlite3.connect(
+            self.path, timeout=BUSY_TIMEOUT, detect_types=sqlite3.PARSE_DECLTYPES,
+            check_same_thread=False, isolation_level="IMMEDIATE"
+        )
+        self._conn.execute("PRAGMA journal_mode = WAL")
+        self._conn.execute("PRAGMA synchronous = NORMAL")
+        self._conn.execute("PRAGMA foreign_keys = ON")
+        self._conn.create_function("YEAR", 1, _year, deterministic=True)
+        self._conn.create_function("MONTH", 1, _month, deterministic=True)
+        self._open = True
+        self._ensure_schema()
+
+    def _ensure_schema(self):
+        with _init_lock:
+            if self.path in _initialized and self.path != ":memory:":
+                return
+            ruta = os.getenv("DB_SQLITE_SCHEMA") or next((p for p in _SCHEMA_CANDIDATES if os.path.exists(p)), None)
+            if ruta is None:
+                raise FileNotFoundError("No se encontró database/init_schema_sqlite.sql (definir DB_SQLITE_SCHEMA).")
+            with open(ruta, "r", encoding="utf-8") as f:
+                self._conn.executescript(f.read())
+            self._conn.commit()
+            _initialized.add(self.path)
+            logger.info(f"Esquema SQLite aplicado en {self.path}.")
+
+    def cursor(self, dictionary: bool = False, buffered: bool = None):
+        return SQLiteCursor(self._conn.cursor(), dictionary=dictionary)
+
+    def commit(self):
+        self._conn.commit()
+
+    def rollback(self):
+        self._conn.rollback()
+
+    def is_connected(self) -> bool:
+        return self._open
+
+    def close(self):
+        if self._open:
+            self._conn.close()
+            self._open = False
+
+
+def connect(path: str = None) -> SQLiteConnection:
+    return SQLiteConnection(path)
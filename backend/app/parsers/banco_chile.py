@@ -4,97 +4,131 @@ import io
 import json
 import logging
 import hashlib
-import base64
 from typing import Dict, Any
-from ..core.base_parser import BaseParser
-from PIL import Image
-import pytesseract
+from datetime import datetime
+from ..core.base_parser import BaseParser, ParseContext
+from ..core.normalization import parse_date, parse_amount, period_reference
+from ..core.page_image import PageImage, release_all
+from ..core.page_classifier import count_rows
+from ..core.pipeline import ETAPA_RASTERIZADO, ETAPA_OCR, ETAPA_METADATOS, ETAPA_TRANSACCIONES
 
 logger = logging.getLogger(__name__)
 
 class BancoChileParser(BaseParser):
-    def parse(self, file_content: bytes, password: str = None) -> Dict[str, Any]:
-        """Extrae datos usando la estrategia Two-Pass IA Vision con soporte de password."""
-        from ..core.image_utils import pdf_to_base64_images
+    staging_table = "staging_banco_chile"
+
+    def parse(self, ctx: ParseContext, file_content: bytes) -> Dict[str, Any]:
+        """Extrae datos usando la estrategia Two-Pass IA Vision con soporte de password y checkpoints."""
+        from ..core.image_utils import pdf_to_page_images
+        
+        logger.info(f"Iniciando procesamiento Two-Pass para archivo_id: {ctx.archivo_id}")
         
-        logger.info(f"Iniciando procesamiento Two-Pass para archivo_id: {self.archivo_id}")
+        # Clasificación barata de páginas: solo se rasterizan cabecera y tablas de movimientos
+        classification = self._classify(ctx, file_content)
+        pages = classification.pages_to_render if classification else None
+        if classification:
+            ctx.progress.emit("clasificacion", paginas=len(classification.labels), paginas_a_procesar=len(pages))
         
         # Pasar la contraseña a la conversión visual
-        images = pdf_to_base64_images(file_content, password=password)
-        if not images:
+        rendered = pdf_to_page_images(
+            file_content, password=ctx.password, pages=pages,
+            on_page=lambda n, total: ctx.progress.emit("pagina_rasterizada", pagina=n, total=total)
+        )
+        if not rendered:
             raise ValueError("No se pudieron extraer imágenes del PDF del Banco de Chile.")
-            
-        all_transactions = []
-        
-        # Pass 1: Metadatos
-        logger.info("--- Banco Chile Pass 1 (Metadata) ---")
-        consolidated_metadata = self.ai_service.extract_metadata(images[0], "Banco_Chile")
+        images = {img.page: img for img in rendered}
+        header_page = classification.header_page if classification else 0
+        tx_pages = classification.transaction_pages if classification else sorted(images)
+        try:
+            self._mark_stage(ctx, ETAPA_RASTERIZADO)
         
-        from datetime import datetime
-        year_to_use = str(datetime.now().year)
+            # Texto digital u OCR de las páginas con movimientos
+            pdf_text_content = self._checkpointed(ctx, ETAPA_OCR, "texto", lambda: self._extract_text(
+                file_content, ctx.password, classification, images, tx_pages
+            )) if tx_pages else ""
+            self._mark_stage(ctx, ETAPA_OCR)
+            ctx.progress.emit("ocr_completado", caracteres=len(pdf_text_content))
+            
+            # Pass 1: Metadatos
+            logger.info("--- Banco Chile Pass 1 (Metadata) ---")
+            consolidated_metadata = self._checkpointed(ctx, ETAPA_METADATOS, "pass1", lambda: self._extract_metadata(
+                ctx, file_content, images[header_page], "Banco_Chile", header_page, classification
+            ))
+            self._mark_stage(ctx, ETAPA_METADATOS)
+            ctx.progress.emit("pass1_completado")
+            if header_page not in tx_pages:
+                images[header_page].release()
         
-        if consolidated_metadata:
-            p_desde = consolidated_metadata.get("periodo_desde", "")
-            if p_desde and "/" in p_desde:
-                parts = p_desde.split("/")
-                if len(parts) >= 3:
-                    y = parts[2]
-                    year_to_use = f"20{y}" if len(y) == 2 else y
+            ref_year, ref_month = period_reference(consolidated_metadata)
+            year_to_use = str(ref_year or datetime.now().year)
         
+            if not tx_pages:
+                logger.info("El clasificador no detectó tablas de movimientos (típico en LC). Se omite Pass 2.")
+                return {
+                    "transactions": [],
+                    "metadata": consolidated_metadata
+                }
+            
+            # Pass 2: Transacciones (checkpoint por página para no repetir llamadas ya completadas)
+            all_transactions = []
+            for n, i in enumerate(tx_pages):
+                text_to_send = pdf_text_content if (n == 0 and len(pdf_text_content) > 50) else None
+                logger.info(f"--- Banco Chile Pass 2 (Transacciones Pag {i+1}) ---")
+                txs = self._checkpointed(ctx, ETAPA_TRANSACCIONES, "texto" if text_to_send else f"pagina_{i+1}", lambda: self.ai_service.extract_transactions(
+                    images[i], "Banco_Chile", year_to_use, text_content=text_to_send, reference_month=ref_month,
+                    expected_rows=count_rows(classification.texts[i]) if classification else None
+                ))
+                all_transactions.extend(txs)
+                images[i].release()
+                ctx.progress.emit("pass2_pagina", pagina=i + 1, filas=len(txs), filas_acumuladas=len(all_transactions))
+                if text_to_send: break
+            
+            return {
+                "transactions": all_transactions,
+                "metadata": consolidated_metadata
+            }
+        finally:
+            # Las páginas solo se necesitan durante OCR y los pases IA
+            release_all(images)
+
+    def _extract_text(self, file_content: bytes, password: str, classification, images: Dict[int, PageImage], tx_pages) -> str:
+        """Texto nativo de las páginas con movimientos; OCR Tesseract si es insuficiente."""
+        from ..core.table_regions import ocr_page
+
         # Extracción de texto digital (opcional, pdfplumber puede fallar con clave)
         pdf_text_content = ""
-        try:
-            # Nota: para pdfplumber también podríamos pasar la contraseña si fuera necesario
-            with pdfplumber.open(io.BytesIO(file_content), password=password) as pdf:
-                for page in pdf.pages:
-                    text = page.extract_text()
-                    if text:
-                        pdf_text_content += text + "\n"
-        except Exception as e:
-            logger.warning(f"No se pudo extraer texto nativo con pdfplumber: {e}")
+        if classification and all(classification.native[i] for i in tx_pages):
+            # El clasificador ya leyó el texto nativo de cada página
+            pdf_text_content = "\n".join(classification.texts[i] for i in tx_pages) + "\n"
+        elif not classification:
+            try:
+                with pdfplumber.open(io.BytesIO(file_content), password=password) as pdf:
+                    for page in pdf.pages:
+                        text = page.extract_text()
+                        if text:
+                            pdf_text_content += text + "\n"
+            except Exception as e:
+                logger.warning(f"No se pudo extraer texto nativo con pdfplumber: {e}")
             
-        # Fallback a OCR
+        # Fallback a OCR (solo páginas con movimientos)
         if len(pdf_text_content.strip()) < 100:
             logger.info("Texto nativo insuficiente. Iniciando OCR Tesseract Fallback...")
             ocr_text_list = []
-            for i, img_b64 in enumerate(images):
+            for n, i in enumerate(tx_pages):
                 try:
-                    img_data = base64.b64decode(img_b64)
-                    img = Image.open(io.BytesIO(img_data))
-                    text_page = pytesseract.image_to_string(img, lang='spa')
+                    # Solo cabecera y tablas de movimientos; la cabecera se repite en las páginas siguientes
+                    text_page = ocr_page(images[i], lang='spa', cabecera=(n == 0))
                     ocr_text_list.append(f"--- PAGINA {i+1} ---\n{text_page}")
                 except Exception as e:
                     logger.error(f"Error en OCR Pag {i+1}: {e}")
             pdf_text_content = "\n".join(ocr_text_list)
-            
-        # Pass 2: Transacciones
-        for i, img_b64 in enumerate(images):
-            text_to_send = pdf_text_content if (i == 0 and len(pdf_text_content) > 50) else None
-            logger.info(f"--- Banco Chile Pass 2 (Transacciones Pag {i+1}) ---")
-            txs = self.ai_service.extract_transactions(img_b64, "Banco_Chile", year_to_use, text_content=text_to_send)
-            all_transactions.extend(txs)
-            if text_to_send: break
-            
-        return {
-            "transactions": all_transactions,
-            "metadata": consolidated_metadata
-        }
+        return pdf_text_content
 
-    def save_metadata(self, metadata: Dict[str, Any]):
+    def save_metadata(self, ctx: ParseContext, metadata: Dict[str, Any]):
         """Persiste la información de cabecera en metadatos_documento."""
         if not metadata: return
         cursor = self.db.cursor()
         
-        def parse_date(date_str):
-            if not date_str or date_str == "N/A": return None
-            try:
-                if "/" in date_str:
-                    d, m, y = date_str.split("/")
-                    year = f"20{y}" if len(y) == 2 else y
-                    return f"{year}-{m.zfill(2)}-{d.zfill(2)}"
-                return date_str
-            except: return None
-
         sql = """
             INSERT INTO metadatos_documento 
             (archivo_id, entidad_emisora, titular, identificador_cuenta, periodo_desde, periodo_hasta, atributos_adicionales)
@@ -102,7 +136,7 @@ class BancoChileParser(BaseParser):
         """
         atributos_json = json.dumps(metadata.get("atributos_adicionales", {}))
         values = (
-            self.archivo_id,
+            ctx.archivo_id,
             "Banco de Chile",
             metadata.get("titular"),
             metadata.get("cuenta"),
@@ -111,13 +145,13 @@ class BancoChileParser(BaseParser):
             atributos_json
         )
         cursor.execute(sql, values)
-        self.db.commit()
+        self._commit(ctx)
         cursor.close()
 
-    def save_to_staging(self, data: Dict[str, Any]):
+    def save_to_staging(self, ctx: ParseContext, data: Dict[str, Any]):
         """Guarda en staging_banco_chile."""
         if "metadata" in data:
-            self.save_metadata(data["metadata"])
+            self.save_metadata(ctx, data["metadata"])
             
         if not data.get("transactions"):
             logger.warning("No se encontraron transacciones devueltas por la IA. El documento podría estar vacío de movimientos (típico en LC).")
@@ -134,30 +168,33 @@ class BancoChileParser(BaseParser):
             monto = tx.get("monto", 0)
             es_gasto = tx.get("tipo") == "Gasto"
             values = (
-                self.archivo_id, 
+                ctx.archivo_id, 
                 tx.get("fecha"), 
                 tx.get("descripcion"), 
                 str(monto) if es_gasto else "0",
                 str(monto) if not es_gasto else "0",
-                tx.get("categoria", "Otros")
+                tx.get("categoria")
             )
             cursor.execute(sql, values)
             
-        self.db.commit()
+        self._commit(ctx)
         cursor.close()
 
-    def consolidate(self):
+    def consolidate(self, ctx: ParseContext):
         """Mueve a transacciones_consolidadas pasándolas por el motor de categorización híbrido."""
         from ..services.categorization import CategorizationService
+        from ..services.merchant_normalizer import MerchantNormalizer
         cat_service = CategorizationService(self.db)
         
         cursor = self.db.cursor(dictionary=True)
-        cursor.execute("SELECT * FROM staging_banco_chile WHERE archivo_id = %s", (self.archivo_id,))
+        cursor.execute("SELECT * FROM staging_banco_chile WHERE archivo_id = %s", (ctx.archivo_id,))
         rows = cursor.fetchall()
+        # Cada glosa distinta se normaliza una vez (caché del proceso + comercios_normalizados)
+        comercios = MerchantNormalizer(self.db).canonical_many(row["descripcion_cruda"] for row in rows)
 
         for row in rows:
-            cargo = float(row["monto_cheques_cargos"]) if row["monto_cheques_cargos"] else 0.0
-            abono = float(row["monto_depositos_abonos"]) if row["monto_depositos_abonos"] else 0.0
+            cargo = parse_amount(row["monto_cheques_cargos"], default=0.0)
+            abono = parse_amount(row["monto_depositos_abonos"], default=0.0)
             monto = cargo if cargo > 0 else abono
             tipo = "Gasto" if cargo > 0 else "Ingreso"
             
@@ -167,25 +204,36 @@ class BancoChileParser(BaseParser):
                 logger.info(f"Omitiendo fila de balance detectada erróneamente: {row['descripcion_cruda']}")
                 continue
             
+            # Sin fecha interpretable no se consolida: una fecha inventada falsea periodos y métricas
+            fecha = parse_date(row["fecha_texto"])
+            if not fecha:
+                logger.warning(f"Omitiendo fila con fecha no interpretable '{row['fecha_texto']}': {row['descripcion_cruda']}")
+                continue
+
             # Hybrid categorization
-            cat_id = cat_service.categorizar(row["descripcion_cruda"], row.get("categoria_sugerida"))
+            cat_id, origen_cat = cat_service.clasificar(
+                row["descripcion_cruda"], row.get("categoria_sugerida"), comercios[row["descripcion_cruda"]]
+            )
             
-            tx_raw_string = f"{row['fecha_texto']}_{row['descripcion_cruda']}_{monto}_{self.archivo_id}"
+            tx_raw_string = f"{row['fecha_texto']}_{row['descripcion_cruda']}_{monto}_{ctx.archivo_id}"
             tx_id = hashlib.sha256(tx_raw_string.encode()).hexdigest()
 
             sql = """
                 INSERT IGNORE INTO transacciones_consolidadas 
-                (transaccion_id, archivo_id, fecha_transaccion, descripcion_limpia, monto, tipo, categoria_id)
-                VALUES (%s, %s, %s, %s, %s, %s, %s)
+                (transaccion_id, archivo_id, fecha_transaccion, descripcion_limpia, comercio_clave, monto, tipo, categoria_id,
+                 fue_clasificado_por_ia)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
             """
             cursor.execute(sql, (
                 tx_id, 
-                self.archivo_id, 
-                row["fecha_texto"], 
+                ctx.archivo_id, 
+                fecha,
                 row["descripcion_cruda"].strip(), 
+                comercios[row["descripcion_cruda"]],
                 monto, 
                 tipo,
-                cat_id
+                cat_id,
+                origen_cat in ("vecino", "ia")  # inferida (vecino o IA): no alimenta el índice de vecinos
             ))
-        self.db.commit()
+        self._commit(ctx)
         cursor.close()
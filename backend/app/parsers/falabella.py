@@ -3,17 +3,20 @@ import io
 import json
 import logging
 import hashlib
-import base64
 from typing import Dict, Any
 from datetime import datetime
-from ..core.base_parser import BaseParser
-from PIL import Image
-import pytesseract
+from ..core.base_parser import BaseParser, ParseContext
+from ..core.normalization import parse_date, parse_dates, parse_amount, parse_amounts, period_reference
+from ..core.page_image import PageImage, release_all
+from ..core.page_classifier import count_rows
+from ..core.pipeline import ETAPA_RASTERIZADO, ETAPA_OCR, ETAPA_METADATOS, ETAPA_TRANSACCIONES
 
 logger = logging.getLogger(__name__)
 
 class FalabellaParser(BaseParser):
-    def parse(self, file_content: bytes, password: str = None) -> Dict[str, Any]:
+    staging_table = "staging_falabella"
+
+    def parse(self, ctx: ParseContext, file_content: bytes) -> Dict[str, Any]:
         """Extrae datos de cartolas de Falabella soportando XLS/XLSX y PDF (IA Two-Pass)."""
         
         # Deteccion mas robusta: por firma de archivo o por extension
@@ -24,58 +27,91 @@ class FalabellaParser(BaseParser):
             pass
 
         if is_pdf:
-            return self._parse_pdf(file_content, password=password)
+            return self._parse_pdf(ctx, file_content)
         else:
             return self._parse_excel(file_content)
 
-    def _parse_pdf(self, file_content: bytes, password: str = None) -> Dict[str, Any]:
-        """Estrategia Two-Pass IA Vision + OCR Fallback para PDFs."""
-        from ..core.image_utils import pdf_to_base64_images
+    def _parse_pdf(self, ctx: ParseContext, file_content: bytes) -> Dict[str, Any]:
+        """Estrategia Two-Pass IA Vision + OCR Fallback para PDFs, con checkpoints por etapa."""
+        from ..core.image_utils import pdf_to_page_images
+        
+        logger.info(f"Iniciando procesamiento Inteligente (PDF) para Falabella. Archivo ID: {ctx.archivo_id}")
         
-        logger.info(f"Iniciando procesamiento Inteligente (PDF) para Falabella. Archivo ID: {self.archivo_id}")
+        # Clasificación barata de páginas: cupones de pago y textos legales no se rasterizan ni se envían a la IA
+        classification = self._classify(ctx, file_content)
+        pages = classification.pages_to_render if classification else None
+        if classification:
+            ctx.progress.emit("clasificacion", paginas=len(classification.labels), paginas_a_procesar=len(pages))
         
-        images = pdf_to_base64_images(file_content, password=password)
-        if not images:
+        rendered = pdf_to_page_images(
+            file_content, password=ctx.password, pages=pages,
+            on_page=lambda n, total: ctx.progress.emit("pagina_rasterizada", pagina=n, total=total)
+        )
+        if not rendered:
             raise ValueError("No se pudieron extraer imágenes del PDF de Falabella.")
+        images = {img.page: img for img in rendered}
+        header_page = classification.header_page if classification else 0
+        tx_pages = classification.transaction_pages if classification else sorted(images)
+        try:
+            self._mark_stage(ctx, ETAPA_RASTERIZADO)
+
+            # Extracción de texto (OCR Fallback)
+            pdf_text_content = self._checkpointed(ctx, ETAPA_OCR, "texto", lambda: self._ocr_pages(images, tx_pages)) if tx_pages else ""
+            self._mark_stage(ctx, ETAPA_OCR)
+            ctx.progress.emit("ocr_completado", caracteres=len(pdf_text_content))
             
-        # Pass 1: Metadatos
-        logger.info("--- Falabella Pass 1 (Metadata) ---")
-        consolidated_metadata = self.ai_service.extract_metadata(images[0], "Falabella")
+            # Pass 1: Metadatos
+            logger.info("--- Falabella Pass 1 (Metadata) ---")
+            consolidated_metadata = self._checkpointed(ctx, ETAPA_METADATOS, "pass1", lambda: self._extract_metadata(
+                ctx, file_content, images[header_page], "Falabella", header_page, classification
+            ))
+            self._mark_stage(ctx, ETAPA_METADATOS)
+            ctx.progress.emit("pass1_completado")
+            if header_page not in tx_pages:
+                images[header_page].release()
         
-        year_to_use = str(datetime.now().year)
-        if consolidated_metadata:
-            p_desde = consolidated_metadata.get("periodo_desde", "")
-            if p_desde and "-" in p_desde:
-                year_to_use = p_desde.split("-")[0]
-            elif p_desde and "/" in p_desde:
-                parts = p_desde.split("/")
-                if len(parts) >= 3:
-                     y = parts[2]
-                     year_to_use = f"20{y}" if len(y) == 2 else y
-
-        # Extracción de texto (OCR Fallback)
+            ref_year, ref_month = period_reference(consolidated_metadata)
+            year_to_use = str(ref_year or datetime.now().year)
+
+            if not tx_pages:
+                logger.info("El clasificador no detectó tablas de movimientos. Se omite Pass 2.")
+                return {
+                    "transactions": [],
+                    "metadata": consolidated_metadata
+                }
+
+            # Pass 2: Transacciones (checkpoint por página para no repetir llamadas ya completadas)
+            all_transactions = []
+            for n, i in enumerate(tx_pages):
+                text_to_send = pdf_text_content if (n == 0 and len(pdf_text_content) > 50) else None
+                logger.info(f"--- Falabella Pass 2 (Transacciones Pag {i+1}) ---")
+                txs = self._checkpointed(ctx, ETAPA_TRANSACCIONES, "texto" if text_to_send else f"pagina_{i+1}", lambda: self.ai_service.extract_transactions(
+                    images[i], "Falabella", year_to_use, text_content=text_to_send, reference_month=ref_month,
+                    expected_rows=count_rows(classification.texts[i]) if classification else None
+                ))
+                all_transactions.extend(txs)
+                images[i].release()
+                ctx.progress.emit("pass2_pagina", pagina=i + 1, filas=len(txs), filas_acumuladas=len(all_transactions))
+                if text_to_send: break
+
+            return {
+                "transactions": all_transactions,
+                "metadata": consolidated_metadata
+            }
+        finally:
+            # Las páginas solo se necesitan durante OCR y los pases IA
+            release_all(images)
+
+    def _ocr_pages(self, images: Dict[int, PageImage], tx_pages) -> str:
+        """OCR Tesseract de las regiones de cabecera y movimientos de cada página."""
+        from ..core.table_regions import ocr_page
+
         logger.info("Activando OCR Tesseract Fallback para Falabella...")
         ocr_text_list = []
-        for i, img_b64 in enumerate(images):
-            img_data = base64.b64decode(img_b64)
-            img = Image.open(io.BytesIO(img_data))
-            text_page = pytesseract.image_to_string(img, lang='spa')
+        for n, i in enumerate(tx_pages):
+            text_page = ocr_page(images[i], lang='spa', cabecera=(n == 0))
             ocr_text_list.append(f"--- FALA PAG {i+1} ---\n{text_page}")
-        pdf_text_content = "\n".join(ocr_text_list)
-
-        # Pass 2: Transacciones
-        all_transactions = []
-        for i, img_b64 in enumerate(images):
-            text_to_send = pdf_text_content if (i == 0 and len(pdf_text_content) > 50) else None
-            logger.info(f"--- Falabella Pass 2 (Transacciones Pag {i+1}) ---")
-            txs = self.ai_service.extract_transactions(img_b64, "Falabella", year_to_use, text_content=text_to_send)
-            all_transactions.extend(txs)
-            if text_to_send: break
-
-        return {
-            "transactions": all_transactions,
-            "metadata": consolidated_metadata
-        }
+        return "\n".join(ocr_text_list)
 
     def _parse_excel(self, file_content: bytes) -> Dict[str, Any]:
         """Lógica original para archivos Excel."""
@@ -90,13 +126,16 @@ class FalabellaParser(BaseParser):
         if header_row is not None:
             df.columns = df.iloc[header_row]
             df = df.iloc[header_row + 1:].reset_index(drop=True)
-            for _, row in df.iterrows():
-                if pd.isna(row["Fecha"]): continue
+            df = df[df["Fecha"].notna()]
+            montos_col = df["Monto"] if "Monto" in df.columns else [0] * len(df)
+            fechas = parse_dates(df["Fecha"].tolist(), year=datetime.now().year, reference_month=datetime.now().month)
+            montos = parse_amounts(list(montos_col), default=0.0)
+            for fecha, descripcion, monto in zip(fechas, df["Descripción"].tolist(), montos):
                 raw_transactions.append({
-                    "fecha": f"{datetime.now().year}-{str(row['Fecha'])}", # Simplificado para excel
-                    "descripcion": str(row["Descripción"]),
-                    "monto": float(str(row.get("Monto", 0)).replace('.','').replace(',','.')),
-                    "tipo": "Gasto" if float(str(row.get("Monto", 0))) < 0 else "Ingreso"
+                    "fecha": fecha,
+                    "descripcion": str(descripcion),
+                    "monto": abs(monto),
+                    "tipo": "Gasto" if monto < 0 else "Ingreso"
                 })
 
         return {
@@ -104,7 +143,7 @@ class FalabellaParser(BaseParser):
             "metadata": {"entidad": "Falabella (Excel)"}
         }
 
-    def save_metadata(self, metadata: Dict[str, Any]):
+    def save_metadata(self, ctx: ParseContext, metadata: Dict[str, Any]):
         """Persiste metadatos en metadatos_documento."""
         if not metadata: return
         cursor = self.db.cursor()
@@ -115,27 +154,23 @@ class FalabellaParser(BaseParser):
         """
         atributos_json = json.dumps(metadata.get("atributos_adicionales", {}))
         
-        def fmt_date(d):
-            if not d or d == "N/A": return None
-            return d if "-" in d else None
-
         values = (
-            self.archivo_id,
+            ctx.archivo_id,
             "Falabella",
             metadata.get("titular"),
             metadata.get("cuenta"),
-            fmt_date(metadata.get("periodo_desde")),
-            fmt_date(metadata.get("periodo_hasta")),
+            parse_date(metadata.get("periodo_desde")),
+            parse_date(metadata.get("periodo_hasta")),
             atributos_json
         )
         cursor.execute(sql, values)
-        self.db.commit()
+        self._commit(ctx)
         cursor.close()
 
-    def save_to_staging(self, data: Dict[str, Any]):
+    def save_to_staging(self, ctx: ParseContext, data: Dict[str, Any]):
         """Guarda en staging_falabella con soporte para tipo_sugerido."""
         if "metadata" in data:
-            self.save_metadata(data["metadata"])
+            self.save_metadata(ctx, data["metadata"])
             
         cursor = self.db.cursor()
         sql = """
@@ -145,56 +180,67 @@ class FalabellaParser(BaseParser):
         """
         for tx in data["transactions"]:
             cursor.execute(sql, (
-                self.archivo_id, 
+                ctx.archivo_id, 
                 tx.get("fecha"), 
                 tx.get("descripcion"),
                 tx.get("tipo", "Gasto"), # Captura el tipo de la IA
                 str(tx.get("monto")),
                 tx.get("cuotas", ""),
-                tx.get("categoria", "Otros")
+                tx.get("categoria")
             ))
-        self.db.commit()
+        self._commit(ctx)
         cursor.close()
 
-    def consolidate(self):
+    def consolidate(self, ctx: ParseContext):
         """Limpia y mueve a transacciones_consolidadas priorizando la IA y Motor Categorización."""
         from ..services.categorization import CategorizationService
+        from ..services.merchant_normalizer import MerchantNormalizer
         cat_service = CategorizationService(self.db)
         
         cursor = self.db.cursor(dictionary=True)
-        cursor.execute("SELECT * FROM staging_falabella WHERE archivo_id = %s", (self.archivo_id,))
+        cursor.execute("SELECT * FROM staging_falabella WHERE archivo_id = %s", (ctx.archivo_id,))
         rows = cursor.fetchall()
+        # Cada glosa distinta se normaliza una vez (caché del proceso + comercios_normalizados)
+        comercios = MerchantNormalizer(self.db).canonical_many(row["descripcion_cruda"] for row in rows)
 
         for row in rows:
-            try:
-                monto = abs(float(row["monto_pesos_crudo"]))
-            except:
-                monto = 0.0
+            # Sin fecha interpretable no se consolida: una fecha inventada falsea periodos y métricas
+            fecha = parse_date(row["fecha_texto"])
+            if not fecha:
+                logger.warning(f"Omitiendo fila con fecha no interpretable '{row['fecha_texto']}': {row['descripcion_cruda']}")
+                continue
+
+            monto = abs(parse_amount(row["monto_pesos_crudo"], default=0.0))
 
             # Priorizar tipo sugerido por IA si existe, de lo contrario usar lógica de respaldo
             tipo = row.get("tipo_sugerido", "Gasto")
             
-            cat_id = cat_service.categorizar(row["descripcion_cruda"], row.get("categoria_sugerida"))
+            cat_id, origen_cat = cat_service.clasificar(
+                row["descripcion_cruda"], row.get("categoria_sugerida"), comercios[row["descripcion_cruda"]]
+            )
             
             description = row["descripcion_cruda"].upper()
-            tx_raw_string = f"{row['fecha_texto']}_{row['descripcion_cruda']}_{monto}_{self.archivo_id}"
+            tx_raw_string = f"{row['fecha_texto']}_{row['descripcion_cruda']}_{monto}_{ctx.archivo_id}"
             tx_id = hashlib.sha256(tx_raw_string.encode()).hexdigest()
 
             sql = """
                 INSERT IGNORE INTO transacciones_consolidadas 
-                (transaccion_id, archivo_id, fecha_transaccion, descripcion_limpia, monto, tipo, categoria_id)
-                VALUES (%s, %s, %s, %s, %s, %s, %s)
+                (transaccion_id, archivo_id, fecha_transaccion, descripcion_limpia, comercio_clave, monto, tipo, categoria_id,
+                 fue_clasificado_por_ia)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
             """
             
             cursor.execute(sql, (
                 tx_id, 
-                self.archivo_id, 
-                row["fecha_texto"] if row["fecha_texto"] != "N/A" else datetime.now().date(), 
+                ctx.archivo_id, 
+                fecha,
                 row["descripcion_cruda"].strip(), 
+                comercios[row["descripcion_cruda"]],
                 monto, 
                 tipo,
-                cat_id
+                cat_id,
+                origen_cat in ("vecino", "ia")  # inferida (vecino o IA): no alimenta el índice de vecinos
             ))
         
-        self.db.commit()
+        self._commit(ctx)
         cursor.close()
@@ -1,12 +1,12 @@
 from typing import Dict, Any
-from ..core.base_parser import BaseParser
+from ..core.base_parser import BaseParser, ParseContext
 import logging
 from datetime import datetime
 
 logger = logging.getLogger(__name__)
 
 class JumboItemsParser(BaseParser):
-    def parse(self, file_content: bytes) -> Dict[str, Any]:
+    def parse(self, ctx: ParseContext, file_content: bytes) -> Dict[str, Any]:
         """
         Extrae detalle de productos de una boleta o scrap del Jumbo.
         En esta fase inicial, simulamos la extracción de los campos clave.
@@ -26,14 +26,14 @@ class JumboItemsParser(BaseParser):
             "metadata": {"comercio": "Jumbo"}
         }
 
-    def save_to_staging(self, data: Dict[str, Any]):
+    def save_to_staging(self, ctx: ParseContext, data: Dict[str, Any]):
         """
         Para boletas detalladas, el 'staging' suele ser la misma tabla de items
         pero con estado 'pendiente'.
         """
         pass
 
-    def consolidate(self):
+    def consolidate(self, ctx: ParseContext):
         """
         Vincula los items con una transacción existente en transacciones_consolidadas.
         Usa el monto total y la fecha para encontrar el 'match'.
@@ -48,10 +48,10 @@ class JumboItemsParser(BaseParser):
         """
         Versión del orquestador que ya conoce a qué transacción pertenece el item.
         """
-        self.file_hash = self._calculate_hash(file_content)
-        self.archivo_id = self._register_file(filename, self.file_hash, 'Boleta_Supermercado', 'Jumbo')
+        ctx = ParseContext(file_hash=self._calculate_hash(file_content))
+        ctx.archivo_id = self._register_file(filename, ctx.file_hash, 'Boleta_Supermercado', 'Jumbo')
         
-        data = self.parse(file_content)
+        data = self.parse(ctx, file_content)
         
         cursor = self.db.cursor()
         for item in data["items"]:
@@ -62,7 +62,7 @@ class JumboItemsParser(BaseParser):
             """
             cursor.execute(sql, (
                 transaccion_id,
-                self.archivo_id,
+                ctx.archivo_id,
                 item["producto"],
                 item.get("cantidad", 1),
                 item.get("precio", 0),
@@ -71,3 +71,10 @@ class JumboItemsParser(BaseParser):
             ))
         self.db.commit()
         cursor.close()
+
+        # Los precios de la boleta se agregan al historial por producto
+        from ..services.price_history import PriceHistoryIndex
+        try:
+            PriceHistoryIndex(self.db).append(ctx.archivo_id)
+        except Exception as e:
+            logger.warning(f"No se pudo actualizar el historial de precios (archivo_id {ctx.archivo_id}): {e}")
@@ -0,0 +1,62 @@
+import importlib
+import logging
+import threading
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+STORAGE_PATH = "/app/storage"
+
+# (origen, tipo_doc) -> ".modulo:Clase" (relativo a app.parsers). tipo_doc None actúa como comodín del origen.
+# Los módulos se importan recién al pedir el parser: pandas, pdfplumber, PIL y openai
+# no se cargan al arrancar la API.
+_REGISTRY: Dict[Tuple[str, Optional[str]], str] = {
+    ("Banco_Chile", "Cartola_CC"): ".banco_chile:BancoChileParser",
+    ("Banco_Chile", "Cartola_LC"): ".banco_chile:BancoChileParser",
+    ("Banco_Chile", None): ".banco_chile:BancoChileParser",
+    ("Falabella", None): ".falabella:FalabellaParser",
+}
+
+_loaded = {}
+_lock = threading.Lock()
+
+
+def register_parser(origen: str, tipo_doc: Optional[str], target: str):
+    """Registra (o reemplaza) el parser para un origen y tipo de documento ('.modulo:Clase')."""
+    with _lock:
+        _REGISTRY[(origen, tipo_doc)] = target
+
+
+def registered() -> List[Tuple[str, Optional[str]]]:
+    return list(_REGISTRY)
+
+
+def _load(target: str):
+    with _lock:
+        parser_cls = _loaded.get(target)
+        if parser_cls is None:
+            module_name, class_name = target.split(":")
+            parser_cls = getattr(importlib.import_module(module_name, package=__package__), class_name)
+            _loaded[target] = parser_cls
+            logger.info(f"Parser cargado: {target}")
+        return parser_cls
+
+
+def get_parser_class(origen: str, tipo_doc: Optional[str] = None):
+    """Resuelve la clase del parser (importándola si hace falta). Lanza ValueError si no está soportado."""
+    target = _REGISTRY.get((origen, tipo_doc)) or _REGISTRY.get((origen, None))
+    if target is None:
+        detalle = f"'{origen}' / '{tipo_doc}'" if tipo_doc else f"'{origen}'"
+        raise ValueError(f"Origen {detalle} no soportado aún.")
+    return _load(target)
+
+
+def get_parser(origen: str, tipo_doc: Optional[str], db, storage_path: str = STORAGE_PATH):
+    """Instancia el parser registrado para (origen, tipo_doc)."""
+    return get_parser_class(origen, tipo_doc)(db, storage_path)
+
+
+def preload():
+    """Importa todos los parsers registrados (usado por el warm-up en segundo plano)."""
+    for target in sorted(set(_REGISTRY.values())):
+        _load(target)
@@ -1,56 +1,187 @@
 import os
-from openai import OpenAI
+from openai import OpenAI, APIError
 import json
 import logging
-import re
 from datetime import datetime
+from ..core.normalization import parse_dates, parse_amounts
+from ..core.artifact_store import get_artifact_store
+from ..core.llm_limiter import get_llm_limiter
+from ..core.exceptions import LLMUnavailableError
+from ..core.page_image import image_url
+from ..core.page_classifier import count_rows
+from ..core.model_routing import (
+    ModelRoute, get_model_router, PASS_METADATA, PASS_TRANSACTIONS, INPUT_IMAGE, INPUT_TEXT
+)
 
 logger = logging.getLogger(__name__)
 
+# Prompts leídos por proceso: ruta -> (mtime, contenido). Editar el archivo invalida la entrada.
+_prompt_cache = {}
+
+# Presupuesto de salida (tokens). Pass 1 es un bloque corto; Pass 2 escala con las filas esperadas.
+METADATA_MAX_TOKENS = int(os.getenv("LLM_METADATA_MAX_TOKENS", "768"))
+MAX_TOKENS_CAP = int(os.getenv("LLM_MAX_TOKENS_CAP", "4096"))
+MIN_TABLE_TOKENS = 384
+TABLE_OVERHEAD_TOKENS = 160
+TOKENS_PER_ROW = 34  # fecha | descripción | monto | tipo (sin columna de categoría)
+DEFAULT_ROWS_PER_PAGE = 35
+# Continuaciones máximas cuando la tabla llega cortada
+MAX_CONTINUATIONS = int(os.getenv("LLM_MAX_CONTINUATIONS", "3"))
+
+CONTINUE_PROMPT = (
+    "Tu respuesta anterior se cortó por longitud. Continúa la tabla EXACTAMENTE desde la fila "
+    "siguiente a esta (no la repitas ni repitas filas anteriores):\n{ultima}\n"
+    "Usa el mismo formato de columnas y termina con [TABLE_END]."
+)
+
+
+def table_budget(expected_rows: int = None) -> int:
+    """Tokens de salida para Pass 2: filas esperadas con 25% de holgura, acotado a [MIN, CAP]."""
+    rows = expected_rows if expected_rows else DEFAULT_ROWS_PER_PAGE
+    budget = TABLE_OVERHEAD_TOKENS + int(rows * 1.25 + 1) * TOKENS_PER_ROW
+    return max(MIN_TABLE_TOKENS, min(MAX_TOKENS_CAP, budget))
+
 class AIService:
-    def __init__(self):
+    def __init__(self, use_cache: bool = True):
+        # Modelo y endpoint por pasada/origen/entrada (por defecto todo va a "local-model")
+        self.router = get_model_router()
         # host.docker.internal permite acceder al host desde el contenedor Docker
-        self.api_url = os.getenv("AI_API_URL", "http://host.docker.internal:1234/v1")
+        self.api_url = self.router.default.api_url
         self.client = OpenAI(base_url=self.api_url, api_key="not-needed")
+        self._clients = {}
         self.prompts_base_path = "/app/app/core/prompts"
+        self.model = self.router.default.model
+        # Respuestas deterministas (temperature=0): se reutilizan si prompt, imagen y modelo no cambiaron
+        self.use_cache = use_cache and os.getenv("LLM_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
 
     def _get_prompt(self, filename: str):
         path = os.path.join(self.prompts_base_path, filename)
         try:
+            mtime = os.path.getmtime(path)
+            cached = _prompt_cache.get(path)
+            if cached and cached[0] == mtime:
+                return cached[1]
             with open(path, "r", encoding="utf-8") as f:
-                return f.read()
+                content = f.read()
+            _prompt_cache[path] = (mtime, content)
+            return content
         except Exception as e:
             logger.error(f"Error leyendo el prompt {path}: {e}")
             return "Extrae la data solicitada de esta imagen."
 
-    def extract_metadata(self, base64_image: str, origin: str):
+    def preload_prompts(self) -> int:
+        """Carga en memoria todos los prompts disponibles. Retorna cuántos se leyeron."""
+        try:
+            names = [n for n in os.listdir(self.prompts_base_path) if n.endswith(".txt")]
+        except OSError as e:
+            logger.warning(f"No se pudo listar prompts en {self.prompts_base_path}: {e}")
+            return 0
+        for name in names:
+            self._get_prompt(name)
+        return len(names)
+
+    def ping(self) -> bool:
+        """Petición mínima (1 token, sin caché) para que LM Studio cargue el modelo."""
+        try:
+            with get_llm_limiter().slot():
+                self.client.chat.completions.create(
+                    model=self.model,
+                    messages=[{"role": "user", "content": "ping"}],
+                    temperature=0.0,
+                    max_tokens=1
+                )
+            return True
+        except Exception as e:
+            logger.warning(f"Ping al LLM falló: {e}")
+            return False
+
+    def _client_for(self, api_url: str) -> OpenAI:
+        if api_url == self.api_url:
+            return self.client
+        if api_url not in self._clients:
+            self._clients[api_url] = OpenAI(base_url=api_url, api_key="not-needed")
+        return self._clients[api_url]
+
+    def _complete(self, messages, max_tokens: int = 2048, route: ModelRoute = None):
+        """
+        Ejecuta la llamada al LLM de la ruta indicada, con su modelo de respaldo si falla.
+        Retorna (contenido, finish_reason); finish_reason 'length' indica salida truncada.
+        """
+        route = route or self.router.default
+        try:
+            return self._complete_route(messages, max_tokens, route)
+        except LLMUnavailableError as e:
+            if route.fallback is None:
+                raise
+            logger.warning(f"Ruta LLM '{route.name}' ({route.model}) falló: {e}. Usando respaldo '{route.fallback.model}'.")
+            return self._complete_route(messages, max_tokens, route.fallback)
+
+    def _complete_route(self, messages, max_tokens: int, route: ModelRoute):
+        """Llamada a un modelo concreto consultando primero el artifact store."""
+        max_tokens = route.clamp(max_tokens)
+        store = get_artifact_store()
+        key_parts = [route.api_url, route.model, max_tokens, json.dumps(messages, sort_keys=True, ensure_ascii=False)]
+        if route.temperature:
+            # temperature > 0 no es determinista, pero se cachea igual: reprocesar no debe cambiar resultados
+            key_parts.append(route.temperature)
+        key = store.make_key(*key_parts)
+        if self.use_cache:
+            cached = store.get_text("llm", key)
+            if cached is not None:
+                logger.info("Respuesta IA recuperada desde artifact store (insumos sin cambios).")
+                try:
+                    data = json.loads(cached)
+                    return data["content"], data.get("finish_reason")
+                except (ValueError, TypeError, KeyError):
+                    # Entradas anteriores guardaban solo el texto
+                    return cached, None
+
+        try:
+            # Cupo compartido entre workers: el modelo local atiende pocas peticiones a la vez
+            with get_llm_limiter().slot():
+                response = self._client_for(route.api_url).chat.completions.create(
+                    model=route.model,
+                    messages=messages,
+                    temperature=route.temperature,
+                    max_tokens=max_tokens
+                )
+        except APIError as e:
+            # Se propaga para que el pipeline conserve los checkpoints y el archivo pueda reanudarse
+            raise LLMUnavailableError(f"Error comunicándose con el modelo {route.model}: {e}")
+        choice = response.choices[0]
+        content = choice.message.content or ""
+        if content:
+            store.put_text("llm", key, json.dumps({"content": content, "finish_reason": choice.finish_reason}, ensure_ascii=False))
+        return content, choice.finish_reason
+
+    def extract_metadata(self, image, origin: str):
         prompt_file = f"{origin.lower()}_metadata.txt"
         system_prompt = self._get_prompt(prompt_file)
         
         logger.info(f"Enviando Pass 1 (Metadata) usando {prompt_file}")
         
-        try:
-            response = self.client.chat.completions.create(
-                model="local-model",
-                messages=[
+        messages = [
+            {
+                "role": "user",
+                "content": [
+                    {"type": "text", "text": f"{system_prompt}\n\nProcesa la cabecera de este documento:"},
                     {
-                        "role": "user",
-                        "content": [
-                            {"type": "text", "text": f"{system_prompt}\n\nProcesa la cabecera de este documento:"},
-                            {
-                                "type": "image_url",
-                                "image_url": {
-                                    "url": f"data:image/jpeg;base64,{base64_image}"
-                                }
-                            }
-                        ]
+                        "type": "image_url",
+                        "image_url": {
+                            "url": image_url(image)
+                        }
                     }
-                ],
-                temperature=0.0,
-                max_tokens=2048
-            )
+                ]
+            }
+        ]
+        route = self.router.resolve(PASS_METADATA, origin, INPUT_IMAGE)
+        try:
+            content, finish_reason = self._complete(messages, max_tokens=METADATA_MAX_TOKENS, route=route)
+            if finish_reason == "length" or ("[METADATA_START]" in content and "[METADATA_END]" not in content):
+                # Bloque cortado (ej: ATRIBUTOS extensos): un reintento con el doble de presupuesto
+                logger.warning("Pass 1 truncado; reintentando con mayor presupuesto de tokens.")
+                content, _ = self._complete(messages, max_tokens=min(MAX_TOKENS_CAP, METADATA_MAX_TOKENS * 2), route=route)
             
-            content = response.choices[0].message.content
             logger.info("--- Pass 1 Result ---")
             logger.info(content)
             
@@ -88,11 +219,51 @@ class AIService:
                         
             return metadata
             
+        except LLMUnavailableError:
+            raise
         except Exception as e:
             logger.error(f"Error crítico en IA Metadata (Pass 1): {str(e)}")
             return {}
 
-    def extract_transactions(self, base64_image: str, origin: str, current_year: str = str(datetime.now().year), text_content: str = None):
+    @staticmethod
+    def _parse_table(content: str, in_table: bool = False, truncated: bool = False):
+        """
+        Extrae las filas del bloque [TABLE_START]...[TABLE_END].
+        Retorna (filas, cerrada). Con truncated=True se descarta una última fila cortada a la mitad.
+        """
+        filas = []
+        cerrada = False
+        current_mode = "table" if in_table else None
+        ultima_linea_es_fila = False
+
+        for line in content.split("\n"):
+            line = line.strip()
+            if not line: continue
+            ultima_linea_es_fila = False
+            
+            if "[TABLE_START]" in line:
+                current_mode = "table"
+                continue
+            if "[TABLE_END]" in line:
+                current_mode = None
+                cerrada = True
+                continue
+            
+            if current_mode == "table":
+                if "|" in line and "DESC" not in line.upper(): 
+                    parts = [p.strip() for p in line.split("|")]
+                    if len(parts) >= 3:
+                        filas.append(parts)
+                        ultima_linea_es_fila = True
+                    else:
+                        logger.warning(f"Línea de tabla ignorada: {line}")
+
+        if truncated and not cerrada and ultima_linea_es_fila and not content.endswith("\n"):
+            filas.pop()
+        return filas, cerrada
+
+    def extract_transactions(self, image, origin: str, current_year: str = str(datetime.now().year), text_content: str = None,
+                             reference_month: int = None, expected_rows: int = None):
         prompt_file = f"{origin.lower()}_transactions.txt"
         system_prompt = self._get_prompt(prompt_file)
         
@@ -117,93 +288,80 @@ class AIService:
                         {
                             "type": "image_url",
                             "image_url": {
-                                "url": f"data:image/jpeg;base64,{base64_image}"
+                                "url": image_url(image)
                             }
                         }
                     ]
                 }
             ]
         
+        # Presupuesto según filas esperadas (texto OCR/nativo o estimación del parser)
+        if text_content:
+            expected_rows = count_rows(text_content) or expected_rows
+        max_tokens = table_budget(expected_rows)
+        route = self.router.resolve(PASS_TRANSACTIONS, origin, INPUT_TEXT if text_content else INPUT_IMAGE)
+        
         try:
-            response = self.client.chat.completions.create(
-                model="local-model",
-                messages=messages,
-                temperature=0.0,
-                max_tokens=2048
-            )
+            content, finish_reason = self._complete(messages, max_tokens=max_tokens, route=route)
             
-            content = response.choices[0].message.content
-            logger.info("--- Pass 2 Result ---")
+            logger.info(f"--- Pass 2 Result (modelo={route.model}, max_tokens={max_tokens}, finish_reason={finish_reason}) ---")
             logger.info(content)
             
-            transacciones = []
-            current_mode = None
+            truncated = finish_reason == "length" or ("[TABLE_START]" in content and "[TABLE_END]" not in content)
+            filas, cerrada = self._parse_table(content, truncated=truncated)
             
-            for line in content.split("\n"):
-                line = line.strip()
-                if not line: continue
-                
-                if "[TABLE_START]" in line:
-                    current_mode = "table"
-                    continue
-                if "[TABLE_END]" in line:
-                    current_mode = None
+            continuaciones = 0
+            while truncated and continuaciones < MAX_CONTINUATIONS:
+                continuaciones += 1
+                if not filas:
+                    # Cortado antes de la primera fila: solo queda repetir con más presupuesto
+                    if max_tokens >= MAX_TOKENS_CAP:
+                        break
+                    max_tokens = min(MAX_TOKENS_CAP, max_tokens * 2)
+                    logger.warning(f"Pass 2 truncado sin filas; reintentando con max_tokens={max_tokens}.")
+                    content, finish_reason = self._complete(messages, max_tokens=max_tokens, route=route)
+                    truncated = finish_reason == "length" or ("[TABLE_START]" in content and "[TABLE_END]" not in content)
+                    filas, cerrada = self._parse_table(content, truncated=truncated)
                     continue
-                
-                if current_mode == "table":
-                    if "|" in line and "DESC" not in line.upper(): 
-                        try:
-                            parts = [p.strip() for p in line.split("|")]
-                            if len(parts) >= 3:
-                                monto_raw = parts[2]
-                                monto_clean = monto_raw.replace(".", "").replace(",", ".")
-                                monto_clean = re.sub(r'[^-0-9.]', '', monto_clean)
-                                monto = float(monto_clean) if monto_clean else 0.0
-                                
-                                fecha_raw = parts[0]
-                                fecha_iso = fecha_raw
-                                
-                                meses = {
-                                    "ene": "01", "feb": "02", "mar": "03", "abr": "04", "may": "05", "jun": "06", 
-                                    "jul": "07", "ago": "08", "sep": "09", "oct": "10", "nov": "11", "dic": "12"
-                                }
-                                
-                                # Detección de formato ISO AAAA-MM-DD (nuevo estándar del prompt)
-                                if re.match(r'^\d{4}-\d{2}-\d{2}$', fecha_raw):
-                                    fecha_iso = fecha_raw
-                                elif "-" in fecha_raw:
-                                    d_parts = [p.strip().lower() for p in fecha_raw.split("-")]
-                                    if len(d_parts) >= 2:
-                                        # Formato DD-MMM-AAAA o DD-MMM
-                                        if len(d_parts[0]) <= 2:
-                                            d = d_parts[0].zfill(2)
-                                            m_text = d_parts[1][:3]
-                                            m = meses.get(m_text, "01")
-                                            fecha_iso = f"{current_year}-{m}-{d}"
-                                        else:
-                                            # Ya es AAAA-MM-DD (pero por si acaso re-validamos)
-                                            fecha_iso = fecha_raw
-                                elif "/" in fecha_raw:
-                                    d_parts = fecha_raw.split("/")
-                                    if len(d_parts) >= 2:
-                                        d = d_parts[0].zfill(2)
-                                        m = d_parts[1].zfill(2)
-                                        y = d_parts[2] if len(d_parts) > 2 else current_year
-                                        year = f"20{y}" if len(y) == 2 else y
-                                        fecha_iso = f"{year}-{m}-{d}"
-
-                                transacciones.append({
-                                    "fecha": fecha_iso,
-                                    "descripcion": parts[1],
-                                    "monto": monto,
-                                    "tipo": parts[3] if len(parts) > 3 else "Gasto",
-                                    "categoria": parts[4] if len(parts) > 4 else "Otros"
-                                })
-                        except Exception as e:
-                            logger.warning(f"Línea de tabla ignorada: {line} -> {e}")
+
+                # Se continúa desde la última fila completa en vez de repetir la página entera
+                logger.warning(f"Pass 2 truncado tras {len(filas)} filas; continuación {continuaciones}/{MAX_CONTINUATIONS}.")
+                parcial = "[TABLE_START]\n" + "\n".join(" | ".join(f) for f in filas)
+                content, finish_reason = self._complete(messages + [
+                    {"role": "assistant", "content": parcial},
+                    {"role": "user", "content": CONTINUE_PROMPT.format(ultima=" | ".join(filas[-1]))}
+                ], max_tokens=max_tokens, route=route)
+                truncated = finish_reason == "length" or "[TABLE_END]" not in content
+                nuevas, cerrada = self._parse_table(content, in_table="[TABLE_START]" not in content, truncated=truncated)
+                # El modelo a veces repite la fila de anclaje
+                while nuevas and filas and nuevas[0] == filas[-1]:
+                    nuevas.pop(0)
+                if not nuevas:
+                    break
+                filas.extend(nuevas)
+
+            if truncated:
+                logger.error(f"Pass 2 sigue truncado tras {continuaciones} continuaciones: la tabla puede estar incompleta ({len(filas)} filas).")
+            
+            # Normalización por lote (fechas y montos) con el motor compartido
+            fechas = parse_dates([p[0] for p in filas], year=current_year, reference_month=reference_month)
+            montos = parse_amounts([p[2] for p in filas], default=0.0)
+            
+            transacciones = []
+            for parts, fecha_iso, monto in zip(filas, fechas, montos):
+                transacciones.append({
+                    "fecha": fecha_iso or parts[0],
+                    "descripcion": parts[1],
+                    "monto": monto,
+                    "tipo": parts[3] if len(parts) > 3 else "Gasto",
+                    # Pass 2 ya no pide categoría (la asigna la consolidación); se respeta si el modelo la incluye
+                    "categoria": parts[4] if len(parts) > 4 and parts[4] else None
+                })
             
             return transacciones
             
+        except LLMUnavailableError:
+            raise
         except Exception as e:
             logger.error(f"Error crítico en IA Transactions (Pass 2): {str(e)}")
             return []
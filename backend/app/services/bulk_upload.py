@@ -0,0 +1,175 @@
+import os
+import shutil
+import hashlib
+import logging
+import zipfile
+import tempfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional
+from ..db import get_db_connection
+from ..parsers.registry import get_parser
+from ..core.llm_limiter import llm_context, PRIORIDAD_MASIVA
+from ..core.exceptions import BatchTooLargeError
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WORKERS = int(os.getenv("BULK_UPLOAD_WORKERS", "2"))
+MAX_WORKERS = 8
+EXTENSIONES = (".pdf", ".xls", ".xlsx")
+# Límites del lote (ZIP o multipart). En un ZIP se validan con el directorio central antes de
+# extraer (protección contra zip bombs); en multipart, al copiar cada parte
+MAX_BATCH_ENTRIES = int(os.getenv("BULK_UPLOAD_MAX_ENTRIES", "1000"))
+MAX_BATCH_MB = int(os.getenv("BULK_UPLOAD_MAX_UNCOMPRESSED_MB", "2048"))
+MAX_ZIP_RATIO = float(os.getenv("BULK_UPLOAD_MAX_RATIO", "50"))
+
+
+def split_entry_path(path: str) -> Optional[tuple]:
+    """
+    Interpreta '<origen>/<tipo_doc>/<archivo>' (se aceptan carpetas contenedoras previas,
+    ej: 'ingesta_masiva/Falabella/Cartola_CC/enero.pdf'). Retorna None si no calza.
+    """
+    parts = [p for p in path.replace("\\", "/").split("/") if p]
+    if len(parts) < 3:
+        return None
+    if not parts[-1].lower().endswith(EXTENSIONES):
+        return None
+    return parts[-3], parts[-2], parts[-1]
+
+
+class BatchSpool:
+    """
+    Copia las entradas del lote a un directorio temporal propio. La respuesta se transmite
+    después de que FastAPI cierra los UploadFile, así que los workers leen desde aquí.
+    """
+
+    def __init__(self):
+        self._dir = tempfile.mkdtemp(prefix="lote_")
+        self.entries: List[Dict[str, Any]] = []
+        self.rejected: List[Dict[str, Any]] = []
+        self._hashes = {}
+        self._bytes = 0
+
+    def _add(self, ruta: str, source: BinaryIO):
+        if len(self.entries) + len(self.rejected) >= MAX_BATCH_ENTRIES:
+            raise BatchTooLargeError(f"El lote tiene más de {MAX_BATCH_ENTRIES} archivos.")
+        parsed = split_entry_path(ruta)
+        if parsed is None:
+            self.rejected.append({"status": "error", "archivo": ruta, "message": "Ruta inválida: se espera <origen>/<tipo_doc>/<archivo>."})
+            return
+        origen, tipo_doc, filename = parsed
+        path = os.path.join(self._dir, f"{len(self.entries) + len(self.rejected):05d}_{filename}")
+        sha = hashlib.sha256()
+        with open(path, "wb") as f:
+            for chunk in iter(lambda: source.read(1024 * 1024), b""):
+                self._bytes += len(chunk)
+                if self._bytes > MAX_BATCH_MB * 1024 * 1024:
+                    raise BatchTooLargeError(f"El lote supera {MAX_BATCH_MB} MB.")
+                sha.update(chunk)
+                f.write(chunk)
+        file_hash = sha.hexdigest()
+        if file_hash in self._hashes:
+            # El mismo archivo dos veces en un lote chocaría al registrarse en paralelo
+            os.remove(path)
+            self.rejected.append({"status": "duplicate", "archivo": ruta, "message": f"Repetido en el lote ({self._hashes[file_hash]})."})
+            return
+        self._hashes[file_hash] = ruta
+        self.entries.append({"archivo": ruta, "filename": filename, "origen": origen, "tipo_doc": tipo_doc, "path": path})
+
+    def add_zip(self, source: BinaryIO):
+        """Extrae las entradas de un ZIP. Lanza zipfile.BadZipFile si el archivo no es válido."""
+        with tempfile.TemporaryFile() as tmp:
+            shutil.copyfileobj(source, tmp)
+            tmp.seek(0)
+            with zipfile.ZipFile(tmp) as zf:
+                infos = [
+                    info for info in zf.infolist()
+                    if not (info.is_dir() or "__MACOSX" in info.filename or os.path.basename(info.filename).startswith("."))
+                ]
+                self._check_limits(infos)
+                for info in infos:
+                    # zipfile no entrega más de file_size bytes por entrada: el tamaño validado es el real
+                    with zf.open(info) as member:
+                        self._add(info.filename, member)
+
+    @staticmethod
+    def _check_limits(infos: List[zipfile.ZipInfo]):
+        """Lanza BatchTooLargeError si el ZIP excede entradas, tamaño descomprimido o tasa de compresión."""
+        if len(infos) > MAX_BATCH_ENTRIES:
+            raise BatchTooLargeError(f"El ZIP tiene {len(infos)} archivos (máximo {MAX_BATCH_ENTRIES}).")
+        total = sum(info.file_size for info in infos)
+        if total > MAX_BATCH_MB * 1024 * 1024:
+            raise BatchTooLargeError(f"El ZIP descomprimido ocupa {total / 1024 / 1024:.0f} MB (máximo {MAX_BATCH_MB} MB).")
+        for info in infos:
+            if info.file_size > MAX_ZIP_RATIO * max(info.compress_size, 1):
+                raise BatchTooLargeError(f"'{info.filename}' tiene una tasa de compresión sospechosa (máximo {MAX_ZIP_RATIO:.0f}:1).")
+
+    def add_files(self, files: List[tuple]):
+        """Partes de un lote multipart: [(ruta, archivo), ...]. Se valida la cantidad antes de copiar."""
+        if len(self.entries) + len(self.rejected) + len(files) > MAX_BATCH_ENTRIES:
+            raise BatchTooLargeError(f"El lote tiene {len(files)} archivos (máximo {MAX_BATCH_ENTRIES}).")
+        for ruta, source in files:
+            self._add(ruta, source)
+
+    def cleanup(self):
+        shutil.rmtree(self._dir, ignore_errors=True)
+
+
+def _process_entry(entry: Dict[str, Any], password: Optional[str]) -> Dict[str, Any]:
+    """Tarea de un worker: conexión propia, parser propio."""
+    base = {"archivo": entry["archivo"], "origen": entry["origen"], "tipo_doc": entry["tipo_doc"]}
+    db = get_db_connection()
+    if db is None:
+        return {**base, "status": "error", "message": "Sin conexión a la base de datos."}
+    try:
+        with open(entry["path"], "rb") as f:
+            content = f.read()
+        parser = get_parser(entry["origen"], entry["tipo_doc"], db)
+        # Los lotes ceden el LLM a las cargas interactivas
+        with llm_context(prioridad=PRIORIDAD_MASIVA):
+            result = parser.run(
+                filename=entry["filename"],
+                file_content=content,
+                tipo_doc=entry["tipo_doc"],
+                origen=entry["origen"],
+                password=password
+            )
+        return {**base, **result}
+    except ValueError as e:
+        return {**base, "status": "error", "message": str(e)}
+    finally:
+        if db.is_connected():
+            db.close()
+
+
+def process_batch(spool: BatchSpool, workers: int = DEFAULT_WORKERS, password: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Procesa las entradas del lote con paralelismo acotado y entrega cada resultado apenas termina.
+    La última línea es un resumen con el conteo por estado.
+    """
+    workers = max(1, min(workers, MAX_WORKERS))
+    resumen: Dict[str, int] = {}
+    logger.info(f"Lote de {len(spool.entries)} archivos con {workers} workers ({len(spool.rejected)} rechazados).")
+    try:
+        for result in spool.rejected:
+            resumen[result["status"]] = resumen.get(result["status"], 0) + 1
+            yield result
+
+        pool = ThreadPoolExecutor(max_workers=workers)
+        try:
+            futures = {pool.submit(_process_entry, e, password): e for e in spool.entries}
+            for future in as_completed(futures):
+                try:
+                    result = future.result()
+                except Exception as e:
+                    entry = futures[future]
+                    logger.error(f"Error inesperado procesando {entry['archivo']}: {e}")
+                    result = {"archivo": entry["archivo"], "status": "error", "message": repr(e)}
+                resumen[result["status"]] = resumen.get(result["status"], 0) + 1
+                yield result
+        finally:
+            # Si el cliente se desconecta se descartan los archivos aún en cola (los checkpoints permiten reanudar)
+            pool.shutdown(wait=True, cancel_futures=True)
+    finally:
+        spool.cleanup()
+
+    yield {"status": "resumen", "total": len(spool.entries) + len(spool.rejected), "por_estado": resumen}
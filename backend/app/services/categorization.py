@@ -1,12 +1,49 @@
+import os
+import time
 import logging
+import threading
+from typing import Optional, Tuple
+from . import category_index
 
 logger = logging.getLogger(__name__)
 
+# Reglas y mapa de categorías compartidos por las instancias del proceso durante CACHE_TTL segundos
+CACHE_TTL = float(os.getenv("CATEGORIZATION_CACHE_TTL", "60"))
+_cache = {"reglas": None, "mapa": None, "cargado_en": 0.0}
+_cache_lock = threading.Lock()
+
 class CategorizationService:
     def __init__(self, db_conn):
         self.db = db_conn
+        with _cache_lock:
+            vigente = _cache["reglas"] is not None and time.monotonic() - _cache["cargado_en"] < CACHE_TTL
+            if vigente:
+                self.reglas, self.categorias_ia_map = _cache["reglas"], _cache["mapa"]
+                return
         self.reglas = self._cargar_reglas()
         self.categorias_ia_map = self._cargar_categorias_map()
+        # Solo se cachea una carga completa (los errores de DB retornan colecciones vacías)
+        if self.reglas and self.categorias_ia_map:
+            with _cache_lock:
+                _cache.update(reglas=self.reglas, mapa=self.categorias_ia_map, cargado_en=time.monotonic())
+
+    @property
+    def indice(self) -> Optional[category_index.CategoryIndex]:
+        """Índice de vecinos del proceso (None si está deshabilitado o no se pudo construir)."""
+        if not hasattr(self, "_indice"):
+            self._indice = None
+            if category_index.is_enabled():
+                try:
+                    self._indice = category_index.get_category_index(self.db)
+                except Exception as e:
+                    logger.error(f"Error construyendo índice de categorías: {e}")
+        return self._indice
+
+    @staticmethod
+    def invalidate_cache():
+        """Fuerza la recarga de reglas en la próxima instancia (ej: tras editar reglas_categorizacion)."""
+        with _cache_lock:
+            _cache.update(reglas=None, mapa=None, cargado_en=0.0)
 
     def _cargar_reglas(self):
         logger.info("Cargando reglas de categorización desde DB...")
@@ -39,26 +76,38 @@ class CategorizationService:
             logger.error(f"Error cargando mapa de categorías: {e}")
             return {}
 
-    def categorizar(self, descripcion_limpia: str, categoria_sugerida_ia: str = None) -> int:
+    def categorizar(self, descripcion_limpia: str, categoria_sugerida_ia: str = None, comercio_clave: str = None) -> int:
+        return self.clasificar(descripcion_limpia, categoria_sugerida_ia, comercio_clave)[0]
+
+    def clasificar(self, descripcion_limpia: str, categoria_sugerida_ia: str = None,
+                   comercio_clave: str = None) -> Tuple[int, str]:
+        """Retorna (categoria_id, origen) con origen 'regla', 'vecino', 'ia' o 'defecto'."""
         desc_upper = descripcion_limpia.upper()
         
-        # 1. Match local rules (Substring rápido)
+        # 1. Match local rules (Substring rápido). La clave canónica cubre las glosas con ruido
         for regla in self.reglas:
-            if regla["patron"].upper() in desc_upper:
-                return regla["categoria_id"]
+            patron = regla["patron"].upper()
+            if patron in desc_upper or (comercio_clave and patron in comercio_clave):
+                return regla["categoria_id"], "regla"
+
+        # 2. Vecino más cercano entre los comercios ya categorizados (trigramas, local)
+        if comercio_clave and self.indice is not None:
+            vecino = self.indice.nearest(comercio_clave)
+            if vecino:
+                return vecino[0], "vecino"
         
-        # 2. Fallback to IA Suggestion
+        # 3. Fallback to IA Suggestion (staging antiguo: Pass 2 ya no pide categoría)
         if categoria_sugerida_ia:
             cat_ia_clean = categoria_sugerida_ia.strip().lower()
             
             # Direct match
             if cat_ia_clean in self.categorias_ia_map:
-                return self.categorias_ia_map[cat_ia_clean]
+                return self.categorias_ia_map[cat_ia_clean], "ia"
             
             # Partial match (e.g. 'Salud' in 'salud y bienestar')
             for db_cat_name, cat_id in self.categorias_ia_map.items():
                 if cat_ia_clean in db_cat_name or db_cat_name in cat_ia_clean:
-                    return cat_id
+                    return cat_id, "ia"
 
-        # 3. Fallback to "Otros" (ID: 8)
-        return 8
+        # 4. Fallback to "Otros" (ID: 8)
+        return 8, "defecto"
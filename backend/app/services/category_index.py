@@ -0,0 +1,190 @@
+import os
+import time
+import logging
+import threading
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Similitud Jaccard mínima entre trigramas y pureza mínima de la categoría del vecino
+UMBRAL_SIMILITUD = float(os.getenv("CATEGORY_NN_THRESHOLD", "0.6"))
+MIN_PUREZA = float(os.getenv("CATEGORY_NN_MIN_PURITY", "0.7"))
+# Reconstrucción completa periódica: recoge correcciones manuales y lo consolidado por otros procesos
+REBUILD_SECONDS = float(os.getenv("CATEGORY_INDEX_REBUILD_SECONDS", "3600"))
+CATEGORIA_OTROS = 8
+# Trigramas presentes en demasiados comercios no discriminan y alargan las listas a recorrer
+MAX_POSTINGS = 2000
+
+
+def is_enabled() -> bool:
+    return os.getenv("CATEGORY_INDEX_ENABLED", "true").lower() in ("1", "true", "yes")
+
+
+def trigrams(texto: str) -> Set[str]:
+    texto = f"  {' '.join((texto or '').upper().split())} "
+    return {texto[i:i + 3] for i in range(len(texto) - 2)}
+
+
+class CategoryIndex:
+    """
+    Índice de vecino más cercano por trigramas de caracteres sobre los comercios ya
+    categorizados (comercio_clave). Cada entrada acumula los votos de categoría de sus
+    transacciones; solo se asigna la categoría de un vecino suficientemente parecido y puro.
+    Los votos se llevan también por archivo para reemplazarlos cuando un archivo se reprocesa.
+    """
+
+    def __init__(self):
+        self._claves: List[str] = []
+        self._trigramas: List[Set[str]] = []
+        self._votos: List[Counter] = []
+        self._posicion: Dict[str, int] = {}
+        self._postings: Dict[str, List[int]] = {}
+        # archivo_id -> votos aportados {(comercio_clave, categoria_id): cantidad}
+        self._por_archivo: Dict[int, Counter] = {}
+        self._lock = threading.Lock()
+        self.construido_en = 0.0
+        self.reconstruyendo = False
+
+    def __len__(self):
+        return len(self._claves)
+
+    def _vote(self, comercio_clave: str, categoria_id: int, cantidad: int):
+        """Suma (o resta, con cantidad negativa) votos; requiere self._lock."""
+        pos = self._posicion.get(comercio_clave)
+        if pos is None:
+            pos = len(self._claves)
+            self._posicion[comercio_clave] = pos
+            tris = trigrams(comercio_clave)
+            self._claves.append(comercio_clave)
+            self._trigramas.append(tris)
+            self._votos.append(Counter())
+            for t in tris:
+                self._postings.setdefault(t, []).append(pos)
+        votos = self._votos[pos]
+        votos[categoria_id] += cantidad
+        if votos[categoria_id] <= 0:
+            del votos[categoria_id]
+
+    def add(self, comercio_clave: str, categoria_id: int, cantidad: int = 1, archivo_id: Optional[int] = None):
+        if not comercio_clave or not categoria_id or categoria_id == CATEGORIA_OTROS:
+            return
+        with self._lock:
+            self._vote(comercio_clave, categoria_id, cantidad)
+            if archivo_id is not None:
+                self._por_archivo.setdefault(archivo_id, Counter())[(comercio_clave, categoria_id)] += cantidad
+
+    def replace_file(self, archivo_id: int, votos: Counter):
+        """Reemplaza los votos aportados por un archivo (al reprocesarlo cambian o desaparecen)."""
+        votos = Counter({
+            (clave, categoria): n for (clave, categoria), n in votos.items()
+            if clave and categoria and categoria != CATEGORIA_OTROS
+        })
+        with self._lock:
+            for (clave, categoria), n in self._por_archivo.pop(archivo_id, Counter()).items():
+                self._vote(clave, categoria, -n)
+            for (clave, categoria), n in votos.items():
+                self._vote(clave, categoria, n)
+            if votos:
+                self._por_archivo[archivo_id] = votos
+
+    def nearest(self, comercio_clave: str) -> Optional[Tuple[int, float, str]]:
+        """(categoria_id, similitud, vecino) del comercio más parecido sobre el umbral, o None."""
+        if not comercio_clave:
+            return None
+        with self._lock:
+            pos = self._posicion.get(comercio_clave)
+            if pos is not None:
+                candidatos = [(1.0, pos)]
+            else:
+                tris = trigrams(comercio_clave)
+                compartidos: Counter = Counter()
+                for t in tris:
+                    lista = self._postings.get(t)
+                    if lista and len(lista) <= MAX_POSTINGS:
+                        compartidos.update(lista)
+                candidatos = sorted(
+                    ((n / (len(tris) + len(self._trigramas[p]) - n), p) for p, n in compartidos.items()),
+                    reverse=True
+                )
+            for similitud, p in candidatos:
+                if similitud < UMBRAL_SIMILITUD:
+                    break
+                votos = self._votos[p]
+                if not votos:
+                    # Comercio cuyos votos se retiraron al reprocesar su archivo
+                    continue
+                categoria, n = votos.most_common(1)[0]
+                if n / sum(votos.values()) >= MIN_PUREZA:
+                    return categoria, similitud, self._claves[p]
+        return None
+
+    def _load(self, db, archivo_ids: Optional[Iterable[int]] = None):
+        """
+        Votos por archivo de las transacciones categorizadas por regla o a mano (no por la IA).
+        Los archivos pedidos sin votos quedan con un conjunto vacío.
+        """
+        sql = """
+            SELECT archivo_id, comercio_clave, categoria_id, COUNT(*) FROM transacciones_consolidadas
+            WHERE comercio_clave IS NOT NULL AND categoria_id IS NOT NULL AND categoria_id <> %s
+              AND fue_clasificado_por_ia = FALSE
+        """
+        params = [CATEGORIA_OTROS]
+        if archivo_ids is not None:
+            ids = list(archivo_ids)
+            if not ids:
+                return {}
+            sql += f" AND archivo_id IN ({', '.join(['%s'] * len(ids))})"
+            params.extend(ids)
+        cursor = db.cursor()
+        cursor.execute(sql + " GROUP BY archivo_id, comercio_clave, categoria_id", params)
+        rows = cursor.fetchall()
+        cursor.close()
+        por_archivo: Dict[int, Counter] = {i: Counter() for i in (archivo_ids or [])}
+        for archivo_id, comercio, categoria, cantidad in rows:
+            por_archivo.setdefault(archivo_id, Counter())[(comercio, categoria)] += int(cantidad)
+        return por_archivo
+
+    def rebuild(self, db):
+        nuevo = CategoryIndex()
+        for archivo_id, votos in nuevo._load(db).items():
+            nuevo.replace_file(archivo_id, votos)
+        with self._lock:
+            self._claves, self._trigramas, self._votos = nuevo._claves, nuevo._trigramas, nuevo._votos
+            self._posicion, self._postings = nuevo._posicion, nuevo._postings
+            self._por_archivo = nuevo._por_archivo
+            self.construido_en = time.monotonic()
+        logger.info(f"Índice de categorías por vecino construido con {len(self)} comercios.")
+
+    def update_for_file(self, db, archivo_id: int) -> int:
+        """Reemplaza los votos de un archivo recién consolidado (o reprocesado). Retorna los comercios del archivo."""
+        votos = self._load(db, [archivo_id])[archivo_id]
+        self.replace_file(archivo_id, votos)
+        return len(votos)
+
+
+_index: Optional[CategoryIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_category_index(db) -> CategoryIndex:
+    """
+    Índice compartido del proceso; se construye al primer uso y se renueva cada REBUILD_SECONDS.
+    La renovación la hace un solo hilo fuera del lock; los demás siguen usando el índice vigente.
+    """
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = CategoryIndex()
+        index = _index
+        vencido = time.monotonic() - index.construido_en > REBUILD_SECONDS
+        # Antes de la primera construcción cada hilo la espera (no hay índice que usar)
+        reconstruir = not index.construido_en or (vencido and not index.reconstruyendo)
+        if reconstruir:
+            index.reconstruyendo = True
+    if reconstruir:
+        try:
+            index.rebuild(db)
+        finally:
+            index.reconstruyendo = False
+    return index
@@ -0,0 +1,374 @@
+import os
+import json
+import fcntl
+import logging
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+EXPORT_PATH = os.getenv("EXPORT_PATH", "storage/exports")
+# Solo se exportan filas con cierta antigüedad: una transacción abierta puede confirmar
+# después filas con creado_en anterior a la marca de agua
+EXPORT_LAG_SECONDS = int(os.getenv("EXPORT_LAG_SECONDS", "300"))
+BATCH_ROWS = 10000
+FORMATOS = {"parquet": ".parquet", "arrow": ".arrow"}
+MARCA_INICIAL = "1970-01-02 00:00:00"
+
+# Fecha que define la partición anio=/mes= de cada tabla exportada
+PARTICIONES = {
+    "transacciones": "t.fecha_transaccion",
+    "metadatos": "COALESCE(m.periodo_hasta, DATE(m.creado_en))",
+    "items": "COALESCE(t.fecha_transaccion, DATE(i.creado_en))",
+}
+CREADO_EN = {"transacciones": "t.creado_en", "metadatos": "m.creado_en", "items": "i.creado_en"}
+
+# Consulta por tabla exportada; `fecha_particion` define anio=/mes= y no se escribe como columna
+TABLAS = {
+    "transacciones": """
+        SELECT t.transaccion_id, t.archivo_id, t.fecha_transaccion, t.descripcion_limpia, t.monto, t.tipo,
+               t.categoria_id, t.subcategoria, t.es_gasto_innecesario, t.fue_clasificado_por_ia, t.creado_en,
+               {particion} AS fecha_particion
+        FROM transacciones_consolidadas t
+        WHERE {filtro}
+        ORDER BY t.creado_en
+    """,
+    "metadatos": """
+        SELECT m.metadata_id, m.archivo_id, m.entidad_emisora, m.titular, m.identificador_cuenta,
+               m.periodo_desde, m.periodo_hasta, m.atributos_adicionales, m.creado_en,
+               {particion} AS fecha_particion
+        FROM metadatos_documento m
+        WHERE {filtro}
+        ORDER BY m.creado_en
+    """,
+    "items": """
+        SELECT i.item_id, i.transaccion_id, i.archivo_id, i.sku, i.producto, i.cantidad, i.precio_unitario,
+               i.precio_total, i.descuento, i.categoria_item, t.fecha_transaccion, i.creado_en,
+               {particion} AS fecha_particion
+        FROM items_compra i
+        LEFT JOIN transacciones_consolidadas t ON t.transaccion_id = i.transaccion_id
+        WHERE {filtro}
+        ORDER BY i.creado_en
+    """,
+}
+
+# Particiones con filas de un archivo, antes de que el reproceso las borre (solo se borran
+# metadatos y transacciones; los items se conservan con su fecha)
+INVALIDACIONES = {
+    "transacciones": "SELECT DISTINCT YEAR(t.fecha_transaccion), MONTH(t.fecha_transaccion) FROM transacciones_consolidadas t WHERE t.archivo_id = %s",
+    "metadatos": f"SELECT DISTINCT YEAR({PARTICIONES['metadatos']}), MONTH({PARTICIONES['metadatos']}) FROM metadatos_documento m WHERE m.archivo_id = %s",
+}
+
+
+def _consulta(tabla: str, filtro: str) -> str:
+    return TABLAS[tabla].format(particion=PARTICIONES[tabla], filtro=filtro)
+
+
+def _partition_key(fecha) -> tuple:
+    # SQLite entrega como texto las fechas calculadas (COALESCE, DATE())
+    if isinstance(fecha, str):
+        return int(fecha[:4]), int(fecha[5:7])
+    return fecha.year, fecha.month
+
+
+def invalidate_partitions(db_connection, tabla: str, archivo_id: int):
+    """
+    Registra en particiones_invalidadas las particiones de `tabla` con filas del archivo,
+    antes de borrarlas para reprocesar. La próxima exportación reescribe esas particiones
+    completas, así que las filas reinsertadas no se duplican y las eliminadas desaparecen.
+    No confirma: corre dentro de la transacción del reproceso.
+    """
+    cursor = db_connection.cursor()
+    cursor.execute(INVALIDACIONES[tabla], (archivo_id,))
+    particiones = [(anio, mes) for anio, mes in cursor.fetchall() if anio]
+    if particiones:
+        cursor.executemany("""
+            INSERT INTO particiones_invalidadas (tabla, anio, mes, registrado_en)
+            VALUES (%s, %s, %s, NOW())
+            ON DUPLICATE KEY UPDATE registrado_en = VALUES(registrado_en)
+        """, [(tabla, anio, mes) for anio, mes in particiones])
+    cursor.close()
+
+
+class ExportInProgressError(RuntimeError):
+    """Otra exportación tiene tomado el directorio de destino."""
+
+
+def _schemas():
+    """Columnas tipadas por tabla (pyarrow se importa solo al exportar)."""
+    import pyarrow as pa
+
+    monto = pa.decimal128(15, 2)
+    return {
+        "transacciones": pa.schema([
+            ("transaccion_id", pa.string()), ("archivo_id", pa.int32()), ("fecha_transaccion", pa.date32()),
+            ("descripcion_limpia", pa.string()), ("monto", monto), ("tipo", pa.string()),
+            ("categoria_id", pa.int32()), ("subcategoria", pa.string()), ("es_gasto_innecesario", pa.bool_()),
+            ("fue_clasificado_por_ia", pa.bool_()), ("creado_en", pa.timestamp("s")),
+        ]),
+        "metadatos": pa.schema([
+            ("metadata_id", pa.int32()), ("archivo_id", pa.int32()), ("entidad_emisora", pa.string()),
+            ("titular", pa.string()), ("identificador_cuenta", pa.string()), ("periodo_desde", pa.date32()),
+            ("periodo_hasta", pa.date32()), ("atributos_adicionales", pa.string()), ("creado_en", pa.timestamp("s")),
+        ]),
+        "items": pa.schema([
+            ("item_id", pa.int32()), ("transaccion_id", pa.string()), ("archivo_id", pa.int32()),
+            ("sku", pa.string()), ("producto", pa.string()), ("cantidad", pa.decimal128(10, 3)),
+            ("precio_unitario", monto), ("precio_total", monto), ("descuento", monto),
+            ("categoria_item", pa.string()), ("fecha_transaccion", pa.date32()), ("creado_en", pa.timestamp("s")),
+        ]),
+        "categorias": pa.schema([
+            ("categoria_id", pa.int32()), ("nombre", pa.string()), ("color_hex", pa.string()),
+        ]),
+    }
+
+
+def _coerce(row: Dict[str, Any], schema) -> Dict[str, Any]:
+    """Ajusta los tipos que el conector entrega distinto a la columna Arrow (BOOLEAN como 0/1, JSON como bytes)."""
+    import pyarrow as pa
+
+    for f in schema:
+        value = row.get(f.name)
+        if value is None:
+            continue
+        if pa.types.is_boolean(f.type):
+            row[f.name] = bool(value)
+        elif pa.types.is_string(f.type) and isinstance(value, (bytes, bytearray)):
+            row[f.name] = value.decode("utf-8")
+        elif pa.types.is_string(f.type) and not isinstance(value, str):
+            row[f.name] = json.dumps(value, ensure_ascii=False) if isinstance(value, (dict, list)) else str(value)
+    return row
+
+
+class _PartitionWriters:
+    """
+    Un archivo temporal por partición anio/mes (key=None: un solo archivo sin partición);
+    se publican con os.replace al terminar.
+    """
+
+    def __init__(self, base_dir: str, schema, formato: str, nombre: str):
+        self.base_dir = base_dir
+        self.schema = schema
+        self.formato = formato
+        self.nombre = nombre
+        self._writers: Dict[Optional[tuple], Any] = {}
+        self._paths: Dict[Optional[tuple], str] = {}
+
+    def _path_for(self, key: Optional[tuple]) -> str:
+        if key is None:
+            return os.path.join(self.base_dir, f"{self.nombre}{FORMATOS[self.formato]}")
+        anio, mes = key
+        directory = os.path.join(self.base_dir, f"anio={anio:04d}", f"mes={mes:02d}")
+        return os.path.join(directory, f"part-{self.nombre}{FORMATOS[self.formato]}")
+
+    def _open(self, key: Optional[tuple]):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        path = self._path_for(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        if self.formato == "parquet":
+            writer = pq.ParquetWriter(tmp_path, self.schema, compression="zstd")
+        else:
+            writer = pa.ipc.new_file(tmp_path, self.schema)
+        self._writers[key] = writer
+        self._paths[key] = path
+        return writer
+
+    def write(self, key: Optional[tuple], rows: List[Dict[str, Any]]):
+        import pyarrow as pa
+
+        writer = self._writers.get(key) or self._open(key)
+        table = pa.Table.from_pylist(rows, schema=self.schema)
+        if self.formato == "parquet":
+            writer.write_table(table)
+        else:
+            writer.write(table)
+
+    def commit(self) -> List[str]:
+        for writer in self._writers.values():
+            writer.close()
+        for path in self._paths.values():
+            os.replace(f"{path}.tmp", path)
+        return sorted(self._paths.values())
+
+    def abort(self):
+        for key, writer in self._writers.items():
+            try:
+                writer.close()
+            except Exception:
+                pass
+            try:
+                os.remove(f"{self._paths[key]}.tmp")
+            except OSError:
+                pass
+
+
+class ExportService:
+    """
+    Exporta las tablas consolidadas a archivos Parquet (o Arrow IPC) particionados por
+    anio=/mes=. Cada corrida escribe solo las filas con creado_en posterior a la marca de
+    agua de la corrida anterior, guardada en <destino>/_marcas_agua.json. Las particiones
+    que un reproceso registró en particiones_invalidadas se reescriben completas, de modo
+    que cada partición publicada refleja la base sin duplicados ni filas eliminadas.
+    La tabla de invalidaciones es global: con varios destinos, solo el primero que exporta
+    reescribe las particiones (los demás deben usar completo=True).
+    """
+
+    def __init__(self, db_connection, destino: str = EXPORT_PATH):
+        self.db = db_connection
+        self.destino = destino
+        self._marcas_path = os.path.join(destino, "_marcas_agua.json")
+
+    def _load_marcas(self) -> Dict[str, str]:
+        try:
+            with open(self._marcas_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def _save_marcas(self, marcas: Dict[str, str]):
+        tmp_path = f"{self._marcas_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(marcas, f, indent=2)
+        os.replace(tmp_path, self._marcas_path)
+
+    def _upper_bound(self) -> str:
+        cursor = self.db.cursor()
+        cursor.execute("SELECT NOW() - INTERVAL %s SECOND", (EXPORT_LAG_SECONDS,))
+        hasta = cursor.fetchone()[0]
+        cursor.close()
+        # SQLite ya entrega 'AAAA-MM-DD HH:MM:SS'
+        return hasta if isinstance(hasta, str) else hasta.strftime("%Y-%m-%d %H:%M:%S")
+
+    def _invalidated(self, tabla: str, hasta: str) -> List[tuple]:
+        """Particiones invalidadas por reprocesos confirmados hasta la cota superior de la corrida."""
+        cursor = self.db.cursor()
+        cursor.execute(
+            "SELECT anio, mes FROM particiones_invalidadas WHERE tabla = %s AND registrado_en <= %s ORDER BY anio, mes",
+            (tabla, hasta),
+        )
+        particiones = [(int(anio), int(mes)) for anio, mes in cursor.fetchall()]
+        cursor.close()
+        return particiones
+
+    def _release_invalidated(self, tabla: str, hasta: str):
+        cursor = self.db.cursor()
+        cursor.execute("DELETE FROM particiones_invalidadas WHERE tabla = %s AND registrado_en <= %s", (tabla, hasta))
+        cursor.close()
+        self.db.commit()
+
+    def _write_rows(self, cursor, writers: _PartitionWriters, schema, omitir=frozenset()) -> int:
+        filas = 0
+        while True:
+            rows = cursor.fetchmany(BATCH_ROWS)
+            if not rows:
+                break
+            partitions: Dict[tuple, List[Dict[str, Any]]] = {}
+            for row in rows:
+                key = _partition_key(row.pop("fecha_particion"))
+                if key not in omitir:
+                    partitions.setdefault(key, []).append(_coerce(row, schema))
+            for key, part_rows in partitions.items():
+                writers.write(key, part_rows)
+                filas += len(part_rows)
+        return filas
+
+    def _export_table(self, tabla: str, schema, formato: str, desde: str, hasta: str, run_id: str,
+                      reescribir: List[tuple] = ()) -> Dict[str, Any]:
+        """
+        Filas nuevas desde la marca de agua, salvo las de particiones a reescribir: esas se
+        exportan completas (todas las filas hasta `hasta`) y reemplazan a las partes anteriores.
+        """
+        writers = _PartitionWriters(os.path.join(self.destino, tabla), schema, formato, run_id)
+        creado_en = CREADO_EN[tabla]
+        particion = PARTICIONES[tabla]
+        filas = 0
+        cursor = self.db.cursor(dictionary=True)
+        try:
+            cursor.execute(_consulta(tabla, f"{creado_en} > %s AND {creado_en} <= %s"), (desde, hasta))
+            filas += self._write_rows(cursor, writers, schema, omitir=set(reescribir))
+            consulta_particion = _consulta(tabla, f"{particion} >= %s AND {particion} < %s AND {creado_en} <= %s")
+            for anio, mes in reescribir:
+                siguiente = (anio + 1, 1) if mes == 12 else (anio, mes + 1)
+                cursor.execute(consulta_particion, (f"{anio:04d}-{mes:02d}-01", f"{siguiente[0]:04d}-{siguiente[1]:02d}-01", hasta))
+                filas += self._write_rows(cursor, writers, schema)
+            archivos = writers.commit()
+        except Exception:
+            writers.abort()
+            raise
+        finally:
+            cursor.close()
+        for key in reescribir:
+            self._remove_previous(tabla, run_id, key)
+        return {"filas": filas, "archivos": archivos, "reescritas": len(reescribir), "desde": desde, "hasta": hasta}
+
+    def _export_categorias(self, schema, formato: str) -> str:
+        """La dimensión de categorías es pequeña: se reescribe completa en cada corrida."""
+        cursor = self.db.cursor(dictionary=True)
+        cursor.execute("SELECT categoria_id, nombre, color_hex FROM categorias_principales ORDER BY categoria_id")
+        rows = cursor.fetchall()
+        cursor.close()
+        writers = _PartitionWriters(self.destino, schema, formato, "categorias")
+        writers.write(None, rows)
+        return writers.commit()[0]
+
+    def _remove_previous(self, tabla: str, run_id: str, key: Optional[tuple] = None):
+        """
+        Elimina las partes de corridas anteriores una vez escrita la nueva: de toda la tabla
+        (modo completo) o solo de la partición `key` (partición reescrita).
+        """
+        base = os.path.join(self.destino, tabla)
+        if key is not None:
+            base = os.path.join(base, f"anio={key[0]:04d}", f"mes={key[1]:02d}")
+        for dirpath, _, filenames in os.walk(base):
+            for name in filenames:
+                if name.startswith("part-") and not name.startswith(f"part-{run_id}."):
+                    os.remove(os.path.join(dirpath, name))
+
+    def export(self, tablas: Optional[List[str]] = None, formato: str = "parquet", completo: bool = False) -> Dict[str, Any]:
+        """
+        Exporta las tablas pedidas (todas por defecto). Con completo=True se ignora la marca de
+        agua y las partes anteriores se reemplazan por una exportación íntegra.
+        """
+        tablas = tablas or list(TABLAS)
+        invalidas = [t for t in tablas if t not in TABLAS]
+        if invalidas:
+            raise ValueError(f"Tablas desconocidas: {', '.join(invalidas)}. Opciones: {', '.join(TABLAS)}.")
+        if formato not in FORMATOS:
+            raise ValueError(f"Formato desconocido: {formato}. Opciones: {', '.join(FORMATOS)}.")
+
+        os.makedirs(self.destino, exist_ok=True)
+        with open(os.path.join(self.destino, ".lock"), "w") as lock_file:
+            try:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                raise ExportInProgressError("Ya hay una exportación en curso para este destino.")
+
+            schemas = _schemas()
+            marcas = self._load_marcas()
+            hasta = self._upper_bound()
+            run_id = datetime.now().strftime("%Y%m%dT%H%M%S%f")
+            resultado = {"destino": self.destino, "formato": formato, "tablas": {}}
+
+            for tabla in tablas:
+                desde = MARCA_INICIAL if completo else marcas.get(tabla, MARCA_INICIAL)
+                reescribir = [] if completo or tabla not in INVALIDACIONES else self._invalidated(tabla, hasta)
+                info = self._export_table(tabla, schemas[tabla], formato, desde, hasta, run_id, reescribir)
+                if completo:
+                    self._remove_previous(tabla, run_id)
+                # La marca avanza y las invalidaciones se descartan solo después de publicar los archivos de la tabla
+                marcas[tabla] = hasta
+                self._save_marcas(marcas)
+                if tabla in INVALIDACIONES:
+                    self._release_invalidated(tabla, hasta)
+                resultado["tablas"][tabla] = info
+                logger.info(
+                    f"Exportación {tabla}: {info['filas']} filas en {len(info['archivos'])} particiones, "
+                    f"{info['reescritas']} reescritas ({desde} → {hasta})."
+                )
+
+            resultado["categorias"] = self._export_categorias(schemas["categorias"], formato)
+            return resultado
+
@@ -0,0 +1,234 @@
+"""
+Vigilante de ingesta_masiva/<origen>/<tipo_doc>/: proceso de larga vida que ingiere los
+archivos nuevos o modificados llamando al pipeline de parsers en el mismo proceso.
+
+Uso (desde backend/): python -m app.services.folder_watcher --raiz ../ingesta_masiva --workers 2
+"""
+import os
+import signal
+import hashlib
+import logging
+import argparse
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, Optional, Tuple
+from ..db import get_pooled_connection
+from ..parsers.registry import get_parser
+from ..core.llm_limiter import llm_context, PRIORIDAD_MASIVA
+from .bulk_upload import split_entry_path, DEFAULT_WORKERS, MAX_WORKERS
+
+logger = logging.getLogger(__name__)
+
+WATCH_DIR = os.getenv("WATCH_DIR", "ingesta_masiva")
+POLL_SECONDS = float(os.getenv("WATCH_POLL_SECONDS", "2"))
+# Un archivo se procesa cuando su tamaño y mtime no cambian durante este lapso
+DEBOUNCE_SECONDS = float(os.getenv("WATCH_DEBOUNCE_SECONDS", "5"))
+# Descargas o copias en curso
+SUFIJOS_PARCIALES = (".part", ".tmp", ".crdownload", ".download", "~")
+
+
+class WatchIndex:
+    """Índice persistente (tabla ingesta_vigilada) de los archivos ya vistos por el vigilante."""
+
+    def __init__(self, db_connection):
+        self.db = db_connection
+
+    def load(self) -> Dict[str, Dict[str, Any]]:
+        cursor = self.db.cursor(dictionary=True)
+        cursor.execute("SELECT ruta, tamano_bytes, mtime_ns, hash_archivo, archivo_id, estado FROM ingesta_vigilada")
+        rows = {row["ruta"]: row for row in cursor.fetchall()}
+        cursor.close()
+        return rows
+
+    def save(self, entrada: Dict[str, Any]):
+        cursor = self.db.cursor()
+        cursor.execute("""
+            INSERT INTO ingesta_vigilada (ruta, tamano_bytes, mtime_ns, hash_archivo, archivo_id, estado, mensaje)
+            VALUES (%s, %s, %s, %s, %s, %s, %s)
+            ON DUPLICATE KEY UPDATE
+                tamano_bytes = VALUES(tamano_bytes), mtime_ns = VALUES(mtime_ns), hash_archivo = VALUES(hash_archivo),
+                archivo_id = VALUES(archivo_id), estado = VALUES(estado), mensaje = VALUES(mensaje)
+        """, (
+            entrada["ruta"], entrada["tamano_bytes"], entrada["mtime_ns"], entrada["hash_archivo"],
+            entrada["archivo_id"], entrada["estado"], entrada["mensaje"]
+        ))
+        self.db.commit()
+        cursor.close()
+
+
+def _subdirs(path: str):
+    with os.scandir(path) as it:
+        return [e for e in it if e.is_dir() and not e.name.startswith(".")]
+
+
+class FolderWatcher:
+    """
+    Sondea la carpeta cada POLL_SECONDS con stat (sin leer archivos) y compara tamaño y mtime
+    contra el índice. Los cambios esperan DEBOUNCE_SECONDS estables antes de encolarse en un
+    pool de workers con conexiones del pool de la base. Un archivo cuyo contenido no cambió
+    (mismo hash) solo actualiza el índice. Los errores quedan registrados y no se reintentan
+    hasta que el archivo cambie (POST /reprocess reanuda los archivos registrados con error).
+    """
+
+    def __init__(self, raiz: str = None, workers: int = None, debounce: float = None, poll: float = None):
+        self.raiz = raiz or WATCH_DIR
+        self.workers = max(1, min(workers or DEFAULT_WORKERS, MAX_WORKERS))
+        self.debounce = DEBOUNCE_SECONDS if debounce is None else debounce
+        self.poll = poll or POLL_SECONDS
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._indice: Dict[str, Dict[str, Any]] = {}
+        # ruta -> ((tamaño, mtime_ns), instante desde el que la firma está estable)
+        self._candidatos: Dict[str, Tuple[Tuple[int, int], float]] = {}
+        self._en_curso: Dict[str, Future] = {}
+        self._pool: Optional[ThreadPoolExecutor] = None
+
+    def _connection(self):
+        # Un worker por conexión más la del hilo de sondeo
+        return get_pooled_connection(self.workers + 1)
+
+    def _scan(self) -> Dict[str, os.stat_result]:
+        """Archivos de <raiz>/<origen>/<tipo_doc>/ con su stat, por ruta relativa."""
+        vistos = {}
+        for origen in _subdirs(self.raiz):
+            for tipo_doc in _subdirs(origen.path):
+                with os.scandir(tipo_doc.path) as it:
+                    for entry in it:
+                        if entry.name.startswith(".") or entry.name.lower().endswith(SUFIJOS_PARCIALES):
+                            continue
+                        ruta = f"{origen.name}/{tipo_doc.name}/{entry.name}"
+                        if entry.is_file() and split_entry_path(ruta):
+                            vistos[ruta] = entry.stat()
+        return vistos
+
+    def poll_once(self) -> int:
+        """Un ciclo de sondeo: detecta cambios, aplica el debounce y encola los estables. Retorna los encolados."""
+        ahora = time.monotonic()
+        actuales = self._scan()
+        encolados = 0
+        for ruta, st in actuales.items():
+            firma = (st.st_size, st.st_mtime_ns)
+            with self._lock:
+                if ruta in self._en_curso:
+                    continue
+                conocido = self._indice.get(ruta)
+            if conocido and (conocido["tamano_bytes"], conocido["mtime_ns"]) == firma:
+                self._candidatos.pop(ruta, None)
+                continue
+            previo = self._candidatos.get(ruta)
+            if previo is None or previo[0] != firma:
+                # Nuevo o todavía escribiéndose: se reinicia la espera
+                self._candidatos[ruta] = (firma, ahora)
+                continue
+            if ahora - previo[1] < self.debounce or not st.st_size:
+                continue
+            del self._candidatos[ruta]
+            with self._lock:
+                self._en_curso[ruta] = self._pool.submit(self._ingest, ruta, firma)
+            encolados += 1
+
+        for ruta in [r for r in self._candidatos if r not in actuales]:
+            del self._candidatos[ruta]
+        return encolados
+
+    def _ingest(self, ruta: str, firma: Tuple[int, int]):
+        """Tarea de un worker: lee, compara el hash con el índice y corre el pipeline."""
+        try:
+            self._ingest_file(ruta, firma)
+        except Exception as e:
+            logger.error(f"Vigilante: error inesperado con {ruta}: {repr(e)}")
+        finally:
+            with self._lock:
+                self._en_curso.pop(ruta, None)
+
+    def _ingest_file(self, ruta: str, firma: Tuple[int, int]):
+        origen, tipo_doc, filename = split_entry_path(ruta)
+        try:
+            with open(os.path.join(self.raiz, ruta), "rb") as f:
+                content = f.read()
+        except OSError as e:
+            logger.warning(f"Vigilante: {ruta} ya no se puede leer ({e}).")
+            return
+        if len(content) != firma[0]:
+            # Cambió otra vez desde el sondeo: el próximo ciclo lo vuelve a esperar
+            return
+        file_hash = hashlib.sha256(content).hexdigest()
+
+        db = self._connection()
+        if db is None:
+            # Sin índice actualizado: se reintenta tras el próximo debounce
+            return
+        try:
+            with self._lock:
+                conocido = self._indice.get(ruta)
+            if conocido and conocido["hash_archivo"] == file_hash:
+                result = {"status": conocido["estado"], "archivo_id": conocido["archivo_id"], "message": "Contenido sin cambios."}
+            else:
+                logger.info(f"Vigilante: procesando {ruta}")
+                try:
+                    parser = get_parser(origen, tipo_doc, db)
+                    with llm_context(prioridad=PRIORIDAD_MASIVA):
+                        result = parser.run(filename=filename, file_content=content, tipo_doc=tipo_doc, origen=origen)
+                except ValueError as e:
+                    result = {"status": "error", "message": str(e)}
+                logger.info(f"Vigilante: {ruta} -> {result['status']}")
+
+            entrada = {
+                "ruta": ruta, "tamano_bytes": firma[0], "mtime_ns": firma[1], "hash_archivo": file_hash,
+                "archivo_id": result.get("archivo_id"), "estado": result["status"], "mensaje": result.get("message"),
+            }
+            WatchIndex(db).save(entrada)
+            with self._lock:
+                self._indice[ruta] = entrada
+        finally:
+            if db.is_connected():
+                db.close()
+
+    def run(self):
+        """Bucle principal hasta stop(); al salir espera los archivos en curso."""
+        os.makedirs(self.raiz, exist_ok=True)
+        db = self._connection()
+        if db is None:
+            raise RuntimeError("Sin conexión a la base de datos para cargar el índice del vigilante.")
+        try:
+            self._indice = WatchIndex(db).load()
+        finally:
+            db.close()
+        logger.info(
+            f"Vigilando {os.path.abspath(self.raiz)} cada {self.poll:g}s (debounce {self.debounce:g}s, "
+            f"{self.workers} workers, {len(self._indice)} archivos en el índice)."
+        )
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="vigilante")
+        try:
+            while not self._stop.is_set():
+                try:
+                    self.poll_once()
+                except OSError as e:
+                    logger.warning(f"Vigilante: no se pudo recorrer {self.raiz}: {e}")
+                self._stop.wait(self.poll)
+        finally:
+            # Los archivos aún en cola se descartan; quedan fuera del índice y se toman al reiniciar
+            self._pool.shutdown(wait=True, cancel_futures=True)
+            logger.info("Vigilante detenido.")
+
+    def stop(self):
+        self._stop.set()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingesta continua de <raiz>/<origen>/<tipo_doc>/<archivo>.")
+    parser.add_argument("--raiz", default=WATCH_DIR, help="Carpeta vigilada")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help=f"Archivos en paralelo (máx. {MAX_WORKERS})")
+    parser.add_argument("--debounce", type=float, default=DEBOUNCE_SECONDS, help="Segundos sin cambios antes de procesar")
+    parser.add_argument("--intervalo", type=float, default=POLL_SECONDS, help="Segundos entre sondeos")
+    args = parser.parse_args()
+
+    watcher = FolderWatcher(args.raiz, args.workers, args.debounce, args.intervalo)
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, lambda *_: watcher.stop())
+    watcher.run()
+
+
+if __name__ == "__main__":
+    main()
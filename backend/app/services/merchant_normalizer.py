@@ -0,0 +1,139 @@
+import os
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional
+from ..core.normalization import merchant_key
+
+logger = logging.getLogger(__name__)
+
+# Cambiar al modificar merchant_key: las claves automáticas de versiones previas se recalculan
+NORMALIZER_VERSION = 1
+CACHE_SIZE = int(os.getenv("MERCHANT_CACHE_SIZE", "20000"))
+MAX_CLAVE = 150
+MAX_DESCRIPCION = 255
+IN_CHUNK = 500
+
+# Glosa cruda -> clave canónica, compartido por las instancias del proceso (LRU acotado)
+_cache: "OrderedDict[str, str]" = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def _cache_get(descripcion: str) -> Optional[str]:
+    with _cache_lock:
+        clave = _cache.get(descripcion)
+        if clave is not None:
+            _cache.move_to_end(descripcion)
+        return clave
+
+
+def _cache_put(descripcion: str, clave: str):
+    with _cache_lock:
+        _cache[descripcion] = clave
+        _cache.move_to_end(descripcion)
+        while len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+
+
+def _clean(descripcion: Optional[str]) -> str:
+    return (descripcion or "").strip()[:MAX_DESCRIPCION]
+
+
+def clear_cache():
+    """Descarta el caché del proceso (ej: tras editar alias en comercios_normalizados)."""
+    with _cache_lock:
+        _cache.clear()
+
+
+class MerchantNormalizer:
+    """
+    Traduce glosas crudas a claves canónicas de comercio. Consulta primero el caché del
+    proceso, luego la tabla comercios_normalizados (que también admite alias manuales) y
+    solo calcula merchant_key para las glosas nunca vistas, persistiendo el resultado.
+    """
+
+    def __init__(self, db_connection):
+        self.db = db_connection
+
+    def canonical_many(self, descripciones: Iterable[str]) -> Dict[str, str]:
+        """Clave canónica por glosa recibida; cada glosa distinta se normaliza una sola vez."""
+        originales = set(descripciones)
+        result: Dict[str, str] = {}
+        pendientes = []
+        for desc in {_clean(d) for d in originales}:
+            clave = _cache_get(desc)
+            if clave is not None:
+                result[desc] = clave
+            else:
+                pendientes.append(desc)
+        if not pendientes:
+            return {d: result[_clean(d)] for d in originales}
+
+        conocidas = self._lookup(pendientes)
+        nuevas = []
+        for desc in pendientes:
+            clave = conocidas.get(desc)
+            if clave is None:
+                clave = merchant_key(desc)[:MAX_CLAVE]
+                nuevas.append((desc, clave, NORMALIZER_VERSION))
+            result[desc] = clave
+            _cache_put(desc, clave)
+        if nuevas:
+            self._store(nuevas)
+        return {d: result[_clean(d)] for d in originales}
+
+    def canonical(self, descripcion: str) -> str:
+        return self.canonical_many([descripcion])[descripcion]
+
+    def _lookup(self, descripciones) -> Dict[str, str]:
+        """Mapeos persistidos vigentes: alias manuales o claves de la versión actual."""
+        conocidas = {}
+        cursor = self.db.cursor()
+        for i in range(0, len(descripciones), IN_CHUNK):
+            lote = descripciones[i:i + IN_CHUNK]
+            cursor.execute(f"""
+                SELECT descripcion_cruda, comercio_clave FROM comercios_normalizados
+                WHERE descripcion_cruda IN ({', '.join(['%s'] * len(lote))})
+                  AND (manual = TRUE OR version = %s)
+            """, [*lote, NORMALIZER_VERSION])
+            conocidas.update({r[0]: r[1] for r in cursor.fetchall()})
+        cursor.close()
+        return conocidas
+
+    def _store(self, filas):
+        # Sin commit propio: se confirma junto con la consolidación que lo invoca
+        cursor = self.db.cursor()
+        cursor.executemany("""
+            INSERT INTO comercios_normalizados (descripcion_cruda, comercio_clave, version)
+            VALUES (%s, %s, %s)
+            ON DUPLICATE KEY UPDATE
+                comercio_clave = IF(manual, comercio_clave, VALUES(comercio_clave)),
+                version = IF(manual, version, VALUES(version))
+        """, filas)
+        cursor.close()
+
+    def backfill(self, batch: int = 5000) -> int:
+        """Completa comercio_clave en transacciones anteriores a la columna. Retorna filas actualizadas."""
+        total = 0
+        while True:
+            cursor = self.db.cursor()
+            cursor.execute(
+                "SELECT DISTINCT descripcion_limpia FROM transacciones_consolidadas WHERE comercio_clave IS NULL LIMIT %s",
+                (batch,)
+            )
+            descripciones = [r[0] for r in cursor.fetchall()]
+            cursor.close()
+            if not descripciones:
+                break
+            claves = self.canonical_many(descripciones)
+            cursor = self.db.cursor()
+            for desc in descripciones:
+                cursor.execute(
+                    "UPDATE transacciones_consolidadas SET comercio_clave = %s WHERE descripcion_limpia = %s AND comercio_clave IS NULL",
+                    (claves[desc], desc)
+                )
+                total += cursor.rowcount
+            cursor.close()
+            self.db.commit()
+        logger.info(f"Normalización de comercios: {total} transacciones completadas.")
+        return total
@@ -0,0 +1,177 @@
+import os
+import logging
+from statistics import median
+from typing import Any, Dict, Iterable, List, Optional, Set
+from ..core.normalization import product_key
+
+logger = logging.getLogger(__name__)
+
+TIPO_SUGERENCIA = "Alerta_Precio"
+PREFIJO_REFERENCIA = "precio:"
+MAX_CLAVE = 140  # clave_referencia admite 150 caracteres con el prefijo
+
+# Precios previos usados como referencia (mediana) y alza mínima para alertar
+VENTANA_MEDIANA = int(os.getenv("PRICE_MEDIAN_WINDOW", "5"))
+UMBRAL_ALZA = float(os.getenv("PRICE_ALERT_THRESHOLD", "0.10"))
+IN_CHUNK = 500
+
+
+class PriceHistoryIndex:
+    """
+    Índice de precios por producto (historial_precios): una fila por item de boleta con su
+    clave normalizada, fecha y precio unitario. Se alimenta de forma incremental al vincular
+    boletas y responde consultas por producto sin recorrer items_compra.
+    """
+
+    def __init__(self, db_connection):
+        self.db = db_connection
+
+    def append(self, archivo_id: Optional[int] = None) -> int:
+        """Indexa los items aún no indexados (de un archivo o de todos). Retorna las filas nuevas."""
+        sql = """
+            SELECT i.item_id, i.archivo_id, i.sku, i.producto, i.cantidad, i.precio_unitario, i.precio_total,
+                   t.fecha_transaccion
+            FROM items_compra i
+            JOIN transacciones_consolidadas t ON t.transaccion_id = i.transaccion_id
+            LEFT JOIN historial_precios h ON h.item_id = i.item_id
+            WHERE h.item_id IS NULL
+        """
+        params = ()
+        if archivo_id is not None:
+            sql += " AND i.archivo_id = %s"
+            params = (archivo_id,)
+        cursor = self.db.cursor(dictionary=True)
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+        cursor.close()
+
+        values = []
+        for r in rows:
+            precio = r["precio_unitario"]
+            if not precio and r["precio_total"] and r["cantidad"]:
+                precio = r["precio_total"] / r["cantidad"]
+            if not precio or precio <= 0:
+                continue
+            values.append((r["item_id"], product_key(r["producto"], r["sku"]), r["producto"], r["sku"],
+                           r["fecha_transaccion"], precio, r["archivo_id"]))
+        if values:
+            cursor = self.db.cursor()
+            cursor.executemany("""
+                INSERT IGNORE INTO historial_precios
+                (item_id, producto_clave, producto, sku, fecha, precio_unitario, archivo_id)
+                VALUES (%s, %s, %s, %s, %s, %s, %s)
+            """, values)
+            self.db.commit()
+            cursor.close()
+        logger.info(f"Historial de precios: {len(values)} items indexados.")
+        return len(values)
+
+    def last_prices(self, claves: Iterable[str], n: int = VENTANA_MEDIANA + 1) -> Dict[str, List[Dict[str, Any]]]:
+        """Últimos `n` precios por producto, del más reciente al más antiguo."""
+        claves = list(claves)
+        result: Dict[str, List[Dict[str, Any]]] = {c: [] for c in claves}
+        cursor = self.db.cursor(dictionary=True)
+        for i in range(0, len(claves), IN_CHUNK):
+            lote = claves[i:i + IN_CHUNK]
+            # El índice (producto_clave, fecha) entrega cada producto ya ordenado
+            cursor.execute(f"""
+                SELECT producto_clave, producto, fecha, precio_unitario FROM historial_precios
+                WHERE producto_clave IN ({', '.join(['%s'] * len(lote))})
+                ORDER BY producto_clave, fecha DESC, item_id DESC
+            """, lote)
+            for row in cursor.fetchall():
+                precios = result[row["producto_clave"]]
+                if len(precios) < n:
+                    precios.append(row)
+        cursor.close()
+        return result
+
+    def rolling_median(self, clave: str, window: int = VENTANA_MEDIANA) -> Optional[float]:
+        """Mediana de los últimos `window` precios del producto."""
+        precios = self.last_prices([clave], n=window)[clave]
+        return float(median(float(p["precio_unitario"]) for p in precios)) if precios else None
+
+    def increases(self, claves: Iterable[str], umbral: float = UMBRAL_ALZA) -> List[Dict[str, Any]]:
+        """
+        Productos cuyo último precio supera en más de `umbral` a la mediana de los
+        VENTANA_MEDIANA precios anteriores.
+        """
+        alzas = []
+        for clave, precios in self.last_prices(claves).items():
+            if len(precios) < 2:
+                continue
+            ultimo = float(precios[0]["precio_unitario"])
+            referencia = float(median(float(p["precio_unitario"]) for p in precios[1:]))
+            if referencia > 0 and ultimo / referencia - 1 > umbral:
+                alzas.append({
+                    "producto_clave": clave,
+                    "producto": precios[0]["producto"],
+                    "fecha": precios[0]["fecha"],
+                    "precio": ultimo,
+                    "mediana_previa": referencia,
+                    "alza": ultimo / referencia - 1,
+                    "muestras": len(precios) - 1,
+                })
+        return alzas
+
+    def pending_keys(self) -> Set[str]:
+        """Productos con precios nuevos desde la última corrida de alertas."""
+        cursor = self.db.cursor()
+        cursor.execute("SELECT DISTINCT producto_clave FROM historial_precios WHERE revisado = FALSE")
+        claves = {r[0] for r in cursor.fetchall()}
+        cursor.close()
+        return claves
+
+    def mark_reviewed(self, claves: Iterable[str]):
+        claves = list(claves)
+        cursor = self.db.cursor()
+        for i in range(0, len(claves), IN_CHUNK):
+            lote = claves[i:i + IN_CHUNK]
+            cursor.execute(
+                f"UPDATE historial_precios SET revisado = TRUE WHERE revisado = FALSE AND producto_clave IN ({', '.join(['%s'] * len(lote))})",
+                lote
+            )
+        cursor.close()
+
+
+class PriceAlertJob:
+    """
+    Proceso por lotes de alertas de precio: evalúa solo los productos con precios nuevos
+    (revisado = FALSE) y mantiene una sugerencia Alerta_Precio por producto.
+    """
+
+    def __init__(self, db_connection, umbral: float = UMBRAL_ALZA):
+        self.db = db_connection
+        self.index = PriceHistoryIndex(db_connection)
+        self.umbral = umbral
+
+    def run(self) -> Dict[str, int]:
+        self.index.append()
+        claves = self.index.pending_keys()
+        alzas = self.index.increases(claves, self.umbral) if claves else []
+
+        cursor = self.db.cursor()
+        # Un alza nueva reabre la alerta del producto aunque la anterior se haya descartado
+        sql = """
+            INSERT INTO sugerencias_ahorro (tipo, clave_referencia, titulo, descripcion, monto_estimado_ahorro)
+            VALUES (%s, %s, %s, %s, %s)
+            ON DUPLICATE KEY UPDATE titulo = VALUES(titulo), descripcion = VALUES(descripcion),
+                monto_estimado_ahorro = VALUES(monto_estimado_ahorro), estado = 'Pendiente'
+        """
+        for a in alzas:
+            descripcion = (
+                f"El {a['fecha']} pagaste ${a['precio']:,.0f} por unidad, un {a['alza'] * 100:.1f}% más que la "
+                f"mediana de tus {a['muestras']} compras anteriores (${a['mediana_previa']:,.0f})."
+            )
+            cursor.execute(sql, (
+                TIPO_SUGERENCIA,
+                f"{PREFIJO_REFERENCIA}{a['producto_clave'][:MAX_CLAVE]}",
+                f"Alza de precio: {a['producto'][:200]}",
+                descripcion,
+                round(a["precio"] - a["mediana_previa"], 2),
+            ))
+        cursor.close()
+        self.index.mark_reviewed(claves)
+        self.db.commit()
+        logger.info(f"Alertas de precio: {len(alzas)} alzas sobre {len(claves)} productos con precios nuevos.")
+        return {"productos_revisados": len(claves), "alertas": len(alzas)}
@@ -0,0 +1,186 @@
+import os
+import json
+import logging
+from datetime import date
+from statistics import mean, pstdev
+from typing import Any, Dict, Iterable, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Meses considerados en las métricas (ventana móvil que termina en el último mes con datos)
+VENTANA_MESES = int(os.getenv("PROFILE_WINDOW_MONTHS", "12"))
+TOLERANCIA_VALIDACION = 0.01
+
+
+def is_enabled() -> bool:
+    return os.getenv("PROFILE_METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+
+
+def _month_index(anio_mes: int) -> int:
+    return (anio_mes // 100) * 12 + (anio_mes % 100) - 1
+
+
+def _anio_mes(index: int) -> int:
+    return (index // 12) * 100 + index % 12 + 1
+
+
+def compute_metrics(filas: Iterable[Tuple[int, str, int, float]], categorias: Dict[int, str],
+                    ventana: int = VENTANA_MESES) -> Dict[str, Any]:
+    """
+    Métricas del perfil a partir de agregados (anio_mes AAAAMM, tipo, categoria_id, monto).
+    Gasto mensual, participación por categoría, razón ingreso/gasto y volatilidad del gasto.
+    """
+    filas = list(filas)
+    if not filas:
+        return {}
+    ultimo = max(_month_index(f[0]) for f in filas)
+    primero = max(min(_month_index(f[0]) for f in filas), ultimo - ventana + 1)
+    meses = [_anio_mes(i) for i in range(primero, ultimo + 1)]
+
+    gasto = {m: 0.0 for m in meses}
+    ingreso = {m: 0.0 for m in meses}
+    por_categoria: Dict[str, float] = {}
+    for anio_mes, tipo, categoria_id, monto in filas:
+        if anio_mes not in gasto:
+            continue
+        if tipo == "Gasto":
+            gasto[anio_mes] += float(monto)
+            nombre = categorias.get(categoria_id, "Sin categoría")
+            por_categoria[nombre] = por_categoria.get(nombre, 0.0) + float(monto)
+        elif tipo == "Ingreso":
+            ingreso[anio_mes] += float(monto)
+
+    serie_gasto = [gasto[m] for m in meses]
+    total_gasto = sum(serie_gasto)
+    total_ingreso = sum(ingreso.values())
+    gasto_mensual = mean(serie_gasto)
+    return {
+        "ventana": {"desde": meses[0], "hasta": meses[-1], "meses": len(meses)},
+        "gasto_mensual_promedio": round(gasto_mensual, 2),
+        "gasto_ultimo_mes": round(serie_gasto[-1], 2),
+        "ingreso_mensual_promedio": round(total_ingreso / len(meses), 2),
+        "razon_ingreso_gasto": round(total_ingreso / total_gasto, 4) if total_gasto else None,
+        "volatilidad_gasto": round(pstdev(serie_gasto) / gasto_mensual, 4) if gasto_mensual and len(meses) > 1 else 0.0,
+        "participacion_categorias": {
+            nombre: round(monto / total_gasto, 4)
+            for nombre, monto in sorted(por_categoria.items(), key=lambda kv: -kv[1])
+        } if total_gasto else {},
+        "serie_mensual": [{"mes": m, "gasto": round(gasto[m], 2), "ingreso": round(ingreso[m], 2)} for m in meses],
+    }
+
+
+def profile_name(metrics: Dict[str, Any]) -> str:
+    razon = metrics.get("razon_ingreso_gasto")
+    if razon is None:
+        return "Sin gastos"
+    if razon >= 1.2:
+        return "Ahorrador"
+    if razon >= 1.0:
+        return "Equilibrio"
+    return "Deficitario"
+
+
+class ProfileMetrics:
+    """
+    Métricas de perfil_usuario sobre agregados mensuales por archivo (agregados_mensuales).
+    Cada consolidación reemplaza solo los agregados de su archivo; el snapshot se calcula
+    sobre esa tabla pequeña en vez de recorrer transacciones_consolidadas.
+    """
+
+    _SELECT_AGREGADOS = """
+        SELECT archivo_id, YEAR(fecha_transaccion) * 100 + MONTH(fecha_transaccion), tipo,
+               COALESCE(categoria_id, 0), SUM(monto), COUNT(*)
+        FROM transacciones_consolidadas
+    """
+    _GROUP_BY = " GROUP BY archivo_id, YEAR(fecha_transaccion) * 100 + MONTH(fecha_transaccion), tipo, COALESCE(categoria_id, 0)"
+
+    def __init__(self, db_connection):
+        self.db = db_connection
+
+    def _categorias(self) -> Dict[int, str]:
+        cursor = self.db.cursor()
+        cursor.execute("SELECT categoria_id, nombre FROM categorias_principales")
+        categorias = {r[0]: r[1] for r in cursor.fetchall()}
+        cursor.close()
+        return categorias
+
+    def _aggregated_rows(self) -> List[Tuple[int, str, int, float]]:
+        cursor = self.db.cursor()
+        cursor.execute("""
+            SELECT anio_mes, tipo, categoria_id, SUM(monto_total) FROM agregados_mensuales
+            GROUP BY anio_mes, tipo, categoria_id
+        """)
+        rows = cursor.fetchall()
+        cursor.close()
+        return rows
+
+    def _scanned_rows(self) -> List[Tuple[int, str, int, float]]:
+        """Los mismos agregados calculados directamente desde las transacciones (validación)."""
+        cursor = self.db.cursor()
+        cursor.execute("""
+            SELECT YEAR(fecha_transaccion) * 100 + MONTH(fecha_transaccion), tipo, COALESCE(categoria_id, 0), SUM(monto)
+            FROM transacciones_consolidadas
+            GROUP BY YEAR(fecha_transaccion) * 100 + MONTH(fecha_transaccion), tipo, COALESCE(categoria_id, 0)
+        """)
+        rows = cursor.fetchall()
+        cursor.close()
+        return rows
+
+    def update_for_file(self, archivo_id: int) -> Dict[str, Any]:
+        """Reemplaza los agregados del archivo y guarda un snapshot del perfil."""
+        cursor = self.db.cursor()
+        cursor.execute("DELETE FROM agregados_mensuales WHERE archivo_id = %s", (archivo_id,))
+        cursor.execute(
+            "INSERT INTO agregados_mensuales (archivo_id, anio_mes, tipo, categoria_id, monto_total, cantidad) "
+            + self._SELECT_AGREGADOS + " WHERE archivo_id = %s" + self._GROUP_BY,
+            (archivo_id,)
+        )
+        cursor.close()
+        return self.snapshot()
+
+    def recompute(self) -> Dict[str, Any]:
+        """Reconstruye todos los agregados desde cero y guarda un snapshot."""
+        cursor = self.db.cursor()
+        cursor.execute("DELETE FROM agregados_mensuales")
+        cursor.execute(
+            "INSERT INTO agregados_mensuales (archivo_id, anio_mes, tipo, categoria_id, monto_total, cantidad) "
+            + self._SELECT_AGREGADOS + self._GROUP_BY
+        )
+        cursor.close()
+        logger.info("Agregados de perfil reconstruidos desde transacciones_consolidadas.")
+        return self.snapshot()
+
+    def validate(self) -> Dict[str, Any]:
+        """Compara las métricas incrementales con un cálculo completo sobre las transacciones."""
+        categorias = self._categorias()
+        incremental = compute_metrics(self._aggregated_rows(), categorias)
+        completo = compute_metrics(self._scanned_rows(), categorias)
+        diferencias = {}
+        for key in ("gasto_mensual_promedio", "ingreso_mensual_promedio", "razon_ingreso_gasto", "volatilidad_gasto"):
+            a, b = incremental.get(key), completo.get(key)
+            if (a is None) != (b is None) or (a is not None and abs(a - b) > TOLERANCIA_VALIDACION * max(1.0, abs(b))):
+                diferencias[key] = {"incremental": a, "completo": b}
+        if incremental.get("ventana") != completo.get("ventana"):
+            diferencias["ventana"] = {"incremental": incremental.get("ventana"), "completo": completo.get("ventana")}
+        return {"consistente": not diferencias, "diferencias": diferencias}
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Calcula las métricas desde los agregados y las registra en perfil_usuario (uno por día)."""
+        metrics = compute_metrics(self._aggregated_rows(), self._categorias())
+        if not metrics:
+            self.db.commit()
+            return metrics
+        nombre = profile_name(metrics)
+        descripcion = (
+            f"Gasto mensual promedio ${metrics['gasto_mensual_promedio']:,.0f} en {metrics['ventana']['meses']} meses "
+            f"(volatilidad {metrics['volatilidad_gasto']:.0%})."
+        )
+        cursor = self.db.cursor()
+        cursor.execute("DELETE FROM perfil_usuario WHERE fecha_analisis = %s", (date.today(),))
+        cursor.execute(
+            "INSERT INTO perfil_usuario (nombre_perfil, descripcion, fecha_analisis, metrics_json) VALUES (%s, %s, %s, %s)",
+            (nombre, descripcion, date.today(), json.dumps(metrics, ensure_ascii=False))
+        )
+        cursor.close()
+        self.db.commit()
+        return metrics
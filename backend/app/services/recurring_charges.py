@@ -0,0 +1,238 @@
+import os
+import logging
+from datetime import date
+from typing import Any, Dict, Iterable, List, Optional, Set
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+TIPO_SUGERENCIA = "Eliminacion_Suscripcion"
+PREFIJO_REFERENCIA = "suscripcion:"
+
+# Cadencias reconocidas: (nombre, intervalo medio mínimo y máximo en días, cargos mínimos, cargos por año)
+CADENCIAS = (
+    ("mensual", 26, 35, 3, 12),
+    ("anual", 350, 380, 2, 1),
+)
+# Dispersión máxima del intervalo y del monto (coeficiente de variación)
+MAX_CV_INTERVALO = 0.25
+MAX_CV_MONTO = float(os.getenv("RECURRING_MAX_AMOUNT_CV", "0.15"))
+# Alza mínima del último cargo respecto del primero para informarla
+MIN_ALZA = 0.03
+# Alzas de precio escalonadas: un escalón es una subida mayor a UMBRAL_ESCALON entre cargos
+# consecutivos; se aceptan hasta MAX_ESCALONES con alza total acotada y monto casi fijo entre ellos
+UMBRAL_ESCALON = 0.02
+MAX_ESCALONES = 2
+MAX_ALZA_TOTAL = float(os.getenv("RECURRING_MAX_TOTAL_RISE", "0.30"))
+MAX_CV_TRAMO = 0.02
+# Un cargo se considera vigente si el último ocurrió hace menos de 1.5 intervalos
+MAX_ATRASO_INTERVALOS = 1.5
+IN_CHUNK = 500
+
+
+def is_enabled() -> bool:
+    return os.getenv("RECURRING_DETECTION_ENABLED", "true").lower() in ("1", "true", "yes")
+
+
+def detect(claves: np.ndarray, dias: np.ndarray, montos: np.ndarray, hoy: int) -> List[Dict[str, Any]]:
+    """
+    Detecta cargos periódicos con operaciones vectorizadas. `claves` (comercio), `dias`
+    (fecha como ordinal) y `montos` son arreglos paralelos; `hoy` es el ordinal de referencia.
+    Retorna un dict por comercio recurrente.
+    """
+    if len(claves) == 0:
+        return []
+    comercios, grupo = np.unique(claves, return_inverse=True)
+    orden = np.lexsort((dias, grupo))
+    grupo, dias, montos = grupo[orden], dias[orden].astype(np.int64), montos[orden].astype(np.float64)
+    n_grupos = len(comercios)
+
+    cargos = np.bincount(grupo, minlength=n_grupos)
+    fin = np.cumsum(cargos) - 1
+    inicio = fin - cargos + 1
+
+    # Intervalos entre cargos consecutivos del mismo comercio
+    mismo = grupo[1:] == grupo[:-1]
+    intervalos = np.diff(dias)[mismo].astype(np.float64)
+    g_int = grupo[1:][mismo]
+    n_int = np.bincount(g_int, minlength=n_grupos)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        media_int = np.bincount(g_int, weights=intervalos, minlength=n_grupos) / n_int
+        var_int = np.bincount(g_int, weights=intervalos ** 2, minlength=n_grupos) / n_int - media_int ** 2
+        cv_int = np.sqrt(np.clip(var_int, 0, None)) / media_int
+
+        media_monto = np.bincount(grupo, weights=montos, minlength=n_grupos) / cargos
+        var_monto = np.bincount(grupo, weights=montos ** 2, minlength=n_grupos) / cargos - media_monto ** 2
+        cv_monto = np.sqrt(np.clip(var_monto, 0, None)) / media_monto
+
+    primer_monto, ultimo_monto = montos[inicio], montos[fin]
+    ultimo_dia = dias[fin]
+    alza = (ultimo_monto - primer_monto) / np.where(primer_monto > 0, primer_monto, np.nan)
+
+    # Escalones y caídas entre cargos consecutivos del mismo comercio
+    delta = np.diff(montos)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        relativo = np.nan_to_num(delta / np.where(montos[:-1] > 0, montos[:-1], np.nan))
+    escalon = mismo & (relativo > UMBRAL_ESCALON)
+    caidas = np.bincount(grupo[1:], weights=(mismo & (delta < -0.01)).astype(np.float64), minlength=n_grupos)
+    escalones = np.bincount(grupo[1:], weights=escalon.astype(np.float64), minlength=n_grupos)
+
+    # Tramos entre escalones: el monto debe ser casi constante dentro de cada uno
+    nuevo_tramo = np.concatenate(([True], ~mismo | escalon))
+    tramo = np.cumsum(nuevo_tramo) - 1
+    cargos_tramo = np.bincount(tramo)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        media_tramo = np.bincount(tramo, weights=montos) / cargos_tramo
+        var_tramo = np.bincount(tramo, weights=montos ** 2) / cargos_tramo - media_tramo ** 2
+        cv_tramo = np.nan_to_num(np.sqrt(np.clip(var_tramo, 0, None)) / media_tramo, nan=1.0)
+    max_cv_tramo = np.zeros(n_grupos)
+    np.maximum.at(max_cv_tramo, grupo[nuevo_tramo], cv_tramo)
+
+    # Alza de precio (ej: Netflix 8.500 -> 9.500): pocos escalones limpios y sin bajadas.
+    # Una serie que sube sin escalones claros (compras del supermercado) es deriva, no suscripción.
+    escalonado = (
+        (caidas == 0) & (escalones >= 1) & (escalones <= MAX_ESCALONES)
+        & (alza <= MAX_ALZA_TOTAL) & (max_cv_tramo <= MAX_CV_TRAMO)
+    )
+    deriva = (caidas == 0) & (alza > UMBRAL_ESCALON)
+    monto_estable = escalonado | ((cv_monto <= MAX_CV_MONTO) & ~deriva)
+
+    resultado = []
+    for nombre, min_int, max_int, min_cargos, por_anio in CADENCIAS:
+        calza = (
+            (cargos >= min_cargos) & (media_int >= min_int) & (media_int <= max_int)
+            & (np.nan_to_num(cv_int, nan=1.0) <= MAX_CV_INTERVALO) & monto_estable
+            & (hoy - ultimo_dia <= media_int * MAX_ATRASO_INTERVALOS)
+        )
+        for g in np.flatnonzero(calza):
+            resultado.append({
+                "comercio": str(comercios[g]),
+                "cadencia": nombre,
+                "cargos": int(cargos[g]),
+                "intervalo_dias": round(float(media_int[g]), 1),
+                "monto_promedio": round(float(media_monto[g]), 2),
+                "ultimo_monto": round(float(ultimo_monto[g]), 2),
+                "alza": round(float(alza[g]), 4) if alza[g] >= MIN_ALZA else None,
+                "ultimo_cargo": date.fromordinal(int(ultimo_dia[g])).isoformat(),
+                "costo_anual": round(float(ultimo_monto[g]) * por_anio, 2),
+            })
+    return resultado
+
+
+class RecurringChargeDetector:
+    """
+    Motor de análisis de suscripciones: carga los gastos consolidados en arreglos columnares,
+    agrupa por comercio normalizado (comercio_clave) y mantiene las sugerencias Eliminacion_Suscripcion.
+    La actualización incremental solo reexamina los comercios presentes en los archivos nuevos.
+    """
+
+    def __init__(self, db_connection):
+        self.db = db_connection
+
+    def _merchants_in_files(self, archivo_ids: Iterable[int]) -> Set[str]:
+        ids = list(archivo_ids)
+        cursor = self.db.cursor()
+        cursor.execute(
+            f"SELECT DISTINCT comercio_clave FROM transacciones_consolidadas "
+            f"WHERE tipo = 'Gasto' AND archivo_id IN ({', '.join(['%s'] * len(ids))})",
+            ids
+        )
+        claves = {r[0] for r in cursor.fetchall() if r[0]}
+        cursor.close()
+        return claves
+
+    def _load(self, claves: Optional[Set[str]]):
+        """Carga (comercio, día ordinal, monto) de los gastos como arreglos NumPy."""
+        sql = """
+            SELECT comercio_clave, fecha_transaccion, monto FROM transacciones_consolidadas
+            WHERE tipo = 'Gasto' AND comercio_clave IS NOT NULL AND comercio_clave <> ''
+        """
+        claves = None if claves is None else sorted(claves)
+        lotes = [None] if claves is None else [claves[i:i + IN_CHUNK] for i in range(0, len(claves), IN_CHUNK)]
+        comercios, dias, montos = [], [], []
+        cursor = self.db.cursor()
+        for lote in lotes:
+            if lote is None:
+                cursor.execute(sql)
+            else:
+                cursor.execute(f"{sql} AND comercio_clave IN ({', '.join(['%s'] * len(lote))})", lote)
+            for comercio, fecha, monto in cursor.fetchall():
+                comercios.append(comercio)
+                dias.append(fecha.toordinal())
+                montos.append(float(monto))
+        cursor.close()
+        return np.array(comercios, dtype=object), np.array(dias, dtype=np.int64), np.array(montos, dtype=np.float64)
+
+    def _reference_day(self) -> int:
+        """Fecha del último gasto consolidado: el historial puede no llegar hasta hoy."""
+        cursor = self.db.cursor()
+        cursor.execute("SELECT MAX(fecha_transaccion) FROM transacciones_consolidadas WHERE tipo = 'Gasto'")
+        ultima = cursor.fetchone()[0]
+        cursor.close()
+        if isinstance(ultima, str):
+            # SQLite entrega los agregados de fechas como texto ISO
+            ultima = date.fromisoformat(ultima[:10])
+        return (ultima or date.today()).toordinal()
+
+    @staticmethod
+    def _describe(r: Dict[str, Any]) -> str:
+        texto = (
+            f"Cargo {r['cadencia']} detectado en {r['cargos']} ocasiones (cada {r['intervalo_dias']} días en promedio), "
+            f"último el {r['ultimo_cargo']} por ${r['ultimo_monto']:,.0f}. Costo anual estimado: ${r['costo_anual']:,.0f}."
+        )
+        if r["alza"]:
+            texto += f" El monto subió {r['alza'] * 100:.1f}% desde el primer cargo."
+        return texto
+
+    def _save(self, detectados: List[Dict[str, Any]], claves: Optional[Set[str]]) -> int:
+        cursor = self.db.cursor()
+        sql = """
+            INSERT INTO sugerencias_ahorro (tipo, clave_referencia, titulo, descripcion, monto_estimado_ahorro)
+            VALUES (%s, %s, %s, %s, %s)
+            ON DUPLICATE KEY UPDATE titulo = VALUES(titulo), descripcion = VALUES(descripcion),
+                monto_estimado_ahorro = VALUES(monto_estimado_ahorro)
+        """
+        vigentes = set()
+        for r in detectados:
+            referencia = f"{PREFIJO_REFERENCIA}{r['comercio']}"
+            vigentes.add(referencia)
+            titulo = f"Suscripción {r['cadencia']}: {r['comercio']}"
+            if r["alza"]:
+                titulo += " (con alza de precio)"
+            cursor.execute(sql, (TIPO_SUGERENCIA, referencia, titulo, self._describe(r), r["costo_anual"]))
+
+        # Las sugerencias pendientes de comercios reexaminados que ya no son recurrentes se retiran
+        cursor.execute(
+            "SELECT clave_referencia FROM sugerencias_ahorro WHERE tipo = %s AND estado = 'Pendiente' AND clave_referencia LIKE %s",
+            (TIPO_SUGERENCIA, f"{PREFIJO_REFERENCIA}%")
+        )
+        examinadas = {f"{PREFIJO_REFERENCIA}{c}" for c in claves} if claves is not None else None
+        obsoletas = [
+            r[0] for r in cursor.fetchall()
+            if r[0] not in vigentes and (examinadas is None or r[0] in examinadas)
+        ]
+        for referencia in obsoletas:
+            cursor.execute(
+                "DELETE FROM sugerencias_ahorro WHERE tipo = %s AND clave_referencia = %s AND estado = 'Pendiente'",
+                (TIPO_SUGERENCIA, referencia)
+            )
+        self.db.commit()
+        cursor.close()
+        return len(detectados)
+
+    def analyze(self, claves: Optional[Set[str]] = None) -> int:
+        """Reexamina los comercios indicados (None: todo el historial). Retorna las suscripciones vigentes."""
+        if claves is not None and not claves:
+            return 0
+        arrays = self._load(claves)
+        detectados = detect(*arrays, hoy=self._reference_day())
+        guardadas = self._save(detectados, claves)
+        logger.info(
+            f"Suscripciones: {guardadas} detectadas entre {len(set(arrays[0])) if len(arrays[0]) else 0} comercios "
+            f"({len(arrays[0])} cargos analizados)."
+        )
+        return guardadas
+
+    def update_for_files(self, archivo_ids: Iterable[int]) -> int:
+        """Actualización incremental tras consolidar: solo los comercios de esos archivos."""
+        return self.analyze(self._merchants_in_files(archivo_ids))
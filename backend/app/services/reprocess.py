@@ -0,0 +1,92 @@
+import os
+import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Dict, List, Optional
+from ..db import get_db_connection
+from ..parsers.registry import get_parser
+from ..core.pipeline import ETAPA_COMPLETADO, ESTADOS
+from ..core.llm_limiter import llm_context, PRIORIDAD_MASIVA
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WORKERS = int(os.getenv("REPROCESS_WORKERS", "2"))
+# Cada worker abre su propia conexión y corre un pipeline completo
+MAX_WORKERS = 8
+
+
+def select_files(db, archivo_ids: Optional[List[int]] = None, origen: Optional[str] = None,
+                 tipo_doc: Optional[str] = None, desde: Optional[str] = None, hasta: Optional[str] = None,
+                 estado: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Selecciona archivos registrados por ID, origen, tipo, rango de fecha de carga o estado."""
+    if estado and estado not in ESTADOS:
+        raise ValueError(f"Estado desconocido: {estado}. Opciones: {', '.join(ESTADOS)}.")
+    filtros, params = [], []
+    if archivo_ids:
+        filtros.append(f"archivo_id IN ({', '.join(['%s'] * len(archivo_ids))})")
+        params.extend(archivo_ids)
+    if origen:
+        filtros.append("origen = %s")
+        params.append(origen)
+    if tipo_doc:
+        filtros.append("tipo_documento = %s")
+        params.append(tipo_doc)
+    if desde:
+        filtros.append("fecha_carga >= %s")
+        params.append(desde)
+    if hasta:
+        filtros.append("fecha_carga < DATE_ADD(%s, INTERVAL 1 DAY)")
+        params.append(hasta)
+    if estado:
+        filtros.append("estado_procesamiento = %s")
+        params.append(estado)
+
+    sql = "SELECT archivo_id, origen, tipo_documento, nombre_original, estado_procesamiento FROM archivos_fuente"
+    if filtros:
+        sql += " WHERE " + " AND ".join(filtros)
+    sql += " ORDER BY archivo_id"
+
+    cursor = db.cursor(dictionary=True)
+    cursor.execute(sql, tuple(params))
+    rows = cursor.fetchall()
+    cursor.close()
+    return rows
+
+
+def _reprocess_one(archivo: Dict[str, Any], force: bool) -> Dict[str, Any]:
+    """Tarea de un worker: conexión propia, parser propio."""
+    db = get_db_connection()
+    if db is None:
+        return {"status": "error", "archivo_id": archivo["archivo_id"], "message": "Sin conexión a la base de datos."}
+    try:
+        parser = get_parser(archivo["origen"], archivo["tipo_documento"], db)
+        if force:
+            parser.ai_service.use_cache = False
+        # Los archivos interrumpidos continúan desde su último checkpoint salvo que se fuerce
+        resume = not force and archivo.get("estado_procesamiento") != ETAPA_COMPLETADO
+        with llm_context(prioridad=PRIORIDAD_MASIVA):
+            return parser.reprocess(archivo["archivo_id"], resume=resume)
+    except ValueError as e:
+        return {"status": "error", "archivo_id": archivo["archivo_id"], "message": str(e)}
+    finally:
+        if db.is_connected():
+            db.close()
+
+
+def reprocess_files(archivos: List[Dict[str, Any]], workers: int = DEFAULT_WORKERS, force: bool = False) -> List[Dict[str, Any]]:
+    """
+    Reprocesa archivos desde sus originales almacenados usando un pool de workers.
+    Con force=True se ignoran las respuestas IA cacheadas (rasterizado y OCR siguen cacheados).
+    """
+    results = []
+    workers = max(1, min(workers, MAX_WORKERS))
+    logger.info(f"Reprocesando {len(archivos)} archivos con {workers} workers (force={force}).")
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(_reprocess_one, a, force): a for a in archivos}
+        for future in as_completed(futures):
+            try:
+                results.append(future.result())
+            except Exception as e:
+                archivo = futures[future]
+                logger.error(f"Error inesperado reprocesando archivo_id {archivo['archivo_id']}: {e}")
+                results.append({"status": "error", "archivo_id": archivo["archivo_id"], "message": repr(e)})
+    return sorted(results, key=lambda r: r["archivo_id"])
@@ -0,0 +1,98 @@
+import os
+import time
+import logging
+import threading
+from typing import Any, Dict
+
+logger = logging.getLogger(__name__)
+
+WARMUP_ENABLED = os.getenv("WARMUP_ENABLED", "true").lower() in ("1", "true", "yes")
+# Ping al LLM: carga el modelo en LM Studio, pero ocupa un cupo de inferencia
+WARMUP_LLM_PING = os.getenv("WARMUP_LLM_PING", "false").lower() in ("1", "true", "yes")
+
+_state: Dict[str, Any] = {"estado": "pendiente", "pasos": {}, "duracion_s": None}
+_lock = threading.Lock()
+
+
+def _warm_parsers():
+    from ..parsers.registry import preload
+    preload()
+
+
+def _warm_prompts():
+    from .ai_service import AIService
+    return AIService().preload_prompts()
+
+
+def _warm_categorization():
+    from ..db import get_db_connection
+    from .categorization import CategorizationService
+
+    db = get_db_connection()
+    if db is None:
+        raise RuntimeError("Sin conexión a la base de datos.")
+    try:
+        return len(CategorizationService(db).reglas)
+    finally:
+        db.close()
+
+
+def _warm_ocr():
+    # Primer arranque de Tesseract: carga spa.traineddata en la caché de páginas del SO
+    import pytesseract
+    from PIL import Image
+    pytesseract.image_to_string(Image.new("L", (64, 32), 255), lang="spa")
+
+
+def _warm_llm():
+    from .ai_service import AIService
+    if not AIService(use_cache=False).ping():
+        raise RuntimeError("El LLM no respondió al ping.")
+
+
+def warm_up():
+    """Precarga parsers, prompts, reglas de categorización, OCR y (opcional) el modelo."""
+    pasos = [
+        ("parsers", _warm_parsers),
+        ("prompts", _warm_prompts),
+        ("categorizacion", _warm_categorization),
+        ("ocr", _warm_ocr),
+    ]
+    if WARMUP_LLM_PING:
+        pasos.append(("llm", _warm_llm))
+
+    with _lock:
+        _state["estado"] = "en_curso"
+    inicio = time.monotonic()
+    for nombre, paso in pasos:
+        t0 = time.monotonic()
+        try:
+            detalle = paso()
+            resultado = {"ok": True}
+            if detalle is not None:
+                resultado["detalle"] = detalle
+        except Exception as e:
+            logger.warning(f"Warm-up '{nombre}' falló: {e}")
+            resultado = {"ok": False, "error": str(e)}
+        resultado["duracion_s"] = round(time.monotonic() - t0, 3)
+        with _lock:
+            _state["pasos"][nombre] = resultado
+
+    with _lock:
+        _state["estado"] = "completado"
+        _state["duracion_s"] = round(time.monotonic() - inicio, 3)
+    logger.info(f"Warm-up completado en {_state['duracion_s']}s.")
+
+
+def start_warmup():
+    """Lanza el warm-up en un hilo de fondo para no retrasar el arranque del servidor."""
+    if not WARMUP_ENABLED:
+        with _lock:
+            _state["estado"] = "desactivado"
+        return
+    threading.Thread(target=warm_up, name="warmup", daemon=True).start()
+
+
+def warmup_status() -> Dict[str, Any]:
+    with _lock:
+        return {**_state, "pasos": dict(_state["pasos"])}
@@ -1,12 +1,24 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from app.api.endpoints import upload
+from app.api.endpoints import upload, reprocess, progress, export, analysis
+from app.services.warmup import start_warmup, warmup_status
+from app.core.llm_limiter import get_llm_limiter
 import os
 from dotenv import load_dotenv
 
 load_dotenv()
 
-app = FastAPI(title="Zenith Finance API")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Los módulos pesados (parsers, OCR, IA) se precargan en segundo plano tras arrancar
+    start_warmup()
+    yield
+
+app = FastAPI(title="Zenith Finance API", lifespan=lifespan)
+
+# Tope de tamaño de la carga masiva (CORS se agrega después para envolver también el 413)
+app.add_middleware(upload.BatchBodyLimitMiddleware)
 
 # Configuración de CORS
 app.add_middleware(
@@ -19,6 +31,10 @@ app.add_middleware(
 
 # Incluir Routers
 app.include_router(upload.router, prefix="/api/v1/files", tags=["Ingesta de Archivos"])
+app.include_router(reprocess.router, prefix="/api/v1/files", tags=["Reprocesamiento"])
+app.include_router(progress.router, prefix="/api/v1/files", tags=["Progreso"])
+app.include_router(export.router, prefix="/api/v1/data", tags=["Exportación"])
+app.include_router(analysis.router, prefix="/api/v1/analysis", tags=["Análisis"])
 
 @app.get("/")
 async def root():
@@ -28,10 +44,30 @@ async def root():
         "version": "0.1.0"
     }
 
+def _process_status():
+    """PID y memoria residente del worker que responde (loadtest/ la muestrea durante las pruebas)."""
+    rss_kb = None
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    rss_kb = int(line.split()[1])
+                    break
+    except OSError:
+        import resource
+        rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return {"pid": os.getpid(), "rss_mb": round(rss_kb / 1024, 1) if rss_kb else None}
+
 @app.get("/health")
 async def health_check():
     # Aquí se podría añadir validación de conexión a la DB
-    return {"status": "healthy"}
+    return {
+        "status": "healthy",
+        "warmup": warmup_status(),
+        "proceso": _process_status(),
+        # Profundidad de cola por clase y esperas p50/p95 del worker que responde
+        "cola_llm": get_llm_limiter().metrics()
+    }
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,10 @@
+#!/bin/sh
+# Arranque del backend: modo desarrollo con recarga o producción con varios workers
+set -e
+
+if [ "${APP_ENV}" = "development" ]; then
+    exec uvicorn main:app --host 0.0.0.0 --port 8000 --reload
+fi
+
+# WEB_CONCURRENCY: procesos uvicorn (por defecto, uno por núcleo disponible)
+exec uvicorn main:app --host 0.0.0.0 --port 8000 --workers "${WEB_CONCURRENCY:-$(nproc)}"
@@ -0,0 +1,34 @@
+from app.core.artifact_store import ArtifactStore, private_artifacts
+
+
+def test_guarda_y_recupera(tmp_path):
+    store = ArtifactStore(root=str(tmp_path))
+    key = store.make_key("hash", 0, 200)
+    store.put_text("ocr", key, "texto")
+    assert store.get_text("ocr", key) == "texto"
+
+
+def test_documentos_protegidos_no_se_cachean(tmp_path):
+    store = ArtifactStore(root=str(tmp_path))
+    key = store.make_key("hash", 0, 200)
+    with private_artifacts():
+        store.put("pages", key, b"jpeg")
+        assert store.get("pages", key) is None
+    assert store.get("pages", key) is None
+    assert not any(p.is_file() for p in tmp_path.rglob("*"))
+
+
+def test_expulsa_los_menos_usados(tmp_path):
+    store = ArtifactStore(root=str(tmp_path), max_bytes=100)
+    for i in range(5):
+        store.put("pages", store.make_key(i), b"x" * 40)
+    assert store._scan_size() <= 90
+
+
+def test_reemplazar_una_llave_no_infla_el_tamano(tmp_path):
+    store = ArtifactStore(root=str(tmp_path), max_bytes=100)
+    store.put("pages", store.make_key("a"), b"x" * 10)
+    for _ in range(20):
+        store.put("pages", store.make_key("b"), b"x" * 40)
+    assert store._size == store._scan_size() == 50
+    assert store.get("pages", store.make_key("a")) is not None
@@ -0,0 +1,117 @@
+import io
+import zipfile
+
+import pytest
+
+from app.core.exceptions import BatchTooLargeError
+from app.services import bulk_upload
+from app.services.bulk_upload import BatchSpool, split_entry_path
+
+
+def _zip(entries, compression=zipfile.ZIP_STORED):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", compression) as zf:
+        for name, data in entries.items():
+            zf.writestr(name, data)
+    buffer.seek(0)
+    return buffer
+
+
+def test_split_entry_path():
+    assert split_entry_path("ingesta_masiva/Falabella/Cartola_CC/enero.pdf") == ("Falabella", "Cartola_CC", "enero.pdf")
+    assert split_entry_path("Falabella/enero.pdf") is None
+    assert split_entry_path("Falabella/Cartola_CC/notas.txt") is None
+
+
+def test_zip_valido_y_duplicados():
+    spool = BatchSpool()
+    try:
+        spool.add_zip(_zip({
+            "Falabella/Cartola_CC/enero.pdf": b"%PDF enero",
+            "Falabella/Cartola_CC/copia.pdf": b"%PDF enero",
+            "suelto.pdf": b"%PDF",
+            "__MACOSX/Falabella/Cartola_CC/._enero.pdf": b"x",
+        }))
+        assert [e["filename"] for e in spool.entries] == ["enero.pdf"]
+        assert sorted(r["status"] for r in spool.rejected) == ["duplicate", "error"]
+    finally:
+        spool.cleanup()
+
+
+def test_zip_con_demasiadas_entradas(monkeypatch):
+    monkeypatch.setattr(bulk_upload, "MAX_BATCH_ENTRIES", 2)
+    spool = BatchSpool()
+    try:
+        with pytest.raises(BatchTooLargeError):
+            spool.add_zip(_zip({f"Falabella/Cartola_CC/{i}.pdf": b"%PDF" for i in range(3)}))
+        assert spool.entries == []
+    finally:
+        spool.cleanup()
+
+
+def test_zip_bomba_se_rechaza_antes_de_extraer():
+    spool = BatchSpool()
+    try:
+        with pytest.raises(BatchTooLargeError):
+            spool.add_zip(_zip({"Falabella/Cartola_CC/bomba.pdf": b"\0" * (5 * 1024 * 1024)}, zipfile.ZIP_DEFLATED))
+        assert spool.entries == []
+    finally:
+        spool.cleanup()
+
+
+def test_zip_excede_tamano_descomprimido(monkeypatch):
+    monkeypatch.setattr(bulk_upload, "MAX_BATCH_MB", 1)
+    spool = BatchSpool()
+    try:
+        with pytest.raises(BatchTooLargeError):
+            spool.add_zip(_zip({"Falabella/Cartola_CC/grande.pdf": b"x" * (2 * 1024 * 1024)}))
+    finally:
+        spool.cleanup()
+
+
+def test_multipart_con_demasiadas_partes(monkeypatch):
+    monkeypatch.setattr(bulk_upload, "MAX_BATCH_ENTRIES", 2)
+    spool = BatchSpool()
+    try:
+        with pytest.raises(BatchTooLargeError):
+            spool.add_files([(f"Falabella/Cartola_CC/{i}.pdf", io.BytesIO(b"%PDF")) for i in range(3)])
+        assert spool.entries == []
+    finally:
+        spool.cleanup()
+
+
+def test_multipart_excede_tamano(monkeypatch):
+    monkeypatch.setattr(bulk_upload, "MAX_BATCH_MB", 1)
+    spool = BatchSpool()
+    try:
+        with pytest.raises(BatchTooLargeError):
+            spool.add_files([
+                ("Falabella/Cartola_CC/a.pdf", io.BytesIO(b"a" * (700 * 1024))),
+                ("Falabella/Cartola_CC/b.pdf", io.BytesIO(b"b" * (700 * 1024))),
+            ])
+    finally:
+        spool.cleanup()
+
+
+def test_middleware_rechaza_por_content_length():
+    import asyncio
+    from app.api.endpoints.upload import BatchBodyLimitMiddleware
+
+    llamadas, enviados = [], []
+
+    async def app(scope, receive, send):
+        llamadas.append(scope["path"])
+
+    async def send(message):
+        enviados.append(message)
+
+    async def receive():
+        return {"type": "http.request", "body": b""}
+
+    middleware = BatchBodyLimitMiddleware(app)
+    grande = str(10 * bulk_upload.MAX_BATCH_MB * 1024 * 1024).encode()
+    for path in ("/api/v1/files/upload/batch", "/api/v1/files/upload"):
+        scope = {"type": "http", "path": path, "headers": [(b"content-length", grande)]}
+        asyncio.run(middleware(scope, receive, send))
+    assert llamadas == ["/api/v1/files/upload"]
+    assert enviados[0]["status"] == 413
@@ -0,0 +1,54 @@
+from collections import Counter
+from app.services.category_index import CATEGORIA_OTROS, CategoryIndex
+
+
+def _index():
+    index = CategoryIndex()
+    index.add("JUMBO COSTANERA", 1, 5)
+    index.add("LIDER EXPRESS", 1, 3)
+    index.add("UBER TRIP", 2, 4)
+    index.add("COPEC", 2, 1)
+    index.add("COPEC", 3, 1)
+    return index
+
+
+def test_coincidencia_exacta():
+    assert _index().nearest("UBER TRIP") == (2, 1.0, "UBER TRIP")
+
+
+def test_vecino_parecido_sobre_el_umbral():
+    categoria, similitud, vecino = _index().nearest("JUMBO COSTANERA CENTER")
+    assert (categoria, vecino) == (1, "JUMBO COSTANERA")
+    assert 0.6 <= similitud < 1.0
+
+
+def test_sin_vecino_suficientemente_parecido():
+    assert _index().nearest("FARMACIAS AHUMADA") is None
+    assert _index().nearest("") is None
+
+
+def test_vecino_con_categoria_impura_se_descarta():
+    # COPEC tiene votos repartidos 50/50 entre dos categorías
+    assert _index().nearest("COPEC") is None
+
+
+def test_otros_no_se_indexa():
+    index = CategoryIndex()
+    index.add("MERCADO PAGO", CATEGORIA_OTROS)
+    assert len(index) == 0
+
+
+def test_reprocesar_un_archivo_reemplaza_sus_votos():
+    index = CategoryIndex()
+    index.replace_file(1, Counter({("UBER TRIP", 2): 4}))
+    index.replace_file(2, Counter({("UBER TRIP", 5): 1}))
+    # Reprocesar el archivo 1 con los mismos datos no duplica sus votos
+    index.replace_file(1, Counter({("UBER TRIP", 2): 4}))
+    assert index._votos[index._posicion["UBER TRIP"]] == Counter({2: 4, 5: 1})
+    assert index.nearest("UBER TRIP") == (2, 1.0, "UBER TRIP")
+
+    # Tras reprocesar ya no trae ese comercio: quedan solo los votos del archivo 2
+    index.replace_file(1, Counter())
+    assert index.nearest("UBER TRIP") == (5, 1.0, "UBER TRIP")
+    index.replace_file(2, Counter())
+    assert index.nearest("UBER TRIP") is None
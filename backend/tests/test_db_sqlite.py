@@ -0,0 +1,100 @@
+import ast
+import re
+from datetime import date
+from pathlib import Path
+import pytest
+from app import db_sqlite
+from app.db_sqlite import translate
+
+APP_DIR = Path(__file__).resolve().parents[1] / "app"
+SENTENCIA = re.compile(r"^\s*(SELECT|INSERT|UPDATE|DELETE|WITH)\s")
+# Valores de ejemplo para las partes dinámicas de las consultas
+FSTRING = {
+    "self.staging_table": "staging_banco_chile",
+    "columna": "aciertos",
+    "PARTICIONES['metadatos']": "m.periodo_hasta",
+}
+FORMATO = {"filtro": "1 = 1", "particion": "NULL"}
+
+
+def _render(node: ast.AST, constantes: dict) -> str:
+    if isinstance(node, ast.Constant) and isinstance(node.value, str):
+        return re.sub(r"\{(\w+)\}", lambda m: FORMATO.get(m.group(1), m.group(0)), node.value)
+    if isinstance(node, ast.BinOp) and isinstance(node.op, ast.Add):
+        # "INSERT ... " + self._SELECT_AGREGADOS + ...
+        return _render(node.left, constantes) + _render(node.right, constantes)
+    if isinstance(node, (ast.Name, ast.Attribute)):
+        nombre = node.id if isinstance(node, ast.Name) else node.attr
+        return _render(constantes[nombre], constantes) if nombre in constantes else "{" + ast.unparse(node) + "}"
+    if not isinstance(node, ast.JoinedStr):
+        return "{" + ast.unparse(node) + "}"
+    partes = []
+    for value in node.values:
+        if isinstance(value, ast.Constant):
+            partes.append(value.value)
+            continue
+        fuente = ast.unparse(value.value)
+        # IN ({', '.join(['%s'] * n)})
+        partes.append("%s" if "join" in fuente else FSTRING.get(fuente, "{" + fuente + "}"))
+    return "".join(partes)
+
+
+def _sentencias():
+    """Cadenas SQL literales (y f-strings) de app/, excepto las propias de SQLite."""
+    for path in sorted(APP_DIR.rglob("*.py")):
+        if path.name == "db_sqlite.py":
+            continue
+        tree = ast.parse(path.read_text(encoding="utf-8"))
+        # Constantes de módulo o clase que se concatenan en otras consultas
+        constantes = {
+            n.targets[0].id: n.value for n in ast.walk(tree)
+            if isinstance(n, ast.Assign) and isinstance(n.targets[0], ast.Name) and isinstance(n.value, ast.Constant)
+        }
+        # Los trozos de una f-string o de una concatenación se revisan como parte de la sentencia completa
+        trozos = {id(c) for n in ast.walk(tree) if isinstance(n, ast.JoinedStr) for c in n.values}
+        trozos |= {id(c) for n in ast.walk(tree) if isinstance(n, ast.BinOp) and isinstance(n.op, ast.Add) for c in (n.left, n.right)}
+        for node in ast.walk(tree):
+            if id(node) in trozos:
+                continue
+            if isinstance(node, (ast.Constant, ast.JoinedStr, ast.BinOp)):
+                sql = _render(node, constantes)
+                if SENTENCIA.match(sql):
+                    yield pytest.param(sql, id=f"{path.relative_to(APP_DIR)}:{node.lineno}")
+
+
+@pytest.fixture(scope="module")
+def db(tmp_path_factory):
+    conn = db_sqlite.connect(str(tmp_path_factory.mktemp("sqlite") / "zenith.db"))
+    yield conn
+    conn.close()
+
+
+@pytest.mark.parametrize("sql", list(_sentencias()))
+def test_sql_de_la_app_compila_en_sqlite(db, sql):
+    assert "{" not in sql, f"Falta un valor de ejemplo para la parte dinámica de: {sql}"
+    cursor = db.cursor()
+    try:
+        # EXPLAIN prepara la sentencia traducida contra el esquema sin ejecutarla
+        cursor.execute("EXPLAIN " + sql, (None,) * sql.count("%s"))
+    finally:
+        cursor.close()
+
+
+def test_marcadores_e_insert_ignore():
+    assert translate("INSERT IGNORE INTO t (a) VALUES (%s)") == "INSERT OR IGNORE INTO t (a) VALUES (?)"
+    # Los literales quedan intactos
+    assert translate("SELECT a FROM t WHERE a = %s AND b LIKE '%s'") == "SELECT a FROM t WHERE a = ? AND b LIKE '%s'"
+
+
+def test_on_duplicate_key_update():
+    sql = translate("INSERT INTO t (a, b) VALUES (%s, %s) ON DUPLICATE KEY UPDATE b = VALUES(b), c = c + 1")
+    assert sql == "INSERT INTO t (a, b) VALUES (?, ?) ON CONFLICT DO UPDATE SET b = excluded.b, c = c + 1"
+
+
+def test_funciones_de_fecha(db):
+    assert translate("SELECT IF(a > 0, 1, 0)") == "SELECT IIF(a > 0, 1, 0)"
+    assert "datetime('now', '-' || ? || ' seconds')" in translate("SELECT NOW() - INTERVAL %s SECOND")
+    cursor = db.cursor()
+    cursor.execute("SELECT DATE_ADD('2024-01-31 10:00:00', INTERVAL 2 DAY), YEAR(%s), MONTH(%s)", (date(2024, 3, 9), "2024-03-09"))
+    assert cursor.fetchone() == ("2024-02-02 10:00:00", 2024, 3)
+    cursor.close()
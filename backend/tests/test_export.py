@@ -0,0 +1,68 @@
+import pyarrow.parquet as pq
+import pytest
+from app import db_sqlite
+from app.services import export
+from app.services.export import ExportService, invalidate_partitions
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    monkeypatch.setattr(export, "EXPORT_LAG_SECONDS", 0)
+    conn = db_sqlite.connect(str(tmp_path / "zenith.db"))
+    cursor = conn.cursor()
+    cursor.execute("""
+        INSERT INTO archivos_fuente (nombre_original, nombre_almacenamiento, hash_archivo, tipo_documento, origen, extension, ruta_backup)
+        VALUES ('cartola.pdf', 'cartola.pdf', 'h1', 'Cartola_CC', 'Banco_Chile', 'pdf', '/tmp/cartola.pdf')
+    """)
+    cursor.close()
+    _insert(conn, [("a", "2024-01-05"), ("b", "2024-01-20"), ("c", "2024-02-03")])
+    yield conn
+    conn.close()
+
+
+def _insert(conn, filas):
+    cursor = conn.cursor()
+    cursor.executemany("""
+        INSERT INTO transacciones_consolidadas (transaccion_id, archivo_id, fecha_transaccion, descripcion_limpia, monto, tipo)
+        VALUES (%s, 1, %s, 'COMERCIO', 1000, 'Gasto')
+    """, filas)
+    cursor.close()
+    conn.commit()
+
+
+def _ids(destino, anio, mes):
+    particion = destino / "transacciones" / f"anio={anio:04d}" / f"mes={mes:02d}"
+    return sorted(i for p in particion.glob("part-*.parquet") for i in pq.read_table(p).column("transaccion_id").to_pylist())
+
+
+def test_reproceso_reescribe_las_particiones_invalidadas(db, tmp_path):
+    destino = tmp_path / "exports"
+    service = ExportService(db, destino=str(destino))
+    service.export(tablas=["transacciones"])
+    assert _ids(destino, 2024, 1) == ["a", "b"]
+
+    # Reproceso: se borran las filas del archivo y se reinsertan distintas
+    invalidate_partitions(db, "transacciones", 1)
+    cursor = db.cursor()
+    cursor.execute("DELETE FROM transacciones_consolidadas WHERE archivo_id = 1")
+    cursor.close()
+    _insert(db, [("a", "2024-01-05"), ("c", "2024-02-03")])
+
+    info = service.export(tablas=["transacciones"])["tablas"]["transacciones"]
+    assert info["reescritas"] == 2
+    assert _ids(destino, 2024, 1) == ["a"]
+    assert _ids(destino, 2024, 2) == ["c"]
+
+    cursor = db.cursor()
+    cursor.execute("SELECT COUNT(*) FROM particiones_invalidadas")
+    assert cursor.fetchone()[0] == 0
+    cursor.close()
+
+
+def test_sin_invalidaciones_solo_agrega_filas_nuevas(db, tmp_path):
+    destino = tmp_path / "exports"
+    service = ExportService(db, destino=str(destino))
+    service.export(tablas=["transacciones"])
+    info = service.export(tablas=["transacciones"])["tablas"]["transacciones"]
+    assert info["filas"] == 0 and info["reescritas"] == 0
+    assert _ids(destino, 2024, 1) == ["a", "b"]
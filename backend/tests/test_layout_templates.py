@@ -0,0 +1,71 @@
+from app.core import layout_templates
+from app.core.layout_templates import apply, learn, similarity, validate
+
+ANCHO_CARACTER = 0.008
+ALTO = 0.012
+
+
+def _words(renglones, dx=0.0, dy=0.0):
+    """Palabras con cajas relativas a partir de (y, [(x, texto), ...])."""
+    words = []
+    for y, textos in renglones:
+        for x, texto in textos:
+            x0, y0 = x + dx, y + dy
+            words.append({"text": texto, "x0": x0, "y0": y0, "x1": x0 + len(texto) * ANCHO_CARACTER, "y1": y0 + ALTO})
+    return words
+
+
+def _cartola(titular, cuenta, desde, hasta, dx=0.0, dy=0.0):
+    return _words([
+        (0.05, [(0.10, "BANCO"), (0.16, "DE"), (0.19, "CHILE")]),
+        (0.08, [(0.10, "CARTOLA"), (0.20, "CUENTA"), (0.27, "CORRIENTE")]),
+        (0.12, [(0.10, "TITULAR:"), (0.30, titular[0]), (0.30 + (len(titular[0]) + 1) * ANCHO_CARACTER, titular[1])]),
+        (0.15, [(0.10, "CUENTA:"), (0.30, cuenta)]),
+        (0.18, [(0.10, "DESDE:"), (0.30, desde), (0.55, "HASTA:"), (0.65, hasta)]),
+        (0.22, [(0.10, "EJECUTIVO"), (0.25, "SUCURSAL"), (0.40, "PROVIDENCIA")]),
+    ], dx, dy)
+
+
+METADATA = {
+    "titular": "JUAN PEREZ", "cuenta": "00-123-45678", "periodo_desde": "2024-02-01", "periodo_hasta": "2024-02-29",
+    "atributos_adicionales": {},
+}
+
+
+def test_aprende_y_lee_otra_cartola_desplazada():
+    template = learn(_cartola(("JUAN", "PEREZ"), "00-123-45678", "01/02/2024", "29/02/2024"), METADATA)
+    assert set(template["campos"]) == {"titular", "cuenta", "periodo_desde", "periodo_hasta"}
+
+    siguiente = _cartola(("JUAN", "PEREZ"), "00-123-45678", "01/03/2024", "31/03/2024", dx=0.004, dy=0.003)
+    score, dx, dy = similarity(template["huella"], layout_templates.fingerprint(siguiente))
+    assert score >= layout_templates.MATCH_THRESHOLD
+
+    metadata = apply(template, siguiente, dx, dy)
+    assert metadata["titular"] == "JUAN PEREZ"
+    assert metadata["cuenta"] == "00-123-45678"
+    assert (metadata["periodo_desde"], metadata["periodo_hasta"]) == ("2024-03-01", "2024-03-31")
+    assert validate(template, metadata)
+
+
+def test_sin_periodo_no_hay_plantilla():
+    sin_periodo = _words([(0.12, [(0.10, "TITULAR:"), (0.30, "JUAN"), (0.35, "PEREZ")])])
+    assert learn(sin_periodo, METADATA) is None
+
+
+def test_validate_rechaza_lecturas_incoherentes():
+    template = learn(_cartola(("JUAN", "PEREZ"), "00-123-45678", "01/02/2024", "29/02/2024"), METADATA)
+    invertido = {**METADATA, "periodo_desde": "2024-03-01", "periodo_hasta": "2024-02-01"}
+    assert not validate(template, invertido)
+    assert not validate(template, {**METADATA, "cuenta": ""})
+
+
+def test_validate_contrasta_el_periodo_con_los_movimientos():
+    template = learn(_cartola(("JUAN", "PEREZ"), "00-123-45678", "01/02/2024", "29/02/2024"), METADATA)
+    fechas = ["12/02", "15/02", "20/02", "15/01/2024"]
+    assert validate(template, METADATA, fechas)
+    # Una región bien formada pero de otro periodo (el mes anterior) no calza con los movimientos
+    anterior = {**METADATA, "periodo_desde": "2024-01-01", "periodo_hasta": "2024-01-31"}
+    assert validate(template, anterior)
+    assert not validate(template, anterior, fechas)
+    # Sin fechas interpretables no hay contraste posible
+    assert validate(template, anterior, ["sin fecha"])
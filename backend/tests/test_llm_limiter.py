@@ -0,0 +1,34 @@
+import threading
+from app.core.llm_limiter import PRIORIDAD_INTERACTIVA, PRIORIDAD_MASIVA, LLMSlotLimiter
+
+
+def test_solo_cuenta_cupos_tomados(tmp_path):
+    limiter = LLMSlotLimiter(slots=2, lock_dir=str(tmp_path))
+    # Texto dejado por un worker que murió con el cupo tomado: el kernel ya liberó el flock
+    with open(limiter._slot_path(1), "w") as f:
+        f.write("archivocaido")
+    with limiter.slot(archivo="cartola1"):
+        assert limiter._in_flight() == {"cartola1": 1}
+    assert limiter._in_flight() == {}
+
+
+def test_interactiva_pasa_antes_que_masiva(tmp_path):
+    limiter = LLMSlotLimiter(slots=1, lock_dir=str(tmp_path), timeout=10)
+    orden = []
+
+    def llamar(prioridad, archivo):
+        with limiter.slot(prioridad=prioridad, archivo=archivo):
+            orden.append(prioridad)
+
+    with limiter.slot(archivo="ocupado"):
+        hilos = [threading.Thread(target=llamar, args=(PRIORIDAD_MASIVA, "lote"))]
+        hilos[0].start()
+        while not limiter._tickets():
+            pass
+        hilos.append(threading.Thread(target=llamar, args=(PRIORIDAD_INTERACTIVA, "frontend")))
+        hilos[1].start()
+        while len(limiter._tickets()) < 2:
+            pass
+    for h in hilos:
+        h.join()
+    assert orden == [PRIORIDAD_INTERACTIVA, PRIORIDAD_MASIVA]
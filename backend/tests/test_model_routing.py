@@ -0,0 +1,60 @@
+import logging
+
+from app.core.model_routing import ModelRouter, PASS_METADATA, PASS_TRANSACTIONS, INPUT_IMAGE, INPUT_TEXT
+
+
+def test_sin_configuracion_usa_el_default(monkeypatch):
+    monkeypatch.delenv("AI_FALLBACK_MODEL", raising=False)
+    route = ModelRouter({}).resolve(PASS_METADATA, "Falabella", INPUT_IMAGE)
+    assert route.name == "default"
+    assert route.fallback is None
+
+
+def test_gana_la_ruta_mas_especifica():
+    router = ModelRouter({"routes": [
+        {"pass": "transactions", "model": "general"},
+        {"pass": "transactions", "origin": "Falabella", "input": "image", "model": "especifico"},
+    ]})
+    assert router.resolve(PASS_TRANSACTIONS, "Falabella", INPUT_IMAGE).model == "especifico"
+    assert router.resolve(PASS_TRANSACTIONS, "Banco_Chile", INPUT_TEXT).model == "general"
+    assert router.resolve(PASS_METADATA, "Falabella", INPUT_IMAGE).name == "default"
+
+
+def test_default_admite_respaldo_que_hereda_parametros():
+    router = ModelRouter({"default": {"model": "grande", "temperature": 0.2, "max_tokens": 4096,
+                                      "fallback": {"model": "chico"}}})
+    route = router.resolve(PASS_METADATA)
+    assert route.model == "grande"
+    assert route.fallback.model == "chico"
+    assert route.fallback.temperature == 0.2
+    assert route.fallback.max_tokens == 4096
+
+
+def test_respaldo_del_default_desde_entorno(monkeypatch):
+    monkeypatch.setenv("AI_FALLBACK_MODEL", "respaldo")
+    assert ModelRouter({}).default.fallback.model == "respaldo"
+
+
+def test_rutas_heredan_parametros_del_default():
+    router = ModelRouter({
+        "default": {"model": "grande", "temperature": 0.3, "max_tokens": 2048},
+        "routes": [{"pass": "metadata", "model": "chico", "fallback": "default"},
+                   {"pass": "transactions", "temperature": 0.0}],
+    })
+    meta = router.resolve(PASS_METADATA)
+    assert (meta.model, meta.temperature, meta.max_tokens) == ("chico", 0.3, 2048)
+    assert meta.fallback is router.default
+    tx = router.resolve(PASS_TRANSACTIONS)
+    assert (tx.model, tx.temperature) == ("grande", 0.0)
+
+
+def test_clamp_respeta_el_tope_del_modelo():
+    route = ModelRouter({"default": {"max_tokens": 1000}}).default
+    assert route.clamp(4000) == 1000
+    assert route.clamp(500) == 500
+
+
+def test_claves_desconocidas_se_informan(caplog):
+    with caplog.at_level(logging.WARNING, logger="app.core.model_routing"):
+        ModelRouter({"default": {"modelo": "x"}, "rutas": []})
+    assert "modelo" in caplog.text and "rutas" in caplog.text
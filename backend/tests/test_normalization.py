@@ -0,0 +1,73 @@
+from datetime import date
+import pytest
+from app.core.normalization import infer_year, merchant_key, parse_amount, parse_amounts, parse_date
+
+
+@pytest.mark.parametrize("valor, esperado", [
+    ("$ 1.234.567", 1234567.0),
+    ("1.234,56", 1234.56),
+    ("1,234.56", 1234.56),
+    ("25000.00", 25000.0),
+    ("12,5", 12.5),
+    ("1,234,567", 1234567.0),
+    ("-5.990", -5990.0),
+    ("5.990-", -5990.0),
+    ("(5.990)", -5990.0),
+    (15990, 15990.0),
+])
+def test_parse_amount(valor, esperado):
+    assert parse_amount(valor) == esperado
+
+
+@pytest.mark.parametrize("valor", [None, "", "N/A", "-", "abc", True, float("nan")])
+def test_parse_amount_no_interpretable(valor):
+    assert parse_amount(valor) is None
+    assert parse_amount(valor, default=0.0) == 0.0
+
+
+def test_parse_amounts_por_lote():
+    assert parse_amounts(["1.000", "1.000", None, "2,5"]) == [1000.0, 1000.0, None, 2.5]
+
+
+@pytest.mark.parametrize("mes, referencia, esperado", [
+    (12, 1, 2023),   # diciembre en una cartola que cierra en enero
+    (1, 12, 2025),   # enero en una cartola que cierra en diciembre
+    (6, 7, 2024),
+    (12, None, 2024),
+])
+def test_infer_year(mes, referencia, esperado):
+    assert infer_year(mes, 2024, referencia) == esperado
+
+
+@pytest.mark.parametrize("valor, esperado", [
+    ("2024-03-05", "2024-03-05"),
+    ("05/03/24", "2024-03-05"),
+    ("05/03/2024", "2024-03-05"),
+    ("28-DIC", "2023-12-28"),
+    ("03 ene", "2024-01-03"),
+    (date(2024, 1, 3), "2024-01-03"),
+    ("31/02/2024", None),
+    ("sin fecha", None),
+])
+def test_parse_date_con_cruce_de_anio(valor, esperado):
+    assert parse_date(valor, year=2024, reference_month=1) == esperado
+
+
+def test_parse_date_sin_anio_ni_referencia():
+    assert parse_date("05/03") is None
+
+
+@pytest.mark.parametrize("glosa, esperado", [
+    ("COMPRA NAC NETFLIX.COM 866-579", "NETFLIX COM"),
+    ("PAGO AUTOMATICO Spotify Chile", "SPOTIFY"),
+    ("Líder Express SUC Ñuñoa 1234", "LIDER EXPRESS"),
+    ("UBER *TRIP 4X7Z 12/03", "UBER TRIP"),
+    ("JUMBO COSTANERA CENTER SANTIAGO SPA", "JUMBO COSTANERA CENTER"),
+    ("", ""),
+])
+def test_merchant_key(glosa, esperado):
+    assert merchant_key(glosa) == esperado
+
+
+def test_merchant_key_agrupa_variantes_del_mismo_comercio():
+    assert merchant_key("COMPRA NETFLIX.COM 111-222") == merchant_key("Netflix.com 999-000 CL")
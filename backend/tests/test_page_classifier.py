@@ -0,0 +1,64 @@
+from app.core.page_classifier import (
+    PAGE_HEADER, PAGE_IRRELEVANT, PAGE_TRANSACTIONS, PageClassification, classify_text, count_rows,
+    row_dates,
+)
+
+CABECERA = """
+BANCO DE CHILE
+CARTOLA HISTÓRICA CUENTA CORRIENTE
+TITULAR: JUAN PÉREZ SOTO
+N° DE CUENTA 00-123-45678-09
+PERIODO: 01/02/2024 AL 29/02/2024
+EJECUTIVO: MARÍA GONZÁLEZ
+"""
+
+MOVIMIENTOS = """
+DETALLE DE MOVIMIENTOS
+FECHA DESCRIPCION CARGOS ABONOS
+02/02 COMPRA NAC JUMBO COSTANERA 45.990
+05/02 PAGO AUTOMATICO NETFLIX 9.990
+10/02 TRANSFERENCIA DE TERCEROS 350.000
+"""
+
+SALDOS = """
+LINEA DE CREDITO
+PERIODO 01/02/2024 AL 29/02/2024
+01/02 SALDO INICIAL 0
+29/02 SALDO FINAL 0
+CUPO LINEA DE CREDITO 500.000
+"""
+
+
+def test_cuenta_filas_con_fecha_y_monto():
+    assert count_rows(MOVIMIENTOS) == 3
+    assert count_rows(SALDOS) == 0
+
+
+def test_fechas_de_las_filas():
+    assert row_dates(MOVIMIENTOS) == ["02/02", "05/02", "10/02"]
+    clasificacion = PageClassification(labels=[PAGE_HEADER, PAGE_TRANSACTIONS], texts=[SALDOS, MOVIMIENTOS])
+    assert clasificacion.transaction_dates == ["02/02", "05/02", "10/02"]
+
+
+def test_tabla_de_movimientos():
+    assert classify_text(MOVIMIENTOS) == PAGE_TRANSACTIONS
+    # Una sola fila basta si hay encabezados de tabla
+    assert classify_text("MOVIMIENTOS\n15/03 COMPRA LIDER 12.500") == PAGE_TRANSACTIONS
+
+
+def test_cabecera_y_saldos_sin_movimientos():
+    assert classify_text(CABECERA) == PAGE_HEADER
+    assert classify_text(SALDOS) == PAGE_HEADER
+
+
+def test_pagina_irrelevante_y_vacia():
+    assert classify_text("Infórmese sobre la garantía estatal de los depósitos. www.bancochile.cl") == PAGE_IRRELEVANT
+    # Sin texto no hay señal: se conserva como tabla para no perder movimientos
+    assert classify_text("   ") == PAGE_TRANSACTIONS
+
+
+def test_paginas_a_rasterizar():
+    clasificacion = PageClassification(labels=[PAGE_IRRELEVANT, PAGE_HEADER, PAGE_TRANSACTIONS, PAGE_IRRELEVANT, PAGE_TRANSACTIONS])
+    assert clasificacion.header_page == 1
+    assert clasificacion.pages_to_render == [1, 2, 4]
+    assert PageClassification.from_dict(clasificacion.to_dict()) == clasificacion
@@ -0,0 +1,39 @@
+import pytest
+from app.services.profile_metrics import compute_metrics, profile_name
+
+CATEGORIAS = {1: "Alimentación", 2: "Transporte"}
+FILAS = [
+    (202401, "Gasto", 1, 300000),
+    (202401, "Gasto", 2, 100000),
+    (202401, "Ingreso", 0, 1000000),
+    (202403, "Gasto", 1, 400000),
+    (202403, "Gasto", None, 200000),
+    (202403, "Ingreso", 0, 1000000),
+]
+
+
+def test_metricas_del_perfil():
+    metricas = compute_metrics(FILAS, CATEGORIAS)
+    # Febrero sin movimientos cuenta como mes con gasto cero
+    assert metricas["ventana"] == {"desde": 202401, "hasta": 202403, "meses": 3}
+    assert [m["gasto"] for m in metricas["serie_mensual"]] == [400000, 0, 600000]
+    assert metricas["gasto_mensual_promedio"] == pytest.approx(333333.33)
+    assert metricas["gasto_ultimo_mes"] == 600000
+    assert metricas["razon_ingreso_gasto"] == 2.0
+    assert metricas["participacion_categorias"] == {"Alimentación": 0.7, "Sin categoría": 0.2, "Transporte": 0.1}
+    assert metricas["volatilidad_gasto"] == pytest.approx(0.7483, abs=1e-4)
+    assert profile_name(metricas) == "Ahorrador"
+
+
+def test_ventana_movil_cruza_el_anio():
+    metricas = compute_metrics([(202311, "Gasto", 1, 100), (202402, "Gasto", 1, 50)], CATEGORIAS, ventana=2)
+    assert metricas["ventana"] == {"desde": 202401, "hasta": 202402, "meses": 2}
+    assert metricas["participacion_categorias"] == {"Alimentación": 1.0}
+
+
+def test_sin_gastos():
+    assert compute_metrics([], CATEGORIAS) == {}
+    metricas = compute_metrics([(202401, "Ingreso", 0, 500)], CATEGORIAS)
+    assert metricas["razon_ingreso_gasto"] is None
+    assert metricas["volatilidad_gasto"] == 0.0
+    assert profile_name(metricas) == "Sin gastos"
@@ -0,0 +1,30 @@
+from app.core import progress
+from app.core.progress import ProgressTracker, read_events
+
+
+def test_id_reutilizado_no_arrastra_la_corrida_anterior(tmp_path, monkeypatch):
+    monkeypatch.setattr(progress, "PROGRESS_DIR", str(tmp_path))
+    carga = ProgressTracker("seguimiento-1")
+    carga.emit("inicio", archivo="cartola.pdf")
+    carga.emit("staging_completado", filas=120)
+    carga.emit("completado")
+    _, fin_carga = read_events("seguimiento-1")
+
+    reproceso = ProgressTracker("seguimiento-1")
+    reproceso.emit("inicio", archivo_id=1)
+    eventos, _ = read_events("seguimiento-1")
+    assert [e["evento"] for _, e in eventos] == ["inicio"]
+
+    # Un suscriptor que quedó más allá del fin del archivo truncado vuelve a leer desde el inicio
+    eventos, _ = read_events("seguimiento-1", fin_carga)
+    assert [e["evento"] for _, e in eventos] == ["inicio"]
+
+
+def test_reanuda_desde_el_id_del_ultimo_evento(tmp_path, monkeypatch):
+    monkeypatch.setattr(progress, "PROGRESS_DIR", str(tmp_path))
+    tracker = ProgressTracker("seguimiento-2")
+    for evento in ("inicio", "almacenado", "completado"):
+        tracker.emit(evento)
+    eventos, _ = read_events("seguimiento-2")
+    restantes, _ = read_events("seguimiento-2", eventos[0][0])
+    assert [e["evento"] for _, e in restantes] == ["almacenado", "completado"]
@@ -0,0 +1,64 @@
+from datetime import date
+
+import numpy as np
+
+from app.services.recurring_charges import detect
+
+
+def _serie(comercio, montos, inicio=date(2024, 1, 5), intervalo=30):
+    dias = [inicio.toordinal() + i * intervalo for i in range(len(montos))]
+    return [comercio] * len(montos), dias, list(montos)
+
+
+def _detect(*series):
+    claves, dias, montos = [], [], []
+    for c, d, m in series:
+        claves += c
+        dias += d
+        montos += m
+    hoy = max(dias)
+    return {r["comercio"]: r for r in detect(np.array(claves, dtype=object), np.array(dias), np.array(montos), hoy)}
+
+
+def test_monto_fijo_mensual():
+    r = _detect(_serie("SPOTIFY", [6490] * 6))
+    assert r["SPOTIFY"]["cadencia"] == "mensual"
+    assert r["SPOTIFY"]["alza"] is None
+
+
+def test_alza_escalonada_se_acepta():
+    r = _detect(_serie("NETFLIX", [8500, 8500, 8500, 9500, 9500, 9500]))
+    assert r["NETFLIX"]["alza"] == round(1000 / 8500, 4)
+    assert r["NETFLIX"]["costo_anual"] == 9500 * 12
+
+
+def test_compras_con_alza_continua_se_rechazan():
+    r = _detect(_serie("JUMBO LAS CONDES", [46000, 46900, 47800, 48600, 49300, 50000]))
+    assert "JUMBO LAS CONDES" not in r
+
+
+def test_alza_total_excesiva_se_rechaza():
+    r = _detect(_serie("GIMNASIO", [20000, 20000, 20000, 32000, 32000, 32000]))
+    assert "GIMNASIO" not in r
+
+
+def test_demasiados_escalones_se_rechazan():
+    r = _detect(_serie("SERVICIO", [10000, 10500, 11000, 11500, 12000, 12000]))
+    assert "SERVICIO" not in r
+
+
+def test_intervalo_irregular_no_es_recurrente():
+    claves, _, montos = _serie("FARMACIA", [5000] * 5)
+    base = date(2024, 1, 1).toordinal()
+    r = _detect((claves, [base, base + 3, base + 40, base + 47, base + 110], montos))
+    assert "FARMACIA" not in r
+
+
+def test_comercios_se_evaluan_por_separado():
+    r = _detect(
+        _serie("NETFLIX", [8500, 8500, 9500, 9500]),
+        _serie("JUMBO LAS CONDES", [46000, 47000, 48100, 49000, 50000]),
+        _serie("ANUAL", [59990, 59990], inicio=date(2023, 4, 1), intervalo=365),
+    )
+    assert set(r) == {"NETFLIX", "ANUAL"}
+    assert r["ANUAL"]["cadencia"] == "anual"
@@ -0,0 +1,27 @@
+import pytest
+from app import db_sqlite
+from app.services.reprocess import select_files
+
+
+@pytest.fixture
+def db(tmp_path):
+    conn = db_sqlite.connect(str(tmp_path / "zenith.db"))
+    cursor = conn.cursor()
+    cursor.execute("""
+        INSERT INTO archivos_fuente (nombre_original, nombre_almacenamiento, hash_archivo, tipo_documento, origen, extension, ruta_backup, estado_procesamiento)
+        VALUES ('cartola.pdf', 'cartola.pdf', 'h1', 'Cartola_CC', 'Banco_Chile', 'pdf', '/tmp/cartola.pdf', 'En_Staging')
+    """)
+    cursor.close()
+    conn.commit()
+    yield conn
+    conn.close()
+
+
+def test_filtra_por_etapa_del_pipeline(db):
+    assert [a["archivo_id"] for a in select_files(db, estado="En_Staging")] == [1]
+    assert select_files(db, estado="Completado") == []
+
+
+def test_estado_desconocido(db):
+    with pytest.raises(ValueError, match="Estado desconocido"):
+        select_files(db, estado="Procesado")
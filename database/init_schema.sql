@@ -17,9 +17,59 @@ CREATE TABLE IF NOT EXISTS archivos_fuente (
     tamano_bytes BIGINT,
     fecha_carga TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     ruta_backup VARCHAR(512) NOT NULL,
-    estado_procesamiento ENUM('Cargado', 'En_Proceso', 'Completado', 'Error') DEFAULT 'Cargado'
+    -- Última etapa completada del pipeline de ingesta (ver app/core/pipeline.py)
+    estado_procesamiento ENUM(
+        'Registrado', 'Almacenado', 'Rasterizado', 'OCR_Completado', 'Metadatos_Extraidos',
+        'Transacciones_Extraidas', 'En_Staging', 'Completado', 'Cargado', 'En_Proceso', 'Error'
+    ) DEFAULT 'Registrado'
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
 
+-- Checkpoints del pipeline: salida persistida por etapa (y por página en Pass 2) para reanudar
+CREATE TABLE IF NOT EXISTS checkpoints_procesamiento (
+    archivo_id INT NOT NULL,
+    etapa VARCHAR(30) NOT NULL,
+    clave VARCHAR(50) NOT NULL, -- '_etapa' marca la etapa como completada
+    payload JSON,
+    actualizado_en TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    PRIMARY KEY (archivo_id, etapa, clave),
+    FOREIGN KEY (archivo_id) REFERENCES archivos_fuente(archivo_id) ON DELETE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+-- Plantillas de layout aprendidas para leer la cabecera (Pass 1) sin LLM
+CREATE TABLE IF NOT EXISTS plantillas_layout (
+    plantilla_id INT AUTO_INCREMENT PRIMARY KEY,
+    origen ENUM('Banco_Chile', 'Falabella', 'Jumbo', 'Lider', 'Otro') NOT NULL,
+    tipo_documento ENUM('Cartola_CC', 'Cartola_TC', 'Cartola_LC', 'Boleta_Supermercado', 'Otro') NOT NULL,
+    fuente ENUM('nativo', 'ocr') NOT NULL, -- Palabras de pdfplumber o de Tesseract image_to_data
+    huella JSON NOT NULL,  -- [[palabra, x, y], ...] en coordenadas relativas a la página
+    campos JSON NOT NULL,  -- {campo: {tipo, caja: [x0, y0, x1, y1]}}
+    aciertos INT DEFAULT 0,
+    fallos INT DEFAULT 0,
+    actualizado_en TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    INDEX idx_plantilla_tipo (origen, tipo_documento, fuente)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+-- Índice del vigilante de carpetas: archivos de ingesta_masiva/ ya vistos (ruta, mtime, hash)
+CREATE TABLE IF NOT EXISTS ingesta_vigilada (
+    ruta VARCHAR(512) PRIMARY KEY, -- Relativa a la carpeta vigilada: <origen>/<tipo_doc>/<archivo>
+    tamano_bytes BIGINT NOT NULL,
+    mtime_ns BIGINT NOT NULL,
+    hash_archivo VARCHAR(64),
+    archivo_id INT, -- Sin FK: la fila sobrevive si el archivo se elimina y reprocesa
+    estado VARCHAR(20) NOT NULL, -- Estado devuelto por el parser (success, duplicate, error, security_error)
+    mensaje TEXT,
+    actualizado_en TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+-- Llavero local de contraseñas PDF (origen + tipo -> password)
+CREATE TABLE IF NOT EXISTS credenciales_archivadores (
+    credencial_id INT AUTO_INCREMENT PRIMARY KEY,
+    origen ENUM('Banco_Chile', 'Falabella', 'Jumbo', 'Lider', 'Otro') NOT NULL,
+    tipo_documento ENUM('Cartola_CC', 'Cartola_TC', 'Cartola_LC', 'Boleta_Supermercado', 'Otro') NOT NULL,
+    password_pdf VARCHAR(255) NOT NULL,
+    UNIQUE KEY uq_origen_tipo (origen, tipo_documento)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
 -- --------------------------------------------------------------------------------------------------
 -- TABLA DE METADATOS UNIVERSALES (Capa 0.5)
 -- --------------------------------------------------------------------------------------------------
@@ -32,7 +82,9 @@ CREATE TABLE IF NOT EXISTS metadatos_documento (
     periodo_desde DATE,
     periodo_hasta DATE,
     atributos_adicionales JSON, 
-    FOREIGN KEY (archivo_id) REFERENCES archivos_fuente(archivo_id)
+    creado_en TIMESTAMP DEFAULT CURRENT_TIMESTAMP, -- Marca de agua de la exportación incremental
+    FOREIGN KEY (archivo_id) REFERENCES archivos_fuente(archivo_id),
+    INDEX idx_metadatos_creado (creado_en)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
 
 -- --------------------------------------------------------------------------------------------------
@@ -80,11 +132,22 @@ CREATE TABLE IF NOT EXISTS reglas_categorizacion (
     FOREIGN KEY (categoria_id) REFERENCES categorias_principales(categoria_id)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
 
+-- Glosa cruda -> comercio canónico (memoización persistente del normalizador)
+CREATE TABLE IF NOT EXISTS comercios_normalizados (
+    descripcion_cruda VARCHAR(255) PRIMARY KEY,
+    comercio_clave VARCHAR(150) NOT NULL,
+    version INT NOT NULL DEFAULT 1, -- Versión del normalizador que calculó la clave
+    manual BOOLEAN DEFAULT FALSE, -- Alias definido a mano: no se recalcula
+    creado_en TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    INDEX idx_comercio_clave (comercio_clave)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
 CREATE TABLE IF NOT EXISTS transacciones_consolidadas (
     transaccion_id VARCHAR(64) PRIMARY KEY, -- Hash o UUID único de la transacción
     archivo_id INT NOT NULL,
     fecha_transaccion DATE NOT NULL,
     descripcion_limpia VARCHAR(255) NOT NULL,
+    comercio_clave VARCHAR(150), -- Comercio canónico (ver comercios_normalizados)
     monto DECIMAL(15, 2) NOT NULL,
     tipo ENUM('Ingreso', 'Gasto', 'Transferencia') NOT NULL,
     categoria_id INT,
@@ -94,7 +157,9 @@ CREATE TABLE IF NOT EXISTS transacciones_consolidadas (
     fue_clasificado_por_ia BOOLEAN DEFAULT FALSE,
     creado_en TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     FOREIGN KEY (archivo_id) REFERENCES archivos_fuente(archivo_id),
-    FOREIGN KEY (categoria_id) REFERENCES categorias_principales(categoria_id)
+    FOREIGN KEY (categoria_id) REFERENCES categorias_principales(categoria_id),
+    INDEX idx_transacciones_creado (creado_en),
+    INDEX idx_transacciones_comercio (comercio_clave, fecha_transaccion)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
 
 -- --------------------------------------------------------------------------------------------------
@@ -112,14 +177,52 @@ CREATE TABLE IF NOT EXISTS items_compra (
     precio_total DECIMAL(15, 2),
     descuento DECIMAL(15, 2) DEFAULT 0,
     categoria_item VARCHAR(100), -- Categoría específica del producto (ej: Lácteos)
+    creado_en TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     FOREIGN KEY (transaccion_id) REFERENCES transacciones_consolidadas(transaccion_id),
-    FOREIGN KEY (archivo_id) REFERENCES archivos_fuente(archivo_id)
+    FOREIGN KEY (archivo_id) REFERENCES archivos_fuente(archivo_id),
+    INDEX idx_items_creado (creado_en)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+-- Particiones anio/mes de la exportación columnar que un reproceso dejó obsoletas
+CREATE TABLE IF NOT EXISTS particiones_invalidadas (
+    tabla VARCHAR(20) NOT NULL, -- transacciones o metadatos
+    anio SMALLINT NOT NULL,
+    mes TINYINT NOT NULL,
+    registrado_en TIMESTAMP DEFAULT CURRENT_TIMESTAMP, -- Se reescribe en la exportación posterior a esta fecha
+    PRIMARY KEY (tabla, anio, mes)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+-- Índice de precios por producto para alertas de precio
+CREATE TABLE IF NOT EXISTS historial_precios (
+    item_id INT PRIMARY KEY,
+    producto_clave VARCHAR(255) NOT NULL, -- SKU o nombre normalizado
+    producto VARCHAR(255) NOT NULL,
+    sku VARCHAR(100),
+    fecha DATE NOT NULL,
+    precio_unitario DECIMAL(15, 2) NOT NULL,
+    archivo_id INT,
+    revisado BOOLEAN DEFAULT FALSE, -- Ya evaluado por el proceso de alertas de precio
+    FOREIGN KEY (item_id) REFERENCES items_compra(item_id) ON DELETE CASCADE,
+    INDEX idx_historial_producto (producto_clave, fecha),
+    INDEX idx_historial_revisado (revisado)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
 
 -- --------------------------------------------------------------------------------------------------
 -- PERFILADO Y SUGERENCIAS
 -- --------------------------------------------------------------------------------------------------
 
+-- Agregados mensuales por archivo: estado incremental de las métricas de perfil_usuario
+CREATE TABLE IF NOT EXISTS agregados_mensuales (
+    archivo_id INT NOT NULL,
+    anio_mes INT NOT NULL, -- AAAAMM
+    tipo ENUM('Ingreso', 'Gasto', 'Transferencia') NOT NULL,
+    categoria_id INT NOT NULL DEFAULT 0, -- 0: sin categoría
+    monto_total DECIMAL(15, 2) NOT NULL,
+    cantidad INT NOT NULL,
+    PRIMARY KEY (archivo_id, anio_mes, tipo, categoria_id),
+    FOREIGN KEY (archivo_id) REFERENCES archivos_fuente(archivo_id) ON DELETE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
 CREATE TABLE IF NOT EXISTS perfil_usuario (
     perfil_id INT AUTO_INCREMENT PRIMARY KEY,
     nombre_perfil VARCHAR(100), -- ej: "Equilibrio", "Ahorrador"
@@ -131,11 +234,13 @@ CREATE TABLE IF NOT EXISTS perfil_usuario (
 CREATE TABLE IF NOT EXISTS sugerencias_ahorro (
     sugerencia_id INT AUTO_INCREMENT PRIMARY KEY,
     tipo ENUM('Reduccion_Gasto', 'Eliminacion_Suscripcion', 'Mejora_Habito', 'Alerta_Precio') NOT NULL,
+    clave_referencia VARCHAR(150), -- Origen de una sugerencia automática (ej: 'suscripcion:NETFLIX COM')
     titulo VARCHAR(255) NOT NULL,
     descripcion TEXT NOT NULL,
     monto_estimado_ahorro DECIMAL(15, 2),
     estado ENUM('Pendiente', 'Aceptada', 'Rechazada', 'Cumplida') DEFAULT 'Pendiente',
-    fecha_creacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    fecha_creacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE KEY uk_sugerencia_referencia (tipo, clave_referencia)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
 
 -- --------------------------------------------------------------------------------------------------
@@ -0,0 +1,289 @@
+-- Esquema equivalente a init_schema.sql para el modo embebido (DB_BACKEND=sqlite).
+-- Idempotente: el backend lo aplica al abrir la base. ENUM -> TEXT con CHECK,
+-- AUTO_INCREMENT -> INTEGER PRIMARY KEY AUTOINCREMENT, ON UPDATE CURRENT_TIMESTAMP -> trigger.
+-- Las fechas se guardan en texto ISO y CURRENT_TIMESTAMP es UTC.
+
+-- --------------------------------------------------------------------------------------------------
+-- CAPA 0: GESTIÓN DE ARCHIVOS (TRAZABILIDAD)
+-- --------------------------------------------------------------------------------------------------
+
+CREATE TABLE IF NOT EXISTS archivos_fuente (
+    archivo_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    nombre_original VARCHAR(255) NOT NULL,
+    nombre_almacenamiento VARCHAR(255) NOT NULL,
+    hash_archivo VARCHAR(64) UNIQUE NOT NULL,
+    tipo_documento TEXT NOT NULL CHECK (tipo_documento IN ('Cartola_CC', 'Cartola_TC', 'Cartola_LC', 'Boleta_Supermercado', 'Otro')),
+    origen TEXT NOT NULL CHECK (origen IN ('Banco_Chile', 'Falabella', 'Jumbo', 'Lider', 'Otro')),
+    extension VARCHAR(10) NOT NULL,
+    tamano_bytes BIGINT,
+    fecha_carga TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    ruta_backup VARCHAR(512) NOT NULL,
+    estado_procesamiento TEXT DEFAULT 'Registrado' CHECK (estado_procesamiento IN (
+        'Registrado', 'Almacenado', 'Rasterizado', 'OCR_Completado', 'Metadatos_Extraidos',
+        'Transacciones_Extraidas', 'En_Staging', 'Completado', 'Cargado', 'En_Proceso', 'Error'
+    ))
+);
+
+CREATE TABLE IF NOT EXISTS checkpoints_procesamiento (
+    archivo_id INTEGER NOT NULL,
+    etapa VARCHAR(30) NOT NULL,
+    clave VARCHAR(50) NOT NULL,
+    payload JSON,
+    actualizado_en TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (archivo_id, etapa, clave),
+    FOREIGN KEY (archivo_id) REFERENCES archivos_fuente(archivo_id) ON DELETE CASCADE
+);
+
+CREATE TRIGGER IF NOT EXISTS trg_checkpoints_actualizado AFTER UPDATE ON checkpoints_procesamiento
+FOR EACH ROW WHEN NEW.actualizado_en = OLD.actualizado_en
+BEGIN
+    UPDATE checkpoints_procesamiento SET actualizado_en = CURRENT_TIMESTAMP
+    WHERE archivo_id = NEW.archivo_id AND etapa = NEW.etapa AND clave = NEW.clave;
+END;
+
+CREATE TABLE IF NOT EXISTS plantillas_layout (
+    plantilla_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    origen TEXT NOT NULL CHECK (origen IN ('Banco_Chile', 'Falabella', 'Jumbo', 'Lider', 'Otro')),
+    tipo_documento TEXT NOT NULL CHECK (tipo_documento IN ('Cartola_CC', 'Cartola_TC', 'Cartola_LC', 'Boleta_Supermercado', 'Otro')),
+    fuente TEXT NOT NULL CHECK (fuente IN ('nativo', 'ocr')),
+    huella JSON NOT NULL,
+    campos JSON NOT NULL,
+    aciertos INTEGER DEFAULT 0,
+    fallos INTEGER DEFAULT 0,
+    actualizado_en TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS idx_plantilla_tipo ON plantillas_layout (origen, tipo_documento, fuente);
+
+CREATE TRIGGER IF NOT EXISTS trg_plantillas_actualizado AFTER UPDATE ON plantillas_layout
+FOR EACH ROW WHEN NEW.actualizado_en = OLD.actualizado_en
+BEGIN
+    UPDATE plantillas_layout SET actualizado_en = CURRENT_TIMESTAMP WHERE plantilla_id = NEW.plantilla_id;
+END;
+
+CREATE TABLE IF NOT EXISTS ingesta_vigilada (
+    ruta VARCHAR(512) PRIMARY KEY,
+    tamano_bytes BIGINT NOT NULL,
+    mtime_ns BIGINT NOT NULL,
+    hash_archivo VARCHAR(64),
+    archivo_id INTEGER,
+    estado VARCHAR(20) NOT NULL,
+    mensaje TEXT,
+    actualizado_en TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TRIGGER IF NOT EXISTS trg_ingesta_vigilada_actualizado AFTER UPDATE ON ingesta_vigilada
+FOR EACH ROW WHEN NEW.actualizado_en = OLD.actualizado_en
+BEGIN
+    UPDATE ingesta_vigilada SET actualizado_en = CURRENT_TIMESTAMP WHERE ruta = NEW.ruta;
+END;
+
+CREATE TABLE IF NOT EXISTS credenciales_archivadores (
+    credencial_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    origen TEXT NOT NULL CHECK (origen IN ('Banco_Chile', 'Falabella', 'Jumbo', 'Lider', 'Otro')),
+    tipo_documento TEXT NOT NULL CHECK (tipo_documento IN ('Cartola_CC', 'Cartola_TC', 'Cartola_LC', 'Boleta_Supermercado', 'Otro')),
+    password_pdf VARCHAR(255) NOT NULL,
+    UNIQUE (origen, tipo_documento)
+);
+
+-- --------------------------------------------------------------------------------------------------
+-- TABLA DE METADATOS UNIVERSALES (Capa 0.5)
+-- --------------------------------------------------------------------------------------------------
+CREATE TABLE IF NOT EXISTS metadatos_documento (
+    metadata_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    archivo_id INTEGER NOT NULL,
+    entidad_emisora VARCHAR(100),
+    titular VARCHAR(255),
+    identificador_cuenta VARCHAR(100),
+    periodo_desde DATE,
+    periodo_hasta DATE,
+    atributos_adicionales JSON,
+    creado_en TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (archivo_id) REFERENCES archivos_fuente(archivo_id)
+);
+CREATE INDEX IF NOT EXISTS idx_metadatos_creado ON metadatos_documento (creado_en);
+
+-- --------------------------------------------------------------------------------------------------
+-- CAPA 1: STAGING (DATOS CRUDOS POR ORIGEN)
+-- --------------------------------------------------------------------------------------------------
+
+-- Columnas según lo que escriben los parsers (save_to_staging)
+CREATE TABLE IF NOT EXISTS staging_banco_chile (
+    staging_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    archivo_id INTEGER NOT NULL,
+    fecha_texto VARCHAR(100),
+    descripcion_cruda TEXT,
+    monto_cheques_cargos VARCHAR(100),
+    monto_depositos_abonos VARCHAR(100),
+    categoria_sugerida VARCHAR(100),
+    FOREIGN KEY (archivo_id) REFERENCES archivos_fuente(archivo_id)
+);
+
+CREATE TABLE IF NOT EXISTS staging_falabella (
+    staging_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    archivo_id INTEGER NOT NULL,
+    fecha_texto VARCHAR(100),
+    descripcion_cruda TEXT,
+    tipo_sugerido VARCHAR(20),
+    cuotas VARCHAR(50),
+    monto_pesos_crudo VARCHAR(100),
+    monto_usd_crudo VARCHAR(100),
+    categoria_sugerida VARCHAR(100),
+    FOREIGN KEY (archivo_id) REFERENCES archivos_fuente(archivo_id)
+);
+
+-- --------------------------------------------------------------------------------------------------
+-- CAPA 2: CONSOLIDADA (EL DATO "LIMPIO" Y UNIFICADO)
+-- --------------------------------------------------------------------------------------------------
+
+CREATE TABLE IF NOT EXISTS categorias_principales (
+    categoria_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    nombre VARCHAR(100) UNIQUE NOT NULL,
+    color_hex VARCHAR(7)
+);
+
+CREATE TABLE IF NOT EXISTS reglas_categorizacion (
+    regla_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    patron VARCHAR(255) NOT NULL UNIQUE,
+    categoria_id INTEGER,
+    subcategoria VARCHAR(100),
+    FOREIGN KEY (categoria_id) REFERENCES categorias_principales(categoria_id)
+);
+
+CREATE TABLE IF NOT EXISTS comercios_normalizados (
+    descripcion_cruda VARCHAR(255) PRIMARY KEY,
+    comercio_clave VARCHAR(150) NOT NULL,
+    version INTEGER NOT NULL DEFAULT 1,
+    manual BOOLEAN DEFAULT FALSE,
+    creado_en TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS idx_comercio_clave ON comercios_normalizados (comercio_clave);
+
+CREATE TABLE IF NOT EXISTS transacciones_consolidadas (
+    transaccion_id VARCHAR(64) PRIMARY KEY,
+    archivo_id INTEGER NOT NULL,
+    fecha_transaccion DATE NOT NULL,
+    descripcion_limpia VARCHAR(255) NOT NULL,
+    comercio_clave VARCHAR(150),
+    monto DECIMAL(15, 2) NOT NULL,
+    tipo TEXT NOT NULL CHECK (tipo IN ('Ingreso', 'Gasto', 'Transferencia')),
+    categoria_id INTEGER,
+    subcategoria VARCHAR(100),
+    comentario TEXT,
+    es_gasto_innecesario BOOLEAN DEFAULT FALSE,
+    fue_clasificado_por_ia BOOLEAN DEFAULT FALSE,
+    creado_en TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (archivo_id) REFERENCES archivos_fuente(archivo_id),
+    FOREIGN KEY (categoria_id) REFERENCES categorias_principales(categoria_id)
+);
+CREATE INDEX IF NOT EXISTS idx_transacciones_creado ON transacciones_consolidadas (creado_en);
+CREATE INDEX IF NOT EXISTS idx_transacciones_comercio ON transacciones_consolidadas (comercio_clave, fecha_transaccion);
+CREATE INDEX IF NOT EXISTS idx_transacciones_archivo ON transacciones_consolidadas (archivo_id);
+
+-- --------------------------------------------------------------------------------------------------
+-- CAPA 3: DETALLE DE ITEMS (ITEMS DE BOLETAS)
+-- --------------------------------------------------------------------------------------------------
+
+CREATE TABLE IF NOT EXISTS items_compra (
+    item_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    transaccion_id VARCHAR(64) NOT NULL,
+    archivo_id INTEGER,
+    sku VARCHAR(100),
+    producto VARCHAR(255) NOT NULL,
+    cantidad DECIMAL(10, 3) DEFAULT 1,
+    precio_unitario DECIMAL(15, 2),
+    precio_total DECIMAL(15, 2),
+    descuento DECIMAL(15, 2) DEFAULT 0,
+    categoria_item VARCHAR(100),
+    creado_en TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (transaccion_id) REFERENCES transacciones_consolidadas(transaccion_id),
+    FOREIGN KEY (archivo_id) REFERENCES archivos_fuente(archivo_id)
+);
+CREATE INDEX IF NOT EXISTS idx_items_creado ON items_compra (creado_en);
+CREATE INDEX IF NOT EXISTS idx_items_transaccion ON items_compra (transaccion_id);
+
+CREATE TABLE IF NOT EXISTS particiones_invalidadas (
+    tabla VARCHAR(20) NOT NULL,
+    anio INTEGER NOT NULL,
+    mes INTEGER NOT NULL,
+    registrado_en TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (tabla, anio, mes)
+);
+
+CREATE TABLE IF NOT EXISTS historial_precios (
+    item_id INTEGER PRIMARY KEY,
+    producto_clave VARCHAR(255) NOT NULL,
+    producto VARCHAR(255) NOT NULL,
+    sku VARCHAR(100),
+    fecha DATE NOT NULL,
+    precio_unitario DECIMAL(15, 2) NOT NULL,
+    archivo_id INTEGER,
+    revisado BOOLEAN DEFAULT FALSE,
+    FOREIGN KEY (item_id) REFERENCES items_compra(item_id) ON DELETE CASCADE
+);
+CREATE INDEX IF NOT EXISTS idx_historial_producto ON historial_precios (producto_clave, fecha);
+CREATE INDEX IF NOT EXISTS idx_historial_revisado ON historial_precios (revisado);
+
+-- --------------------------------------------------------------------------------------------------
+-- PERFILADO Y SUGERENCIAS
+-- --------------------------------------------------------------------------------------------------
+
+CREATE TABLE IF NOT EXISTS agregados_mensuales (
+    archivo_id INTEGER NOT NULL,
+    anio_mes INTEGER NOT NULL,
+    tipo TEXT NOT NULL CHECK (tipo IN ('Ingreso', 'Gasto', 'Transferencia')),
+    categoria_id INTEGER NOT NULL DEFAULT 0,
+    monto_total DECIMAL(15, 2) NOT NULL,
+    cantidad INTEGER NOT NULL,
+    PRIMARY KEY (archivo_id, anio_mes, tipo, categoria_id),
+    FOREIGN KEY (archivo_id) REFERENCES archivos_fuente(archivo_id) ON DELETE CASCADE
+);
+
+CREATE TABLE IF NOT EXISTS perfil_usuario (
+    perfil_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    nombre_perfil VARCHAR(100),
+    descripcion TEXT,
+    fecha_analisis DATE,
+    metrics_json JSON
+);
+
+CREATE TABLE IF NOT EXISTS sugerencias_ahorro (
+    sugerencia_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    tipo TEXT NOT NULL CHECK (tipo IN ('Reduccion_Gasto', 'Eliminacion_Suscripcion', 'Mejora_Habito', 'Alerta_Precio')),
+    clave_referencia VARCHAR(150),
+    titulo VARCHAR(255) NOT NULL,
+    descripcion TEXT NOT NULL,
+    monto_estimado_ahorro DECIMAL(15, 2),
+    estado TEXT DEFAULT 'Pendiente' CHECK (estado IN ('Pendiente', 'Aceptada', 'Rechazada', 'Cumplida')),
+    fecha_creacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE (tipo, clave_referencia)
+);
+
+-- --------------------------------------------------------------------------------------------------
+-- DATOS INICIALES
+-- --------------------------------------------------------------------------------------------------
+
+INSERT OR IGNORE INTO categorias_principales (nombre, color_hex) VALUES
+('Alimentación/Supermercado', '#FF5733'),
+('Vivienda y Servicios', '#3357FF'),
+('Transporte', '#33FF57'),
+('Salud', '#FF33A1'),
+('Ocio y Entretenimiento', '#F3FF33'),
+('Educación', '#A133FF'),
+('Impuestos y Tasas', '#8B4513'),
+('Otros', '#808080');
+
+INSERT OR IGNORE INTO reglas_categorizacion (patron, categoria_id) VALUES
+('JUMBO', 1), ('LIDER', 1), ('UNIMARC', 1), ('TOTTUS', 1), ('SANTA ISABEL', 1),
+('PANAD', 1), ('CARNICERIA', 1), ('BOTELL', 1), ('UBER EATS', 1), ('UBEREATS', 1),
+('PEDIDOSYA', 1), ('RAPPI', 1), ('MCDONALD', 1), ('BURGER', 1), ('STARBUCKS', 1),
+('ENEL', 2), ('AGUAS ANDINAS', 2), ('VTR', 2), ('MOVISTAR', 2), ('ENTEL', 2),
+('WOM', 2), ('CLARO', 2), ('METROGAS', 2), ('CGE', 2), ('GASTO COMUN', 2),
+('UBER', 3), ('CABIFY', 3), ('DIDI', 3), ('METRO', 3), ('EFE', 3), ('COPEC', 3),
+('SHELL', 3), ('PETROBRAS', 3), ('ESTACIONAMIEN', 3), ('TAG', 3), ('AUTOPISTA', 3),
+('FARMACIA', 4), ('CRUZ VERDE', 4), ('SALCOBRAND', 4), ('AHUMADA', 4), ('CLINICA', 4),
+('HOSPITAL', 4), ('INTEGRAMEDICA', 4), ('MEGASALUD', 4), ('DENTAL', 4), ('MEDICO', 4),
+('NETFLIX', 5), ('SPOTIFY', 5), ('DISNEY', 5), ('HBO', 5), ('AMAZON VIDEO', 5),
+('PRIME VIDEO', 5), ('YOUTUBE', 5), ('CINEHOYTS', 5), ('CINEPOLIS', 5), ('CINEMARK', 5),
+('TICKETMASTER', 5), ('PUNTOTICKET', 5), ('STEAM', 5), ('NINTENDO', 5), ('PLAYSTATION', 5),
+('UNIVERSIDAD', 6), ('COLEGIO', 6), ('INSTITUTO', 6), ('DUOC', 6), ('INACAP', 6),
+('UDLA', 6), ('USS', 6), ('PLATZI', 6), ('UDEMY', 6);
@@ -0,0 +1,20 @@
+-- Migración: pipeline de ingesta reanudable con checkpoints por etapa
+SET NAMES utf8mb4;
+
+ALTER TABLE archivos_fuente MODIFY estado_procesamiento ENUM(
+    'Registrado', 'Almacenado', 'Rasterizado', 'OCR_Completado', 'Metadatos_Extraidos',
+    'Transacciones_Extraidas', 'En_Staging', 'Completado', 'Cargado', 'En_Proceso', 'Error'
+) DEFAULT 'Registrado';
+
+-- Antes del pipeline por etapas los archivos procesados quedaban en 'Cargado'
+UPDATE archivos_fuente SET estado_procesamiento = 'Completado' WHERE estado_procesamiento = 'Cargado';
+
+CREATE TABLE IF NOT EXISTS checkpoints_procesamiento (
+    archivo_id INT NOT NULL,
+    etapa VARCHAR(30) NOT NULL,
+    clave VARCHAR(50) NOT NULL, -- '_etapa' marca la etapa como completada
+    payload JSON,
+    actualizado_en TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    PRIMARY KEY (archivo_id, etapa, clave),
+    FOREIGN KEY (archivo_id) REFERENCES archivos_fuente(archivo_id) ON DELETE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
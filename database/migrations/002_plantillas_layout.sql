@@ -0,0 +1,15 @@
+-- Migración: plantillas de layout aprendidas para Pass 1
+SET NAMES utf8mb4;
+
+CREATE TABLE IF NOT EXISTS plantillas_layout (
+    plantilla_id INT AUTO_INCREMENT PRIMARY KEY,
+    origen ENUM('Banco_Chile', 'Falabella', 'Jumbo', 'Lider', 'Otro') NOT NULL,
+    tipo_documento ENUM('Cartola_CC', 'Cartola_TC', 'Cartola_LC', 'Boleta_Supermercado', 'Otro') NOT NULL,
+    fuente ENUM('nativo', 'ocr') NOT NULL, -- Palabras de pdfplumber o de Tesseract image_to_data
+    huella JSON NOT NULL,  -- [[palabra, x, y], ...] en coordenadas relativas a la página
+    campos JSON NOT NULL,  -- {campo: {tipo, caja: [x0, y0, x1, y1]}}
+    aciertos INT DEFAULT 0,
+    fallos INT DEFAULT 0,
+    actualizado_en TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    INDEX idx_plantilla_tipo (origen, tipo_documento, fuente)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
@@ -0,0 +1,14 @@
+-- Migración: marca de agua creado_en para la exportación columnar incremental
+SET NAMES utf8mb4;
+
+-- Las filas existentes reciben la fecha de la migración y salen en la primera exportación
+ALTER TABLE metadatos_documento
+    ADD COLUMN creado_en TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    ADD INDEX idx_metadatos_creado (creado_en);
+
+ALTER TABLE items_compra
+    ADD COLUMN creado_en TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    ADD INDEX idx_items_creado (creado_en);
+
+ALTER TABLE transacciones_consolidadas
+    ADD INDEX idx_transacciones_creado (creado_en);
@@ -0,0 +1,7 @@
+-- Migración: sugerencias automáticas idempotentes (detección de suscripciones)
+SET NAMES utf8mb4;
+
+-- NULL en sugerencias manuales: el índice único no las restringe
+ALTER TABLE sugerencias_ahorro
+    ADD COLUMN clave_referencia VARCHAR(150) AFTER tipo,
+    ADD UNIQUE KEY uk_sugerencia_referencia (tipo, clave_referencia);
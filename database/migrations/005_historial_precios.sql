@@ -0,0 +1,16 @@
+-- Migración: índice de precios por producto (Alerta_Precio)
+SET NAMES utf8mb4;
+
+CREATE TABLE IF NOT EXISTS historial_precios (
+    item_id INT PRIMARY KEY,
+    producto_clave VARCHAR(255) NOT NULL, -- SKU o nombre normalizado
+    producto VARCHAR(255) NOT NULL,
+    sku VARCHAR(100),
+    fecha DATE NOT NULL,
+    precio_unitario DECIMAL(15, 2) NOT NULL,
+    archivo_id INT,
+    revisado BOOLEAN DEFAULT FALSE, -- Ya evaluado por el proceso de alertas de precio
+    FOREIGN KEY (item_id) REFERENCES items_compra(item_id) ON DELETE CASCADE,
+    INDEX idx_historial_producto (producto_clave, fecha),
+    INDEX idx_historial_revisado (revisado)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
@@ -0,0 +1,15 @@
+-- Migración: agregados incrementales para las métricas de perfil_usuario
+SET NAMES utf8mb4;
+
+CREATE TABLE IF NOT EXISTS agregados_mensuales (
+    archivo_id INT NOT NULL,
+    anio_mes INT NOT NULL, -- AAAAMM
+    tipo ENUM('Ingreso', 'Gasto', 'Transferencia') NOT NULL,
+    categoria_id INT NOT NULL DEFAULT 0, -- 0: sin categoría
+    monto_total DECIMAL(15, 2) NOT NULL,
+    cantidad INT NOT NULL,
+    PRIMARY KEY (archivo_id, anio_mes, tipo, categoria_id),
+    FOREIGN KEY (archivo_id) REFERENCES archivos_fuente(archivo_id) ON DELETE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+-- Poblar con POST /api/v1/analysis/profile/recompute
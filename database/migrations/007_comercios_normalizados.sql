@@ -0,0 +1,17 @@
+-- Migración: capa de normalización de comercios
+SET NAMES utf8mb4;
+
+CREATE TABLE IF NOT EXISTS comercios_normalizados (
+    descripcion_cruda VARCHAR(255) PRIMARY KEY,
+    comercio_clave VARCHAR(150) NOT NULL,
+    version INT NOT NULL DEFAULT 1, -- Versión del normalizador que calculó la clave
+    manual BOOLEAN DEFAULT FALSE, -- Alias definido a mano: no se recalcula
+    creado_en TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    INDEX idx_comercio_clave (comercio_clave)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+ALTER TABLE transacciones_consolidadas
+    ADD COLUMN comercio_clave VARCHAR(150) AFTER descripcion_limpia,
+    ADD INDEX idx_transacciones_comercio (comercio_clave, fecha_transaccion);
+
+-- Completar las transacciones existentes con POST /api/v1/analysis/merchants/backfill
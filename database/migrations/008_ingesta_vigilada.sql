@@ -0,0 +1,13 @@
+-- Migración: índice persistente del vigilante de carpetas (services/folder_watcher.py)
+SET NAMES utf8mb4;
+
+CREATE TABLE IF NOT EXISTS ingesta_vigilada (
+    ruta VARCHAR(512) PRIMARY KEY, -- Relativa a la carpeta vigilada: <origen>/<tipo_doc>/<archivo>
+    tamano_bytes BIGINT NOT NULL,
+    mtime_ns BIGINT NOT NULL,
+    hash_archivo VARCHAR(64),
+    archivo_id INT, -- Sin FK: la fila sobrevive si el archivo se elimina y reprocesa
+    estado VARCHAR(20) NOT NULL, -- Estado devuelto por el parser (success, duplicate, error, security_error)
+    mensaje TEXT,
+    actualizado_en TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
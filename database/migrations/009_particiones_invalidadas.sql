@@ -0,0 +1,10 @@
+-- Migración: particiones de la exportación columnar invalidadas por reprocesos
+SET NAMES utf8mb4;
+
+CREATE TABLE IF NOT EXISTS particiones_invalidadas (
+    tabla VARCHAR(20) NOT NULL, -- transacciones o metadatos
+    anio SMALLINT NOT NULL,
+    mes TINYINT NOT NULL,
+    registrado_en TIMESTAMP DEFAULT CURRENT_TIMESTAMP, -- Se reescribe en la exportación posterior a esta fecha
+    PRIMARY KEY (tabla, anio, mes)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
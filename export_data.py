@@ -0,0 +1,33 @@
+import argparse
+import requests
+
+API_URL = "http://localhost:8000/api/v1/data/export"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Exporta los datos consolidados a Parquet/Arrow particionado por año y mes.")
+    parser.add_argument("--tablas", nargs="+", choices=["transacciones", "metadatos", "items"], help="Tablas a exportar (todas por defecto)")
+    parser.add_argument("--formato", choices=["parquet", "arrow"], default="parquet")
+    parser.add_argument("--completo", action="store_true", help="Reexporta todo ignorando la marca de agua")
+    args = parser.parse_args()
+
+    payload = {"tablas": args.tablas, "formato": args.formato, "completo": args.completo}
+    try:
+        print("Solicitando exportación al backend...")
+        response = requests.post(API_URL, json=payload, timeout=3600)
+    except requests.exceptions.ConnectionError:
+        print("[ERROR] No se pudo conectar al servidor. Asegúrate de que los contenedores Docker estén corriendo (puerto 8000).")
+        return
+
+    if response.status_code != 200:
+        print(f"[ERROR] {response.status_code}: {response.text}")
+        return
+
+    data = response.json()
+    for tabla, info in data["tablas"].items():
+        print(f"  {tabla:<14} {info['filas']:>8} filas nuevas | {len(info['archivos'])} particiones | hasta {info['hasta']}")
+    print(f"\nArchivos en {data['destino']} (dentro del contenedor; ./storage/exports en el host).")
+
+
+if __name__ == "__main__":
+    main()
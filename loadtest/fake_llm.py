@@ -0,0 +1,182 @@
+"""
+Servidor falso compatible con /v1/chat/completions de OpenAI (solo biblioteca estándar).
+Reemplaza a LM Studio en las pruebas de carga: responde Pass 1 y Pass 2 con datos
+sintéticos tras una latencia configurable y falla con la tasa de error indicada.
+
+Uso: python -m loadtest.fake_llm --puerto 1235 --latencia 2.0 --jitter 0.5 --tasa-error 0.02
+Backend: AI_API_URL=http://host.docker.internal:1235/v1 LLM_CACHE_ENABLED=false
+"""
+import re
+import json
+import time
+import random
+import argparse
+import threading
+from datetime import date
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+METADATA = """[METADATA_START]
+TITULAR: USUARIO PRUEBA DE CARGA
+CUENTA: 00-000-00000-00
+PERIODO_DESDE: {anio}-01-01
+PERIODO_HASTA: {anio}-01-31
+ATRIBUTOS: {{"origen": "loadtest"}}
+[METADATA_END]"""
+
+COMERCIOS = ("LIDER", "JUMBO", "UBER TRIP", "NETFLIX", "COPEC", "FARMACIAS AHUMADA", "ENTEL", "SANTA ISABEL")
+
+
+class FakeLLMConfig:
+    def __init__(self, latencia: float = 1.0, jitter: float = 0.0, tasa_error: float = 0.0, filas: int = 25,
+                 seed: int = None):
+        self.latencia = latencia
+        self.jitter = jitter
+        self.tasa_error = tasa_error
+        self.filas = filas
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.contadores = {"solicitudes": 0, "errores": 0, "en_curso": 0, "max_en_curso": 0}
+
+    def sample(self):
+        """(demora en segundos, falla) de la próxima respuesta."""
+        with self.lock:
+            demora = max(0.0, self.random.gauss(self.latencia, self.jitter)) if self.jitter else self.latencia
+            return demora, self.random.random() < self.tasa_error
+
+
+def _prompt_text(body) -> str:
+    partes = []
+    for message in body.get("messages", []):
+        content = message.get("content")
+        if isinstance(content, str):
+            partes.append(content)
+        elif isinstance(content, list):
+            partes.extend(c.get("text", "") for c in content if isinstance(c, dict))
+    return "\n".join(partes)
+
+
+def _table(filas: int) -> str:
+    anio = date.today().year
+    lineas = ["[TABLE_START]"]
+    for i in range(filas):
+        dia = i % 28 + 1
+        comercio = COMERCIOS[i % len(COMERCIOS)]
+        tipo = "Ingreso" if i % 10 == 9 else "Gasto"
+        lineas.append(f"{anio}-01-{dia:02d} | COMPRA {comercio} {1000 + i} | {(i * 7919) % 90000 + 1000}.00 | {tipo}")
+    lineas.append("[TABLE_END]")
+    return "\n".join(lineas)
+
+
+def respond(prompt: str, filas: int) -> str:
+    """Respuesta sintética según la pasada reconocida en el prompt."""
+    if "se cortó por longitud" in prompt:
+        return "[TABLE_END]"
+    if "TABLE_START" in prompt:
+        return _table(filas)
+    if "METADATA" in prompt or "cabecera" in prompt:
+        anio = re.search(r"\b(20\d{2})\b", prompt)
+        return METADATA.format(anio=anio.group(1) if anio else date.today().year)
+    return "ok"
+
+
+def make_handler(config: FakeLLMConfig):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send(self, status: int, payload):
+            data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path.rstrip("/").endswith("/models"):
+                self._send(200, {"object": "list", "data": [{"id": "local-model", "object": "model"}]})
+            elif self.path == "/stats":
+                with config.lock:
+                    self._send(200, dict(config.contadores))
+            else:
+                self._send(404, {"error": {"message": "No encontrado"}})
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            try:
+                body = json.loads(self.rfile.read(length) or b"{}")
+            except ValueError:
+                self._send(400, {"error": {"message": "JSON inválido"}})
+                return
+            if not self.path.rstrip("/").endswith("/chat/completions"):
+                self._send(404, {"error": {"message": "No encontrado"}})
+                return
+
+            demora, falla = config.sample()
+            with config.lock:
+                config.contadores["solicitudes"] += 1
+                config.contadores["en_curso"] += 1
+                config.contadores["max_en_curso"] = max(config.contadores["max_en_curso"], config.contadores["en_curso"])
+            try:
+                time.sleep(demora)
+                if falla:
+                    with config.lock:
+                        config.contadores["errores"] += 1
+                    self._send(503, {"error": {"message": "Error simulado por loadtest", "type": "server_error"}})
+                    return
+                content = respond(_prompt_text(body), config.filas)
+                self._send(200, {
+                    "id": f"chatcmpl-loadtest-{time.monotonic_ns()}",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": body.get("model", "local-model"),
+                    "choices": [{
+                        "index": 0,
+                        "message": {"role": "assistant", "content": content},
+                        "finish_reason": "stop",
+                    }],
+                    "usage": {"prompt_tokens": 0, "completion_tokens": len(content) // 4, "total_tokens": len(content) // 4},
+                })
+            finally:
+                with config.lock:
+                    config.contadores["en_curso"] -= 1
+
+    return Handler
+
+
+def serve(config: FakeLLMConfig, host: str = "0.0.0.0", port: int = 1235) -> ThreadingHTTPServer:
+    """Inicia el servidor en un hilo de fondo y lo retorna (server.shutdown() lo detiene)."""
+    server = ThreadingHTTPServer((host, port), make_handler(config))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="fake-llm", daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Servidor OpenAI falso para pruebas de carga.")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--puerto", type=int, default=1235)
+    parser.add_argument("--latencia", type=float, default=1.0, help="Segundos promedio por respuesta")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Desviación estándar de la latencia")
+    parser.add_argument("--tasa-error", type=float, default=0.0, help="Fracción de respuestas 503 (0-1)")
+    parser.add_argument("--filas", type=int, default=25, help="Transacciones por respuesta de Pass 2")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    config = FakeLLMConfig(args.latencia, args.jitter, args.tasa_error, args.filas, args.seed)
+    server = ThreadingHTTPServer((args.host, args.puerto), make_handler(config))
+    server.daemon_threads = True
+    print(f"LLM falso en http://{args.host}:{args.puerto}/v1 (latencia {args.latencia}s ± {args.jitter}s, "
+          f"error {args.tasa_error:.0%}, {args.filas} filas)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,291 @@
+"""
+Prueba de carga de POST /api/v1/files/upload: reenvía un corpus <origen>/<tipo_doc>/<archivo.pdf>
+(por defecto ingesta_masiva/) con concurrencia fija o a una tasa de llegada, y reporta
+throughput, latencias p50/p95/p99, errores por tipo, latencia de /health (bloqueos del
+event loop) y memoria residente de los workers del servidor.
+
+Ejemplos:
+  python -m loadtest.run --concurrencia 10 --total 50 --llm-falso --latencia-llm 2
+  python -m loadtest.run --tasa 0.5 --duracion 120 --salida resultados.json
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import random
+import argparse
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+import requests
+
+API_BASE = "http://localhost:8000"
+BASE_DIR = "ingesta_masiva"
+HEALTH_INTERVAL = 1.0
+
+
+def load_corpus(base_dir: str) -> List[Tuple[str, str, str]]:
+    """(ruta, origen, tipo_doc) de cada PDF del corpus."""
+    corpus = []
+    for origen in sorted(os.listdir(base_dir)):
+        origen_path = os.path.join(base_dir, origen)
+        if not os.path.isdir(origen_path):
+            continue
+        for tipo_doc in sorted(os.listdir(origen_path)):
+            tipo_path = os.path.join(origen_path, tipo_doc)
+            if not os.path.isdir(tipo_path):
+                continue
+            for archivo in sorted(os.listdir(tipo_path)):
+                if archivo.lower().endswith(".pdf"):
+                    corpus.append((os.path.join(tipo_path, archivo), origen, tipo_doc))
+    return corpus
+
+
+def percentile(valores: List[float], p: float) -> Optional[float]:
+    if not valores:
+        return None
+    orden = sorted(valores)
+    k = (len(orden) - 1) * p / 100
+    bajo = int(k)
+    alto = min(bajo + 1, len(orden) - 1)
+    return orden[bajo] + (orden[alto] - orden[bajo]) * (k - bajo)
+
+
+def _resumen_latencias(valores: List[float]) -> Dict[str, Optional[float]]:
+    return {
+        "p50": percentile(valores, 50), "p95": percentile(valores, 95), "p99": percentile(valores, 99),
+        "max": max(valores) if valores else None,
+    }
+
+
+class Results:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencias: List[float] = []
+        self.estados = Counter()
+        self.errores = Counter()
+        self.health_latencias: List[float] = []
+        self.rss: Dict[int, List[float]] = {}
+
+    def record(self, latencia: float, estado: str, error: str = None):
+        with self.lock:
+            self.latencias.append(latencia)
+            self.estados[estado] += 1
+            if error:
+                self.errores[error] += 1
+
+    def record_health(self, latencia: float, proceso: Dict[str, Any]):
+        with self.lock:
+            self.health_latencias.append(latencia)
+            if proceso and proceso.get("rss_mb") is not None:
+                self.rss.setdefault(proceso["pid"], []).append(proceso["rss_mb"])
+
+
+def _unique_content(content: bytes) -> bytes:
+    """Comentario PDF al final: cambia el hash para que el servidor no lo trate como duplicado."""
+    return content + f"\n%loadtest {uuid.uuid4().hex}\n".encode()
+
+
+def upload(session: requests.Session, api_base: str, item: Tuple[str, str, str], unicos: bool,
+           timeout: float, results: Results):
+    ruta, origen, tipo_doc = item
+    with open(ruta, "rb") as f:
+        content = f.read()
+    if unicos:
+        content = _unique_content(content)
+    inicio = time.monotonic()
+    try:
+        response = session.post(
+            f"{api_base}/api/v1/files/upload",
+            files={"file": (os.path.basename(ruta), content, "application/pdf")},
+            data={"origen": origen, "tipo_doc": tipo_doc},
+            timeout=timeout,
+        )
+        latencia = time.monotonic() - inicio
+        if response.status_code != 200:
+            results.record(latencia, "error", f"HTTP {response.status_code}")
+            return
+        estado = response.json().get("status", "desconocido")
+        error = response.json().get("error_code") if estado == "error" else None
+        results.record(latencia, estado, error)
+    except requests.Timeout:
+        results.record(time.monotonic() - inicio, "error", "timeout")
+    except requests.RequestException as e:
+        results.record(time.monotonic() - inicio, "error", type(e).__name__)
+
+
+def sample_health(api_base: str, results: Results, stop: threading.Event):
+    """Muestrea /health: su latencia crece si el event loop se bloquea; el RSS es del worker que responde."""
+    session = requests.Session()
+    while not stop.is_set():
+        inicio = time.monotonic()
+        try:
+            response = session.get(f"{api_base}/health", timeout=30)
+            results.record_health(time.monotonic() - inicio, response.json().get("proceso"))
+        except (requests.RequestException, ValueError):
+            results.record_health(time.monotonic() - inicio, None)
+        stop.wait(HEALTH_INTERVAL)
+
+
+def run_closed(args, corpus, results: Results):
+    """Concurrencia fija: cada worker envía el siguiente archivo apenas termina el anterior."""
+    contador = iter(range(args.total)) if args.total else None
+    lock = threading.Lock()
+    fin = time.monotonic() + args.duracion if args.duracion else None
+
+    def worker():
+        session = requests.Session()
+        while True:
+            with lock:
+                if fin and time.monotonic() >= fin:
+                    return
+                i = next(contador, None) if contador else 0
+            if i is None:
+                return
+            upload(session, args.api, random.choice(corpus), args.unicos, args.timeout, results)
+
+    hilos = [threading.Thread(target=worker, daemon=True) for _ in range(args.concurrencia)]
+    for h in hilos:
+        h.start()
+    for h in hilos:
+        h.join()
+
+
+def run_open(args, corpus, results: Results):
+    """Tasa de llegada (Poisson): las solicitudes se lanzan aunque las anteriores no hayan terminado."""
+    fin = time.monotonic() + args.duracion if args.duracion else None
+    enviadas = 0
+    locales = threading.local()
+
+    def tarea(item):
+        if not hasattr(locales, "session"):
+            locales.session = requests.Session()
+        upload(locales.session, args.api, item, args.unicos, args.timeout, results)
+
+    with ThreadPoolExecutor(max_workers=args.max_en_vuelo) as pool:
+        proxima = time.monotonic()
+        while (not args.total or enviadas < args.total) and (not fin or time.monotonic() < fin):
+            pool.submit(tarea, random.choice(corpus))
+            enviadas += 1
+            proxima += random.expovariate(args.tasa)
+            time.sleep(max(0.0, proxima - time.monotonic()))
+
+
+def report(results: Results, elapsed: float, llm_stats: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    total = len(results.latencias)
+    exitos = results.estados.get("success", 0)
+    return {
+        "duracion_s": round(elapsed, 2),
+        "solicitudes": total,
+        "throughput_rps": round(total / elapsed, 3) if elapsed else None,
+        "archivos_por_minuto": round(exitos / elapsed * 60, 2) if elapsed else None,
+        "estados": dict(results.estados),
+        "errores": dict(results.errores),
+        "latencia_s": _resumen_latencias(results.latencias),
+        "health_latencia_s": _resumen_latencias(results.health_latencias),
+        "rss_mb_por_worker": {
+            str(pid): {"inicial": v[0], "final": v[-1], "max": max(v)} for pid, v in sorted(results.rss.items())
+        },
+        "llm_falso": llm_stats,
+    }
+
+
+def _print_report(r: Dict[str, Any]):
+    def fmt(v):
+        return "-" if v is None else f"{v:.2f}s"
+
+    print("\n===== Resultado prueba de carga =====")
+    print(f"Duración: {r['duracion_s']}s | Solicitudes: {r['solicitudes']} | Throughput: {r['throughput_rps']} req/s "
+          f"| Archivos OK/min: {r['archivos_por_minuto']}")
+    print(f"Estados: {r['estados']}")
+    if r["errores"]:
+        print(f"Errores: {r['errores']}")
+    lat, health = r["latencia_s"], r["health_latencia_s"]
+    print(f"Latencia upload  p50 {fmt(lat['p50'])}  p95 {fmt(lat['p95'])}  p99 {fmt(lat['p99'])}  max {fmt(lat['max'])}")
+    print(f"Latencia /health p50 {fmt(health['p50'])}  p95 {fmt(health['p95'])}  p99 {fmt(health['p99'])}  max {fmt(health['max'])}")
+    for pid, rss in r["rss_mb_por_worker"].items():
+        print(f"RSS worker {pid}: {rss['inicial']} → {rss['final']} MB (máx {rss['max']} MB)")
+    if r["llm_falso"]:
+        print(f"LLM falso: {r['llm_falso']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prueba de carga del endpoint de carga de archivos.")
+    parser.add_argument("--api", default=API_BASE, help="URL base del backend")
+    parser.add_argument("--corpus", default=BASE_DIR, help="Directorio <origen>/<tipo_doc>/<archivo.pdf>")
+    modo = parser.add_mutually_exclusive_group()
+    modo.add_argument("--concurrencia", type=int, default=5, help="Solicitudes simultáneas (modo cerrado)")
+    modo.add_argument("--tasa", type=float, default=None, help="Llegadas por segundo (modo abierto, Poisson)")
+    parser.add_argument("--max-en-vuelo", type=int, default=64, help="Tope de solicitudes abiertas en modo --tasa")
+    parser.add_argument("--total", type=int, default=None, help="Solicitudes a enviar")
+    parser.add_argument("--duracion", type=float, default=None, help="Segundos de prueba")
+    parser.add_argument("--timeout", type=float, default=900, help="Timeout por solicitud en segundos")
+    parser.add_argument("--repetir", dest="unicos", action="store_false",
+                        help="Reenvía los archivos tal cual (el servidor los detecta como duplicados)")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--salida", default=None, help="Guarda el reporte en JSON")
+    llm = parser.add_argument_group("LLM falso (el backend debe apuntar a él con AI_API_URL)")
+    llm.add_argument("--llm-falso", action="store_true", help="Levanta loadtest.fake_llm en este proceso")
+    llm.add_argument("--puerto-llm", type=int, default=1235)
+    llm.add_argument("--latencia-llm", type=float, default=1.0)
+    llm.add_argument("--jitter-llm", type=float, default=0.0)
+    llm.add_argument("--tasa-error-llm", type=float, default=0.0)
+    llm.add_argument("--filas-llm", type=int, default=25)
+    args = parser.parse_args()
+
+    if not args.total and not args.duracion:
+        args.total = args.concurrencia * 4 if args.tasa is None else 20
+    random.seed(args.seed)
+    if not os.path.isdir(args.corpus):
+        sys.exit(f"No existe el corpus '{args.corpus}' (estructura <origen>/<tipo_doc>/<archivo.pdf>).")
+    corpus = load_corpus(args.corpus)
+    if not corpus:
+        sys.exit(f"El corpus '{args.corpus}' no tiene PDFs.")
+
+    llm_server = llm_config = None
+    if args.llm_falso:
+        from .fake_llm import FakeLLMConfig, serve
+        llm_config = FakeLLMConfig(args.latencia_llm, args.jitter_llm, args.tasa_error_llm, args.filas_llm, args.seed)
+        llm_server = serve(llm_config, port=args.puerto_llm)
+        print(f"LLM falso escuchando en :{args.puerto_llm} (el backend necesita AI_API_URL=http://<host>:{args.puerto_llm}/v1 "
+              f"y LLM_CACHE_ENABLED=false)")
+
+    modo = f"tasa {args.tasa}/s" if args.tasa else f"concurrencia {args.concurrencia}"
+    limite = f"{args.total} solicitudes" if args.total else f"{args.duracion}s"
+    print(f"Corpus: {len(corpus)} PDFs | Modo: {modo} | Límite: {limite}")
+
+    results = Results()
+    stop = threading.Event()
+    health = threading.Thread(target=sample_health, args=(args.api, results, stop), daemon=True)
+    health.start()
+    inicio = time.monotonic()
+    try:
+        if args.tasa:
+            run_open(args, corpus, results)
+        else:
+            run_closed(args, corpus, results)
+    except KeyboardInterrupt:
+        print("Interrumpido: reportando lo completado.")
+    elapsed = time.monotonic() - inicio
+    stop.set()
+    health.join(timeout=5)
+
+    llm_stats = None
+    if llm_server:
+        with llm_config.lock:
+            llm_stats = dict(llm_config.contadores)
+        llm_server.shutdown()
+
+    resultado = report(results, elapsed, llm_stats)
+    _print_report(resultado)
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as f:
+            json.dump(resultado, f, indent=2, ensure_ascii=False)
+        print(f"Reporte guardado en {args.salida}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,20 @@
+import io
 import os
+import json
+import zipfile
+import argparse
 import requests
 
 API_URL = "http://localhost:8000/api/v1/files/upload"
+BATCH_URL = "http://localhost:8000/api/v1/files/upload/batch"
 BASE_DIR = "ingesta_masiva"
 
 def main():
+    parser = argparse.ArgumentParser(description="Ingesta masiva de ingesta_masiva/<origen>/<tipo_doc>/<archivo.pdf>.")
+    parser.add_argument("--lote", action="store_true", help="Envía todo en un solo ZIP al endpoint de carga masiva")
+    parser.add_argument("--workers", type=int, default=2, help="Archivos procesados en paralelo en el servidor (modo --lote)")
+    args = parser.parse_args()
+
     if not os.path.exists(BASE_DIR):
         print(f"Creando directorio base '{BASE_DIR}'.")
         print("Estructura requerida: ingesta_masiva/<origen>/<tipo_doc>/<archivo.pdf>")
@@ -18,6 +28,7 @@ def main():
     valid_tipos = ['Cartola_CC', 'Cartola_TC', 'Cartola_LC', 'Boleta_Supermercado', 'Otro']
 
     archivos_procesados = 0
+    pendientes = []
 
     for origen in os.listdir(BASE_DIR):
         origen_path = os.path.join(BASE_DIR, origen)
@@ -38,21 +49,79 @@ def main():
                 if not os.path.isfile(file_path): continue
                 if not file_path.lower().endswith(".pdf"): continue
 
+                if args.lote:
+                    pendientes.append((file_path, origen, tipo_doc))
+                    continue
+
                 print(f"\nProcesando: {archivo} ({origen} - {tipo_doc})")
                 if upload_file(file_path, origen, tipo_doc):
                     archivos_procesados += 1
 
+    if pendientes:
+        archivos_procesados = upload_batch(pendientes, args.workers)
+
     if archivos_procesados == 0:
         print("\nNo se encontraron archivos PDF para procesar.")
     else:
         print(f"\n¡Se procesaron {archivos_procesados} archivos exitosamente!")
 
+def upload_batch(pendientes, workers):
+    """Envía los archivos en un ZIP y muestra cada resultado NDJSON apenas llega."""
+    buffer = io.BytesIO()
+    # Los PDFs ya vienen comprimidos: ZIP_STORED evita gastar CPU en ambos extremos
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_STORED) as zf:
+        for file_path, origen, tipo_doc in pendientes:
+            zf.write(file_path, f"{origen}/{tipo_doc}/{os.path.basename(file_path)}")
+
+    print(f"\nEnviando lote de {len(pendientes)} archivos ({buffer.tell() / 1024 / 1024:.1f} MB)...")
+    rutas = {f"{o}/{t}/{os.path.basename(p)}": (p, o, t) for p, o, t in pendientes}
+    exitosos = 0
+    protegidos = []
+    try:
+        response = requests.post(
+            BATCH_URL,
+            files={"archivo_zip": ("lote.zip", buffer.getvalue(), "application/zip")},
+            data={"workers": workers},
+            stream=True,
+            timeout=(10, 600)  # Tiempo máximo entre líneas, no para el lote completo
+        )
+        if response.status_code != 200:
+            print(f"  [ERROR] {response.status_code}: {response.text}")
+            return 0
+        for line in response.iter_lines():
+            if not line:
+                continue
+            result = json.loads(line)
+            if result["status"] == "resumen":
+                print(f"\nResumen del lote: {result['por_estado']}")
+            elif result["status"] == "success":
+                exitosos += 1
+                print(f"  [EXITO] {result['archivo']}")
+            elif result["status"] == "security_error":
+                protegidos.append(result["archivo"])
+                print(f"  [CLAVE REQUERIDA] {result['archivo']}")
+            else:
+                print(f"  [{result['status'].upper()}] {result['archivo']}: {result.get('message')}")
+    except requests.exceptions.ConnectionError:
+        print("  [ERROR] No se pudo conectar al servidor. Asegúrate de que los contenedores Docker estén corriendo (puerto 8000).")
+        return exitosos
+
+    # Los protegidos sin clave en el llavero se reintentan uno a uno pidiendo la contraseña
+    for ruta in protegidos:
+        file_path, origen, tipo_doc = rutas[ruta]
+        print(f"\nProcesando: {os.path.basename(file_path)} ({origen} - {tipo_doc})")
+        if upload_file(file_path, origen, tipo_doc):
+            exitosos += 1
+    return exitosos
+
 def upload_file(file_path, origen, tipo_doc, password=None):
     with open(file_path, "rb") as f:
         files = {"file": (os.path.basename(file_path), f, "application/pdf")}
         data = {
             "origen": origen,
-            "tipo_doc": tipo_doc
+            "tipo_doc": tipo_doc,
+            # Ingesta masiva: no compite por el LLM con las cargas desde el frontend
+            "prioridad": "masiva"
         }
         if password:
             data["password"] = password
@@ -62,14 +131,17 @@ def upload_file(file_path, origen, tipo_doc, password=None):
             # Un timeout generoso porque la IA local puede demorar procesando cada página
             response = requests.post(API_URL, files=files, data=data, timeout=600) 
             
-            if response.status_code == 200:
-                print(f"  [EXITO] {response.json().get('message')}")
-                return True
-            elif response.status_code == 401 or "PASSWORD_REQUIRED" in response.text:
+            # El backend resuelve la clave con una sonda de cifrado (sin rasterizar), por lo que
+            # un error de contraseña llega en milisegundos como status 200 con error_code.
+            error_code = response.json().get("error_code") if response.status_code == 200 else None
+            if error_code in ("PasswordRequiredError", "InvalidPasswordError") or response.status_code == 401 or "PASSWORD_REQUIRED" in response.text:
                 print(f"  [CLAVE REQUERIDA] El archivo está protegido y el Llavero Local no tiene la contraseña para {origen} - {tipo_doc}.")
                 pw = input("  Ingrese la contraseña para este tipo de documento: ")
                 print("  (Se intentará nuevamente guardando la clave en el llavero...)")
                 return upload_file(file_path, origen, tipo_doc, password=pw)
+            elif response.status_code == 200:
+                print(f"  [EXITO] {response.json().get('message')}")
+                return True
             else:
                 print(f"  [ERROR] {response.status_code}: {response.text}")
                 return False
@@ -0,0 +1,61 @@
+import argparse
+import requests
+
+API_URL = "http://localhost:8000/api/v1/files/reprocess"
+MAX_WORKERS = 8  # Tope del backend (services/reprocess.py)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reprocesa archivos ya cargados desde sus originales almacenados.")
+    parser.add_argument("--ids", type=int, nargs="+", help="archivo_id a reprocesar")
+    parser.add_argument("--origen", help="Banco_Chile, Falabella, ...")
+    parser.add_argument("--tipo-doc", help="Cartola_CC, Cartola_TC, Cartola_LC, ...")
+    parser.add_argument("--desde", help="Fecha de carga inicial (AAAA-MM-DD)")
+    parser.add_argument("--hasta", help="Fecha de carga final (AAAA-MM-DD)")
+    parser.add_argument("--estado", help="Registrado, Almacenado, Rasterizado, OCR_Completado, Metadatos_Extraidos, "
+                                         "Transacciones_Extraidas, En_Staging, Completado o Error")
+    parser.add_argument("--workers", type=int, default=2, help=f"Archivos procesados en paralelo (máx. {MAX_WORKERS})")
+    parser.add_argument("--force", action="store_true", help="Ignora las respuestas IA cacheadas")
+    parser.add_argument("--dry-run", action="store_true", help="Solo lista los archivos seleccionados")
+    args = parser.parse_args()
+    if not 1 <= args.workers <= MAX_WORKERS:
+        parser.error(f"--workers debe estar entre 1 y {MAX_WORKERS}")
+
+    payload = {
+        "archivo_ids": args.ids,
+        "origen": args.origen,
+        "tipo_doc": args.tipo_doc,
+        "desde": args.desde,
+        "hasta": args.hasta,
+        "estado": args.estado,
+        "workers": args.workers,
+        "force": args.force,
+        "dry_run": args.dry_run,
+    }
+
+    try:
+        print("Enviando solicitud de reprocesamiento al backend...")
+        # Timeout amplio: el lote completo se procesa dentro de la misma solicitud
+        response = requests.post(API_URL, json=payload, timeout=6 * 3600)
+    except requests.exceptions.ConnectionError:
+        print("[ERROR] No se pudo conectar al servidor. Asegúrate de que los contenedores Docker estén corriendo (puerto 8000).")
+        return
+
+    if response.status_code != 200:
+        print(f"[ERROR] {response.status_code}: {response.text}")
+        return
+
+    data = response.json()
+    if data["status"] == "dry_run":
+        print(f"\n{data['total']} archivos seleccionados:")
+        for a in data["archivos"]:
+            print(f"  {a['archivo_id']:>5} | {a['origen']} - {a['tipo_documento']} | {a['nombre_original']}")
+        return
+
+    for r in data["resultados"]:
+        print(f"  [{r['status'].upper()}] archivo_id {r['archivo_id']}: {r.get('message')}")
+    print(f"\nResumen: {data['resumen']} (total {data['total']})")
+
+
+if __name__ == "__main__":
+    main()